@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    Streaming totals of payslip amounts by group, such as cost centre, department and tax year.
+
+        from aggregation import Aggregator
+
+        totals = Aggregator(group_by=('cost_centre', 'department', 'tax_year'))
+        for row, result in zip(rows, results):
+            totals.add(result, totals.key_for(row, result))
+        totals.write_csv(sys.stdout, rollup=True)
+
+    Each group keeps a count and a running total, minimum and maximum of each amount, and nothing else, so memory use
+    depends on the number of groups, not the number of payslips.  Amounts are kept in whole pence as integers, so the
+    totals are exact to the penny however many payslips are added, and Aggregators filled by separate workers or
+    shards can be merged in any order to give exactly the same totals as one Aggregator filled with everything.
+
+    payroll.py fills one with --summary FILE and --group-by.
+"""
+
+import csv
+import json
+from collections import namedtuple
+
+from taxation import np
+
+# The payslip amounts totalled, by default.
+AMOUNT_FIELDS = ('paye', 'employee_ni', 'employer_ni', 'student_loan', 'net_pay')
+
+# One group's figures, in pounds: total, minimum and maximum are dictionaries keyed by amount field.
+GroupSummary = namedtuple('GroupSummary', 'key count total minimum maximum')
+
+# Written in place of the label of a column a roll-up total covers every value of.
+ROLLUP_LABEL = '*'
+
+
+def _pence(amount):
+    """Return an amount in pounds, rounded to the penny as every payslip amount is, as a whole number of pence."""
+    return int(round(amount * 100))
+
+
+def format_pence(pence):
+    """Return a whole number of pence as an exact amount in pounds, e.g. 123456 as '1234.56'."""
+    sign = '-' if pence < 0 else ''
+    pounds, pence = divmod(abs(pence), 100)
+    return '{}{}.{:02d}'.format(sign, pounds, pence)
+
+
+class Aggregator(object):
+    """
+    The count of payslips and the total, minimum and maximum of each amount in pence, for each group key.
+    :param group_by : The names of the labels a group key is made of.
+    :param fields : The amounts to total, each an attribute of the payslip results added.
+    """
+
+    __slots__ = ('group_by', 'fields', 'groups')
+
+    def __init__(self, group_by=('tax_year',), fields=AMOUNT_FIELDS):
+        self.group_by = tuple(group_by)
+        self.fields = tuple(fields)
+        # key : [count, totals, minimums, maximums], each of the last three a list with an element per field.
+        self.groups = {}
+
+    def key_for(self, row, result=None):
+        """
+        Return the group key for a payroll row, a dictionary, and its result.  Each label is the result's attribute
+        of that name if it has one, as tax_year, so a blank tax year is grouped under the year it was calculated for,
+        and the row's field otherwise, or '' if the row doesn't have it.
+        """
+        return tuple(getattr(result, name) if hasattr(result, name) else row.get(name) or ''
+                     for name in self.group_by)
+
+    def add(self, result, key=None):
+        """Add one payslip result, a PayrollResult, Payslip or anything with the amount fields as attributes."""
+        if key is None:
+            key = tuple(getattr(result, name) for name in self.group_by)
+        self._add(key, 1, [_pence(getattr(result, field)) for field in self.fields], None, None)
+
+    def add_many(self, results, key=None):
+        """Add each of the results, all to the key if it is given, or each to its own key otherwise."""
+        for result in results:
+            self.add(result, key)
+
+    def add_arrays(self, key, columns):
+        """
+        Add a batch of payslips all in one group, given as numpy arrays of amounts by field, such as the columns of a
+        PeriodBatch.  The arrays are converted to pence and summed with integer arithmetic, so the totals are as exact
+        as adding the payslips one at a time.
+        """
+        pence = [np.rint(np.asarray(columns[field], dtype=float) * 100).astype(np.int64) for field in self.fields]
+        count = len(pence[0])
+        if count:
+            self._add(tuple(key), count, [int(values.sum()) for values in pence],
+                      [int(values.min()) for values in pence], [int(values.max()) for values in pence])
+
+    def _add(self, key, count, totals, minimums, maximums):
+        """Add count payslips with the amount totals, minimums and maximums given, which default to the totals."""
+        minimums = totals if minimums is None else minimums
+        maximums = totals if maximums is None else maximums
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = [count, list(totals), list(minimums), list(maximums)]
+            return
+        group[0] += count
+        group_totals, group_minimums, group_maximums = group[1:]
+        for i, total in enumerate(totals):
+            group_totals[i] += total
+            if minimums[i] < group_minimums[i]:
+                group_minimums[i] = minimums[i]
+            if maximums[i] > group_maximums[i]:
+                group_maximums[i] = maximums[i]
+
+    def merge(self, other):
+        """Add every group of another Aggregator with the same group_by and fields, e.g. from another worker."""
+        if (other.group_by, other.fields) != (self.group_by, self.fields):
+            raise ValueError('Error - Aggregators grouped by {} of {} and by {} of {} can not be merged.'.format(
+                self.group_by, self.fields, other.group_by, other.fields))
+        for key, (count, totals, minimums, maximums) in other.groups.items():
+            self._add(key, count, totals, minimums, maximums)
+        return self
+
+    def rollup(self, group_by):
+        """Return a new Aggregator of the same figures grouped by some of the labels, e.g. ('cost_centre',)."""
+        indexes = [self.group_by.index(name) for name in group_by]
+        rolled_up = Aggregator(group_by, self.fields)
+        for key, (count, totals, minimums, maximums) in self.groups.items():
+            rolled_up._add(tuple(key[i] for i in indexes), count, totals, minimums, maximums)
+        return rolled_up
+
+    def count(self):
+        return sum(group[0] for group in self.groups.values())
+
+    def summaries(self):
+        """Yield a GroupSummary, in pounds, for each group in key order."""
+        for key in sorted(self.groups, key=lambda key: tuple(map(str, key))):
+            count, totals, minimums, maximums = self.groups[key]
+            yield GroupSummary(key, count, *(dict(zip(self.fields, (pence / 100 for pence in amounts)))
+                                              for amounts in (totals, minimums, maximums)))
+
+    def write_csv(self, stream, rollup=False):
+        """
+        Write a line of CSV for each group with its count and the exact total, minimum and maximum of each amount.
+        With rollup, subtotals for each leading subset of group_by follow, down to a grand total, with ROLLUP_LABEL
+        in the columns they total over.
+        """
+        writer = csv.writer(stream, lineterminator='\r\n')
+        writer.writerow(self.group_by + ('count',) + tuple('{}_{}'.format(field, figure) for field in self.fields
+                                                          for figure in ('total', 'min', 'max')))
+        levels = [self]
+        if rollup:
+            levels += [self.rollup(self.group_by[:size]) for size in range(len(self.group_by) - 1, -1, -1)]
+        for level in levels:
+            padding = (ROLLUP_LABEL,) * (len(self.group_by) - len(level.group_by))
+            for key in sorted(level.groups, key=lambda key: tuple(map(str, key))):
+                count, totals, minimums, maximums = level.groups[key]
+                writer.writerow(key + padding + (count,) + tuple(
+                    format_pence(amounts[i]) for i in range(len(self.fields))
+                    for amounts in (totals, minimums, maximums)))
+
+    def to_dict(self):
+        """Return the state as plain values, e.g. to save as JSON and carry on with from_dict()."""
+        return {'group_by': list(self.group_by), 'fields': list(self.fields),
+                'groups': [[list(key)] + group for key, group in self.groups.items()]}
+
+    @classmethod
+    def from_dict(cls, state):
+        aggregator = cls(state['group_by'], state['fields'])
+        for key, count, totals, minimums, maximums in state['groups']:
+            aggregator.groups[tuple(key)] = [count, totals, minimums, maximums]
+        return aggregator
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
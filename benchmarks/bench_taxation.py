@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    Throughput benchmarks for the Taxation calculators.
+
+    Every calculator is timed for every tax year with rates (see available_tax_years), against salaries from each
+    tax band (including the personal allowance taper) and from a realistic payroll spread.  Results are in calls
+    per second.  PAYE, NI and Student Loans are also timed with engine='pence' (the {year}/pence/... benchmarks) and
+    with a reference calculation in Decimal arithmetic rounded the same way (the {year}/decimal/... benchmarks), and
+    the speed of the pence engine against each of the others is printed at the end.
+
+        python benchmarks/bench_taxation.py --save baseline.json
+        python benchmarks/bench_taxation.py --compare baseline.json --tolerance 0.15
+
+    With --compare, the run fails (exit status 1) if any benchmark is slower than the baseline by more than the
+    tolerance.  Baselines are only comparable on the same machine.  Each benchmark is the best of --repeat timings,
+    each of which lasts at least --min-time seconds.
+"""
+
+import argparse
+import contextlib
+from bisect import bisect_left
+from decimal import Decimal, ROUND_DOWN, ROUND_FLOOR, ROUND_HALF_DOWN
+import io
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from taxation import Taxation, available_tax_years, get_pence_schedule  # noqa: E402
+
+SAMPLE_SIZE = 1000
+MIN_TIME = 0.02  # Seconds each timing lasts at least, so that the timer's resolution and overhead can't swing it.
+PENNY = Decimal('0.01')
+
+# The calculators timed with each engine, and the Decimal reference.
+ENGINE_CALCULATORS = ('calculate_paye', 'calculate_employee_ni', 'calculate_employer_ni', 'calculate_student_loans')
+
+
+class DecimalSchedule(object):
+    """
+    A tax schedule in Decimal pounds, converted exactly from the pence engine's integers, so it gives the same answers
+    as the pence engine by plain decimal arithmetic.  Only used as a reference to time the pence engine against.
+    """
+
+    def __init__(self, pence_schedule):
+        self.breakpoints = tuple(Decimal(b).scaleb(-2) for b in pence_schedule.breakpoints)
+        self.cumulative = tuple(Decimal(c).scaleb(-6) for c in pence_schedule.cumulative)
+        self.rates = tuple(Decimal(r).scaleb(-4) for r in pence_schedule.rates)
+        self.taper_rates = tuple(Decimal(r).scaleb(-4) for r in pence_schedule.taper_rates)
+        self.taper_start = None
+        if pence_schedule.taper_start is not None:
+            self.taper_start = Decimal(pence_schedule.taper_start).scaleb(-2)
+        self.taper_limit = Decimal(pence_schedule.taper_limit).scaleb(-2)
+
+    def __call__(self, amount):
+        i = bisect_left(self.breakpoints, amount, 1) - 1
+        tax = self.cumulative[i] + (amount - self.breakpoints[i]) * self.rates[i]
+        if self.taper_start is not None and amount > self.taper_start:
+            # The allowance goes down by £1 for every whole £2 over the taper start.
+            lost = ((amount - self.taper_start) / 2).to_integral_value(ROUND_FLOOR)
+            tax += self.taper_rates[i] * min(lost, self.taper_limit)
+        return tax
+
+
+def decimal_calculators(tax_year):
+    """
+    Return a dictionary of calculator name to a function of an annual salary returning the monthly amount in Decimal,
+    rounded as the pence engine rounds: PAYE down to the penny, NI half down and Student Loans down to the pound.
+    """
+    pence_schedule = get_pence_schedule(tax_year)
+    paye = DecimalSchedule(pence_schedule.paye_schedule)
+    employee_ni = DecimalSchedule(pence_schedule.employee_ni_schedule)
+    employer_ni = DecimalSchedule(pence_schedule.employer_ni_schedule)
+    student_loans = {plan: DecimalSchedule(sl) for plan, sl in pence_schedule.student_loans.items()}
+
+    def student_loan(salary, plan):
+        if not plan:
+            return Decimal(0)
+        repayment = student_loans[plan](Decimal(str(salary))).to_integral_value(ROUND_FLOOR)
+        return (repayment / 12).quantize(PENNY, ROUND_DOWN)
+
+    return {
+        'calculate_paye': lambda salary: (paye(Decimal(str(salary))) / 12).quantize(PENNY, ROUND_DOWN),
+        'calculate_employee_ni': lambda salary: (employee_ni(Decimal(str(salary))) / 12).quantize(PENNY,
+                                                                                                   ROUND_HALF_DOWN),
+        'calculate_employer_ni': lambda salary: (employer_ni(Decimal(str(salary))) / 12).quantize(PENNY,
+                                                                                                   ROUND_HALF_DOWN),
+        'calculate_student_loans': student_loan,
+    }
+
+
+def salary_distributions(tax_table, sample_size=SAMPLE_SIZE, seed=2016):
+    """Return a dictionary of named lists of salaries, one list landing in each band, plus a payroll spread."""
+    rng = random.Random(seed)
+
+    def uniform(low, high):
+        return [round(rng.uniform(low, high), 2) for __ in range(sample_size)]
+
+    reduction_point = tax_table['personal_allowance_reduction_point']
+    return {
+        'personal_allowance': uniform(0, tax_table['default_personal_allowance']),
+        'basic_rate': uniform(tax_table['basic_rate_threshold'], tax_table['higher_rate_threshold']),
+        'higher_rate': uniform(tax_table['higher_rate_threshold'], reduction_point),
+        'allowance_taper': uniform(reduction_point, reduction_point + 2 * tax_table['default_personal_allowance']),
+        'additional_rate': uniform(tax_table['additional_rate_threshold'], 3 * tax_table['additional_rate_threshold']),
+        # Roughly the shape of UK earnings: a median in the high twenties with a long upper tail.
+        'payroll': [round(rng.lognormvariate(10.25, 0.55), 2) for __ in range(sample_size)],
+    }
+
+
+def _calls_per_second(function, calls, repeat, min_time=MIN_TIME):
+    """
+    Time function(), which makes the given number of calls, returning the best calls per second.  Each timing runs
+    function as many times as it takes to last min_time seconds, found by doubling as timeit.Timer.autorange does.
+    """
+    timer = timeit.Timer(function)
+    loops = 1
+    seconds = timer.timeit(loops)
+    while seconds < min_time:
+        loops *= 2
+        seconds = timer.timeit(loops)
+    best = min([seconds] + timer.repeat(repeat - 1, loops)) / loops
+    return calls / best if best else float('inf')
+
+
+def run_benchmarks(sample_size=SAMPLE_SIZE, repeat=5, years=None, min_time=MIN_TIME):
+    """Run every benchmark, returning a dictionary of benchmark name to calls per second."""
+    results = {}
+    for tax_year in years or available_tax_years():
+        tax = Taxation(tax_year=tax_year)
+        pence_tax = Taxation(tax_year=tax_year, engine='pence')
+        reference = decimal_calculators(tax_year)
+        results['{}/Taxation()'.format(tax_year)] = _calls_per_second(
+            lambda: [Taxation(tax_year=tax_year) for __ in range(sample_size)], sample_size, repeat, min_time)
+
+        for distribution, salaries in sorted(salary_distributions(tax.tax_table, sample_size).items()):
+            plans = [n % 3 for n in range(len(salaries))]
+            benchmarks = {
+                'calculate_paye': lambda: [tax.calculate_paye(s) for s in salaries],
+                'calculate_employee_ni': lambda: [tax.calculate_employee_ni(s) for s in salaries],
+                'calculate_employer_ni': lambda: [tax.calculate_employer_ni(s) for s in salaries],
+                'calculate_student_loans': lambda: [tax.calculate_student_loans(s, p) for s, p in
+                                                    zip(salaries, plans)],
+            }
+            for name, function in sorted(benchmarks.items()):
+                results['{}/{}/{}'.format(tax_year, name, distribution)] = _calls_per_second(
+                    function, len(salaries), repeat, min_time)
+
+            if distribution == 'payroll':
+                def print_tickets():
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        for s, p in zip(salaries, plans):
+                            tax.print_tax_ticket(s, p)
+
+                results['{}/print_tax_ticket/{}'.format(tax_year, distribution)] = _calls_per_second(
+                    print_tickets, len(salaries), repeat, min_time)
+
+            for name in ENGINE_CALCULATORS:
+                for engine, function in (('pence', getattr(pence_tax, name)), ('decimal', reference[name])):
+                    if name == 'calculate_student_loans':
+                        calls = lambda f=function: [f(s, p) for s, p in zip(salaries, plans)]
+                    else:
+                        calls = lambda f=function: [f(s) for s in salaries]
+                    results['{}/{}/{}/{}'.format(tax_year, engine, name, distribution)] = _calls_per_second(
+                        calls, len(salaries), repeat, min_time)
+    return results
+
+
+def engine_speedups(results):
+    """
+    Return a dictionary of calculator name to (times faster than float, times faster than Decimal) for the pence
+    engine, from the total time each engine took over every tax year and distribution.
+    """
+    speedups = {}
+    for name in ENGINE_CALCULATORS:
+        seconds = {'float': 0.0, 'pence': 0.0, 'decimal': 0.0}
+        for key, calls_per_second in results.items():
+            parts = key.split('/')
+            if len(parts) == 3 and parts[1] == name:
+                seconds['float'] += 1 / calls_per_second
+            elif len(parts) == 4 and parts[2] == name:
+                seconds[parts[1]] += 1 / calls_per_second
+        if seconds['pence']:
+            speedups[name] = (seconds['float'] / seconds['pence'], seconds['decimal'] / seconds['pence'])
+    return speedups
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of (name, baseline, result) for every benchmark slower than the baseline by over the tolerance."""
+    regressions = []
+    for name, expected in sorted(baseline.items()):
+        if name in results and results[name] < expected * (1 - tolerance):
+            regressions.append((name, expected, results[name]))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Taxation calculators.')
+    parser.add_argument('--save', metavar='FILE', help='Save the results as a JSON baseline.')
+    parser.add_argument('--compare', metavar='FILE', help='Compare the results with a JSON baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Fraction of the baseline throughput that may be lost before failing.  Defaults to 0.10.')
+    parser.add_argument('--sample-size', type=int, default=SAMPLE_SIZE,
+                        help='Salaries per benchmark.  Defaults to {}.'.format(SAMPLE_SIZE))
+    parser.add_argument('--repeat', type=int, default=5, help='Timings per benchmark, the best is kept.')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME,
+                        help='Seconds each timing lasts at least.  Defaults to {}.'.format(MIN_TIME))
+    parser.add_argument('--year', action='append', dest='years', help='Only benchmark this tax year.  Repeatable.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args.sample_size, args.repeat, args.years, args.min_time)
+
+    for name, calls_per_second in sorted(results.items()):
+        print('{:<60} {:>14,.0f} calls/s'.format(name, calls_per_second))
+
+    for name, (over_float, over_decimal) in sorted(engine_speedups(results).items()):
+        print('pence engine {:<28} {:>6.2f}x float {:>6.2f}x Decimal'.format(name, over_float, over_decimal))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, expected, result in regressions:
+            print('REGRESSION {} : {:,.0f} calls/s against a baseline of {:,.0f} ({:.1%})'.format(
+                name, result, expected, result / expected - 1))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    Calculate whole columns of a pandas DataFrame or of Arrow arrays at once, rather than a row at a time with
+    DataFrame.apply.
+
+        from dataframes import calculate_dataframe
+
+        df = df.join(calculate_dataframe(df))  # adds paye, employee_ni, employer_ni, student_loan and net_pay
+
+    or, for Arrow arrays such as the columns of a table read from Parquet,
+
+        from dataframes import calculate_arrow
+
+        results = calculate_arrow(table['salary'], table['plan'], table['tax_year'])
+
+    The rows are grouped by tax year and each year's rows are calculated with the Taxation *_batch methods, so every
+    amount matches calculate_payslip for the same row.  A row with a salary that is missing, not finite or below zero,
+    a plan other than 0, 1 or 2, or a tax year with no rates gets nulls in every column rather than False.  A missing
+    plan is 0 and a missing tax year is the Taxation default, as in payroll files.
+
+    Salary columns of float64 with no nulls are read in place rather than copied, and if every row is valid and in one
+    tax year they go to the calculators as they are.  The Arrow results point straight at the numpy arrays holding
+    them, with a validity bitmap for the nulls.
+
+    numpy is needed, and pandas or pyarrow for their functions.
+"""
+
+from taxation import Taxation, _round_2dp, np
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# The columns returned, in order.
+RESULT_COLUMNS = ('paye', 'employee_ni', 'employer_ni', 'student_loan', 'net_pay')
+
+# A string Arrow can cast to a float, once trimmed.  Any other string in an Arrow column is read as missing.
+_NUMBER_PATTERN = r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$'
+
+
+def _require(module, name):
+    if np is None:
+        raise ImportError('Column calculations require numpy.  Install it with "pip install numpy".')
+    if name and module is None:
+        raise ImportError('This needs {0}.  Install it with "pip install {0}".'.format(name))
+
+
+def _calculator(tax_year, calculators):
+    """Return the Taxation instance for a tax year, None for the default year, or None if the year has no rates."""
+    if tax_year not in calculators:
+        calculator = Taxation(tax_year=tax_year) if tax_year else Taxation()
+        calculators[tax_year] = calculator if calculator.tax_table else None
+    return calculators[tax_year]
+
+
+def _calculate(salaries, plans, year_codes, tax_years, monthly):
+    """
+    Calculate every column for float arrays of salaries and plans, with NaN for missing values, where year_codes is
+    an int array of indexes into the list of tax_years, or -1 for the default year.
+    :return: A tuple of the dictionary of result arrays, with NaN for invalid rows, and a boolean array of valid rows.
+    """
+    count = len(salaries)
+    plans = np.where(np.isnan(plans), 0.0, plans)
+    with np.errstate(invalid='ignore'):
+        salary_ok = np.isfinite(salaries) & (salaries >= 0)
+    columns = {name: np.full(count, np.nan) for name in RESULT_COLUMNS}
+    valid = np.zeros(count, dtype=bool)
+    period = 12 if monthly else 1
+    calculators = {}
+
+    codes = np.unique(year_codes).tolist()
+    for code in codes:
+        tax = _calculator(tax_years[code] if code >= 0 else None, calculators)
+        if tax is None:
+            continue
+        rows = salary_ok & np.isin(plans, (0,) + tuple(tax.schedule.student_loans))
+        if len(codes) > 1:
+            rows &= year_codes == code
+        valid |= rows
+
+        if rows.all():
+            index = slice(None)  # Every row, so the salaries are used as they are.
+        else:
+            index = np.flatnonzero(rows)
+        salary = salaries[index]
+        paye = tax.calculate_paye_batch(salary, monthly)
+        employee_ni = tax.calculate_employee_ni_batch(salary, monthly)
+        student_loan = tax.calculate_student_loans_batch(salary, plans[index].astype(int), monthly)
+        columns['paye'][index] = paye
+        columns['employee_ni'][index] = employee_ni
+        columns['employer_ni'][index] = tax.calculate_employer_ni_batch(salary, monthly)
+        columns['student_loan'][index] = student_loan
+        # The same sum, in the same order, as calculate_payslip, rounded the same way.
+        columns['net_pay'][index] = _round_2dp(salary / period - paye - student_loan - employee_ni)
+    return columns, valid
+
+
+def _year_codes(tax_years, count):
+    """
+    Return (int array of codes, list of tax years) for None, one tax year for every row, or a sequence of them, in
+    which anything but a string, such as None or NaN, is the default year.
+    """
+    if tax_years is None or isinstance(tax_years, str):
+        return np.full(count, 0 if tax_years else -1), [tax_years]
+    codes = {}
+    year_codes = np.fromiter((codes.setdefault(year if isinstance(year, str) else '', len(codes))
+                              for year in tax_years), dtype=np.intp, count=count)
+    return _blanks_to_default(year_codes, list(codes))
+
+
+def _blanks_to_default(year_codes, years):
+    """Point the codes of blank tax years at the default year, -1."""
+    blank = [code for code, year in enumerate(years) if not year]
+    if blank:
+        year_codes = np.where(np.isin(year_codes, blank), -1, year_codes)
+    return year_codes, years
+
+
+def calculate_columns(salaries, plans=0, tax_years=None, monthly=True):
+    """
+    Calculate PAYE, both NI contributions, Student Loan repayments and net pay for arrays of inputs.
+    :param salaries : A numpy array, or anything numpy can turn into one, of annual salaries.  NaN is missing.
+    :param plans : A Student Loan repayment plan for every salary, or an array of plans, one per salary.
+    :param tax_years : A tax year for every salary, or a sequence of them, one per salary.  None is the default year.
+    :param monthly : Returns the monthly amounts if set to True, returns the annual amounts if set to False.
+    :return: A tuple of a dictionary of float arrays by RESULT_COLUMNS, NaN for invalid rows, and a boolean array
+    which is True for the valid rows.
+    """
+    _require(np, None)
+    salaries = np.asarray(salaries, dtype=float)
+    plans = np.broadcast_to(np.asarray(plans, dtype=float), salaries.shape)
+    year_codes, years = _year_codes(tax_years, len(salaries))
+    return _calculate(salaries, plans, year_codes, years, monthly)
+
+
+def _series_to_numpy(series):
+    """Return a Series as a float numpy array, NaN for anything missing or not a number, without copying if it can."""
+    if series.dtype == np.float64:
+        return series.to_numpy(copy=False)
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+def calculate_dataframe(frame, salary='salary', plan='plan', tax_year='tax_year', monthly=True):
+    """
+    Calculate the payroll columns for a pandas DataFrame.  The plan and tax_year columns are optional.
+    :param frame : The DataFrame.
+    :param salary, plan, tax_year : The names of the input columns.
+    :param monthly : Returns the monthly amounts if set to True, returns the annual amounts if set to False.
+    :return: A DataFrame with the same index and a nullable Float64 column for each of RESULT_COLUMNS, with <NA> for
+    invalid rows, ready to join to frame.
+    """
+    _require(pd, 'pandas')
+    count = len(frame)
+    salaries = _series_to_numpy(frame[salary])
+    if plan in frame:
+        plans = _series_to_numpy(frame[plan])
+    else:
+        plans = np.zeros(count)
+    if tax_year in frame:
+        year_codes, years = pd.factorize(frame[tax_year], use_na_sentinel=True)
+        year_codes, years = _blanks_to_default(year_codes, list(years))
+    else:
+        year_codes, years = np.full(count, -1), []
+
+    columns, valid = _calculate(salaries, plans, year_codes, years, monthly)
+    invalid = ~valid
+    return pd.DataFrame({name: pd.arrays.FloatingArray(columns[name], invalid) for name in RESULT_COLUMNS},
+                        index=frame.index)
+
+
+def _arrow_to_numpy(array):
+    """
+    Return an Arrow array or chunked array as a float numpy array, NaN for nulls and strings that aren't numbers,
+    without copying if it can.
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.chunk(0) if array.num_chunks == 1 else array.combine_chunks()
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        array = pc.utf8_trim_whitespace(array)  # Casting a string that isn't a number fails, so null those first.
+        array = pc.if_else(pc.match_substring_regex(array, _NUMBER_PATTERN), array, pa.scalar(None, array.type))
+    if array.type != pa.float64():
+        array = array.cast(pa.float64(), safe=False)
+    return array.to_numpy(zero_copy_only=array.null_count == 0, writable=False)
+
+
+def _arrow_column(values, valid, invalid_count):
+    """Wrap a float64 numpy array in an Arrow array, without copying it, with nulls where valid is False."""
+    validity = pa.py_buffer(np.packbits(valid, bitorder='little')) if invalid_count else None
+    return pa.Array.from_buffers(pa.float64(), len(values), [validity, pa.py_buffer(values)], invalid_count)
+
+
+def calculate_arrow(salaries, plans=None, tax_years=None, monthly=True):
+    """
+    Calculate the payroll columns for Arrow arrays, e.g. the columns of a pyarrow Table read from Parquet.
+    :param salaries : An Arrow array or chunked array of annual salaries.
+    :param plans : An Arrow array of Student Loan repayment plans, or None for plan 0 throughout.
+    :param tax_years : An Arrow array of tax years, a single tax year, or None for the default year throughout.
+    :param monthly : Returns the monthly amounts if set to True, returns the annual amounts if set to False.
+    :return: A pyarrow Table with a float64 column for each of RESULT_COLUMNS, with nulls for invalid rows.
+    """
+    _require(pa, 'pyarrow')
+    salary_values = _arrow_to_numpy(salaries)
+    count = len(salary_values)
+    plan_values = np.zeros(count) if plans is None else _arrow_to_numpy(plans)
+    if tax_years is None or isinstance(tax_years, str):
+        year_codes, years = _year_codes(tax_years, count)
+    else:
+        if isinstance(tax_years, pa.ChunkedArray):
+            tax_years = tax_years.combine_chunks()
+        encoded = tax_years.dictionary_encode()
+        year_codes, years = _blanks_to_default(encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False),
+                                               encoded.dictionary.to_pylist())
+
+    columns, valid = _calculate(salary_values, plan_values, year_codes, years, monthly)
+    invalid_count = count - int(np.count_nonzero(valid))
+    return pa.table({name: _arrow_column(columns[name], valid, invalid_count) for name in RESULT_COLUMNS})
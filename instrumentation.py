@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    Optional instrumentation of the Taxation calculators: calls, total time and a latency histogram per tax year and
+    method, and counts of the band each salary landed in (allowance taper, additional rate, above the UEL and so on).
+
+        import instrumentation
+
+        metrics = instrumentation.enable()
+        ...run the payroll...
+        instrumentation.disable()
+        print(metrics.to_json())
+
+    or, for a block of code, `with instrumentation.instrumented() as metrics:`.
+
+    enable() swaps timing wrappers in for the Taxation methods and disable() puts the originals back, so when
+    instrumentation is off the calculators run exactly as they would without this module, at no cost at all.
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from taxation import Taxation
+
+# The upper bounds, in seconds, of the latency histogram buckets.  The last bucket is everything slower.
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2)
+
+
+def _paye_band(tax, salary, monthly=True):
+    schedule = tax.schedule.paye
+    band = schedule.labels[schedule.band(salary)]
+    if schedule.taper_start < salary <= schedule.taper_start + 2 * schedule.taper_limit:
+        return band + ', allowance taper'
+    return band
+
+
+def _employee_ni_band(tax, salary, monthly=True):
+    return tax.schedule.employee_ni.labels[tax.schedule.employee_ni.band(salary)]
+
+
+def _employer_ni_band(tax, salary, monthly=True):
+    return tax.schedule.employer_ni.labels[tax.schedule.employer_ni.band(salary)]
+
+
+def _student_loan_band(tax, salary, plan, monthly=True):
+    if not plan:
+        return 'no plan'
+    schedule = tax.schedule.student_loans[plan]
+    return 'plan {} {}'.format(plan, schedule.labels[schedule.band(salary)])
+
+
+def _payslip_band(tax, salary, plan=0, period='monthly'):
+    return _paye_band(tax, salary)
+
+
+# The methods instrumented, each with a function which names the band its arguments land in, or None.
+INSTRUMENTED_METHODS = {
+    'set_rates_and_values': None,
+    'calculate_paye': _paye_band,
+    'calculate_employee_ni': _employee_ni_band,
+    'calculate_employer_ni': _employer_ni_band,
+    'calculate_student_loans': _student_loan_band,
+    'calculate_validated_payslip': _payslip_band,
+}
+
+
+class _MethodStats(object):
+    __slots__ = ('calls', 'seconds', 'histogram', 'bands')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.bands = {}
+
+
+class Instrumentation(object):
+    """The metrics recorded while instrumentation is enabled.  Safe to record into from many threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, tax_year, method, seconds, band=None):
+        with self._lock:
+            stats = self._stats.get((tax_year, method))
+            if stats is None:
+                stats = self._stats[tax_year, method] = _MethodStats()
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if band is not None:
+                stats.bands[band] = stats.bands.get(band, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def to_dict(self):
+        """
+        Return the metrics as {tax_year: {method: {'calls', 'seconds', 'histogram', 'bands'}}}, where histogram maps
+        each bucket's upper bound in seconds, as a string with '+Inf' last, to the calls no slower than it.
+        """
+        snapshot = {}
+        with self._lock:
+            for (tax_year, method), stats in sorted(self._stats.items()):
+                cumulative = 0
+                histogram = {}
+                for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), stats.histogram):
+                    cumulative += count
+                    histogram['+Inf' if bound == float('inf') else repr(bound)] = cumulative
+                snapshot.setdefault(tax_year, {})[method] = {
+                    'calls': stats.calls, 'seconds': stats.seconds, 'histogram': histogram,
+                    'bands': dict(sorted(stats.bands.items()))}
+        return snapshot
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix='paye'):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = ['# HELP {}_calls_total Calls to each Taxation method.'.format(prefix),
+                 '# TYPE {}_calls_total counter'.format(prefix)]
+        snapshot = self.to_dict()
+
+        def labels(tax_year, method, **extra):
+            pairs = [('tax_year', tax_year), ('method', method)] + sorted(extra.items())
+            return ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+
+        for tax_year, methods in snapshot.items():
+            for method, stats in methods.items():
+                lines.append('{}_calls_total{{{}}} {}'.format(prefix, labels(tax_year, method), stats['calls']))
+
+        lines += ['# HELP {}_call_seconds Time taken by each Taxation method.'.format(prefix),
+                  '# TYPE {}_call_seconds histogram'.format(prefix)]
+        for tax_year, methods in snapshot.items():
+            for method, stats in methods.items():
+                for bound, count in stats['histogram'].items():
+                    lines.append('{}_call_seconds_bucket{{{}}} {}'.format(prefix, labels(tax_year, method, le=bound),
+                                                                         count))
+                lines.append('{}_call_seconds_sum{{{}}} {!r}'.format(prefix, labels(tax_year, method),
+                                                                     stats['seconds']))
+                lines.append('{}_call_seconds_count{{{}}} {}'.format(prefix, labels(tax_year, method), stats['calls']))
+
+        lines += ['# HELP {}_band_hits_total Calls landing in each tax band.'.format(prefix),
+                  '# TYPE {}_band_hits_total counter'.format(prefix)]
+        for tax_year, methods in snapshot.items():
+            for method, stats in methods.items():
+                for band, count in stats['bands'].items():
+                    lines.append('{}_band_hits_total{{{}}} {}'.format(prefix, labels(tax_year, method, band=band),
+                                                                      count))
+        return '\n'.join(lines) + '\n'
+
+
+def _instrument(method, name, band_of, metrics):
+    """Return a wrapper for a Taxation method which records each call in metrics."""
+    perf_counter = time.perf_counter
+
+    if band_of is None:  # set_rates_and_values, which runs before the instance knows its year.
+        @wraps(method)
+        def wrapper(self, tax_year, *args, **kwargs):
+            started = perf_counter()
+            result = method(self, tax_year, *args, **kwargs)
+            metrics.record(tax_year, name, perf_counter() - started)
+            return result
+        return wrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        started = perf_counter()
+        result = method(self, *args, **kwargs)
+        seconds = perf_counter() - started
+        band = 'error' if result is False else band_of(self, *args, **kwargs)
+        metrics.record(self.schedule.tax_year if self.schedule else None, name, seconds, band)
+        return result
+    return wrapper
+
+
+_lock = threading.Lock()
+_originals = {}
+_enabled = None
+
+
+def enable(metrics=None):
+    """
+    Start recording calls to the Taxation methods in INSTRUMENTED_METHODS, into metrics or a new Instrumentation.
+    Every Taxation instance, existing or new, is instrumented.  Returns the Instrumentation.
+    """
+    global _enabled
+    with _lock:
+        if _enabled is not None:
+            raise RuntimeError('Instrumentation is already enabled.  Call disable() first.')
+        metrics = Instrumentation() if metrics is None else metrics
+        for name, band_of in INSTRUMENTED_METHODS.items():
+            _originals[name] = Taxation.__dict__[name]
+            setattr(Taxation, name, _instrument(_originals[name], name, band_of, metrics))
+        _enabled = metrics
+    return metrics
+
+
+def disable():
+    """Put the original Taxation methods back.  Returns the Instrumentation that was recording, or None."""
+    global _enabled
+    with _lock:
+        for name, method in _originals.items():
+            setattr(Taxation, name, method)
+        _originals.clear()
+        metrics, _enabled = _enabled, None
+    return metrics
+
+
+def is_enabled():
+    return _enabled is not None
+
+
+@contextmanager
+def instrumented(metrics=None):
+    """Instrument the Taxation methods for the duration of a with block, which is given the Instrumentation."""
+    metrics = enable(metrics)
+    try:
+        yield metrics
+    finally:
+        disable()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    Precomputed lookup tables of PAYE, employee NI, employer NI and Student Loan repayments for every whole pound
+    salary in a range, so a Taxation instance can answer those salaries with an index into a memory mapped file.
+
+        python lookup_tables.py --year 2018-2019 --max-salary 500000 -o paye-2018-2019.lut
+
+    then
+
+        from lookup_tables import open_lookup_table
+        my_tax = Taxation(tax_year='2018-2019', lookup_table=open_lookup_table('paye-2018-2019.lut'))
+
+    Salaries outside the range, or with pence, are calculated as usual.  The file is mapped read only, so every process
+    using it shares the same pages of the operating system's page cache rather than holding a copy each.
+
+    The file is a fixed size header followed by one record per salary, of a 32 bit signed integer number of pence for
+    each of the COLUMNS.  The header records the tax year, the engine the amounts were calculated with and a
+    fingerprint of the year's rates; a table is refused if the rates have changed since it was built.
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import sys
+import time
+from array import array
+
+from taxation import PAY_PERIODS, Taxation, get_tax_table, np
+
+MAGIC = b'PAYELUT1'
+
+# magic, byte order, tax year, engine, rates fingerprint, first salary, number of salaries, columns per salary.
+_HEADER = struct.Struct('<8s8s16s8s32sqqq')
+
+# The amounts for one salary, in this order.  Each field has a monthly and an annual amount.
+FIELDS = ('paye', 'employee_ni', 'employer_ni', 'student_loan_1', 'student_loan_2')
+COLUMNS = tuple((field, period) for field in FIELDS for period in ('monthly', 'annual'))
+_COLUMN_INDEX = {column: index for index, column in enumerate(COLUMNS)}
+
+_INT32_MAX = 2 ** 31 - 1
+
+
+def rates_fingerprint(tax_table):
+    """Return a SHA-256 digest of a year's rate values, which changes if any of them do."""
+    return hashlib.sha256(json.dumps(sorted(tax_table.items())).encode()).digest()
+
+
+def _column_pence(tax, salaries, field, monthly):
+    """Return the amounts in pence for one column, from the same calculations the Taxation methods use."""
+    periods = 12 if monthly else 1
+    pence_schedule = tax.pence_schedule
+    if pence_schedule:
+        if field.startswith('student_loan_'):
+            plan = int(field[-1])
+            return [pence_schedule.student_loan(100 * salary, plan, periods) for salary in salaries]
+        calculate = getattr(pence_schedule, field)
+        return [calculate(100 * salary, periods) for salary in salaries]
+
+    if np is not None:
+        if field.startswith('student_loan_'):
+            values = tax.calculate_student_loans_batch(salaries, int(field[-1]), monthly)
+        else:
+            values = getattr(tax, 'calculate_{}_batch'.format(field))(salaries, monthly)
+        return np.rint(values * 100).astype(np.int64).tolist()
+
+    if field.startswith('student_loan_'):
+        plan = int(field[-1])
+        return [int(round(tax.calculate_student_loans(salary, plan, monthly) * 100)) for salary in salaries]
+    calculate = getattr(tax, 'calculate_{}'.format(field))
+    return [int(round(calculate(salary, monthly) * 100)) for salary in salaries]
+
+
+def build_lookup_table(path, tax_year, max_salary=500000, min_salary=0, engine='float'):
+    """
+    Calculate every column for each whole pound salary from min_salary to max_salary and write them to path.
+    :return: The number of salaries written.
+    """
+    tax = Taxation(tax_year=tax_year, engine=engine)
+    if not tax.tax_table:
+        raise ValueError('Error - The tax year >>{}<< is not valid.'.format(tax_year))
+    if not 0 <= min_salary <= max_salary:
+        raise ValueError('Error - The salary range {} to {} is not valid.'.format(min_salary, max_salary))
+
+    salaries = list(range(min_salary, max_salary + 1))
+    columns = [_column_pence(tax, salaries, field, period == 'monthly') for field, period in COLUMNS]
+    if max(max(column) for column in columns) > _INT32_MAX:
+        raise ValueError('Error - The salaries up to {} are too big for a lookup table.'.format(max_salary))
+
+    records = array('i')
+    for values in zip(*columns):
+        records.extend(values)
+    if sys.byteorder != 'little':
+        records.byteswap()
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, b'little', tax_year.encode(), engine.encode(), rates_fingerprint(tax.tax_table),
+                             min_salary, len(salaries), len(COLUMNS)))
+        records.tofile(f)
+    return len(salaries)
+
+
+class LookupTable(object):
+    """A read only, memory mapped lookup table, as written by build_lookup_table."""
+
+    __slots__ = ('path', 'tax_year', 'engine', 'first', 'count', 'width', 'values', '_mmap')
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, byte_order, tax_year, engine, fingerprint, self.first, self.count, self.width = \
+                _HEADER.unpack_from(self._mmap)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('Error - The file {} is not a lookup table.'.format(path))
+
+        self.path = path
+        self.tax_year = tax_year.rstrip(b'\0').decode()
+        self.engine = engine.rstrip(b'\0').decode()
+        tax_table = get_tax_table(self.tax_year)
+        problem = None
+        if byte_order.rstrip(b'\0').decode() != sys.byteorder:
+            problem = 'was built on a machine with a different byte order'
+        elif self.width != len(COLUMNS) or len(self._mmap) != _HEADER.size + 4 * self.count * self.width:
+            problem = 'is not the size its header says'
+        elif not tax_table or rates_fingerprint(tax_table) != fingerprint:
+            problem = 'was built from different {} rates'.format(self.tax_year)
+        if problem:
+            self.close()
+            raise ValueError('Error - The lookup table {} {}.  Build it again.'.format(path, problem))
+
+        # Indexing a memoryview cast to 32 bit ints reads the mapped page directly, with no copy.
+        self.values = memoryview(self._mmap)[_HEADER.size:].cast('i')
+
+    def _row(self, salary):
+        """Return the index of the first value for a salary, or None if the salary is not in the table."""
+        if salary.__class__ is float:
+            if not salary.is_integer():
+                return None
+            salary = int(salary)
+        elif salary.__class__ is not int:
+            return None
+        row = salary - self.first
+        if 0 <= row < self.count:
+            return row * self.width
+        return None
+
+    def get(self, salary, field, period='monthly'):
+        """Return one amount in pounds for a salary, or None if the salary is not in the table."""
+        row = self._row(salary)
+        if row is None:
+            return None
+        return self.values[row + _COLUMN_INDEX[field, period]] / 100
+
+    def payslip_pence(self, salary, plan, period='monthly'):
+        """Return (paye, employee NI, employer NI, student loan) in pence for a salary, or None if it isn't there."""
+        row = self._row(salary)
+        if row is None:
+            return None
+        values = self.values
+        if PAY_PERIODS[period] == 1:
+            row += 1  # The annual amounts follow the monthly ones.
+        return values[row], values[row + 2], values[row + 4], values[row + 4 + 2 * int(plan)] if plan else 0
+
+    def close(self):
+        """Unmap the file.  Taxation instances using the table must not be used afterwards."""
+        if getattr(self, 'values', None) is not None:
+            self.values.release()
+            self.values = None
+            if _open_tables.get(self.path) is self:
+                del _open_tables[self.path]
+        self._mmap.close()
+
+
+# Tables already opened in this process, by path, so every Taxation instance shares one mapping.
+_open_tables = {}
+
+
+def open_lookup_table(path):
+    """Return the LookupTable for path, opening and checking it the first time it is asked for in this process."""
+    table = _open_tables.get(path)
+    if table is None:
+        table = _open_tables.setdefault(path, LookupTable(path))
+    return table
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build a lookup table for every whole pound salary in a range.')
+    parser.add_argument('--year', required=True, help='Tax year, e.g. 2018-2019.')
+    parser.add_argument('--min-salary', type=int, default=0, help='Lowest salary in the table.  Defaults to 0.')
+    parser.add_argument('--max-salary', type=int, default=500000,
+                        help='Highest salary in the table.  Defaults to 500000.')
+    parser.add_argument('--engine', choices=('float', 'pence'), default='float',
+                        help='The Taxation engine the table is for.  Defaults to float.')
+    parser.add_argument('-o', '--output', help='File to write.  Defaults to paye-<year>-<engine>.lut.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = args.output or 'paye-{}-{}.lut'.format(args.year, args.engine)
+    started = time.perf_counter()
+    try:
+        count = build_lookup_table(output, args.year, args.max_salary, args.min_salary, args.engine)
+    except (IOError, ValueError) as e:
+        sys.stderr.write(str(e) + '\n')
+        return 1
+    sys.stderr.write('Wrote {:,} salaries to {} in {:.2f}s\n'.format(count, output, time.perf_counter() - started))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    A small asyncio service around the Taxation calculators, speaking JSON lines over TCP, with no dependencies
+    beyond the standard library.
+
+        python paye_server.py --port 8765
+
+    Each request is one line of JSON, and each gets one line back, in the order the requests were sent on that
+    connection.
+
+        {"id": 7, "salary": 50000, "plan": 1, "tax_year": "2018-2019", "period": "monthly"}
+        {"id": 7, "payslip": {"tax_year": "2018-2019", "salary": 50000, ...}}
+
+    Only salary is needed; plan defaults to 0, tax_year to the Taxation default and period to monthly.  Invalid
+    requests get {"id": ..., "error": {"field": ..., "value": ..., "reason": ...}} instead.  {"op": "metrics"} returns
+    the server's counters and latency percentiles.
+
+    Requests from every connection are collected into micro-batches of up to --max-batch-size requests, waiting at
+    most --max-wait-ms for a batch to fill, and each batch is calculated in one pass with calculate_payslips.  At most
+    --max-queue requests wait for a batch and each connection has at most --max-in-flight requests unanswered; past
+    either limit the server stops reading, so TCP pushes back on the clients.
+
+    --load-test runs the server and a set of clients in one process and prints the metrics, e.g. for CI.
+
+        python paye_server.py --load-test 100000 --connections 50
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque, namedtuple
+
+from taxation import PAY_PERIODS, Taxation, available_tax_years
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_MAX_IN_FLIGHT = 1000
+LATENCY_SAMPLES = 100000
+
+LatencyPercentiles = namedtuple('LatencyPercentiles', 'count p50 p90 p99 max')
+
+
+class LatencyRecorder(object):
+    """Keeps the most recent request latencies, in seconds, and reports percentiles of them."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.latencies = deque(maxlen=samples)
+        self.count = 0
+
+    def add(self, seconds):
+        self.latencies.append(seconds)
+        self.count += 1
+
+    def percentiles(self):
+        """Return a LatencyPercentiles in milliseconds, over the recent latencies, with the total count."""
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return LatencyPercentiles(self.count, 0.0, 0.0, 0.0, 0.0)
+
+        def percentile(fraction):
+            return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] * 1000
+
+        return LatencyPercentiles(self.count, percentile(0.50), percentile(0.90), percentile(0.99),
+                                  latencies[-1] * 1000)
+
+
+class _Request(object):
+    __slots__ = ('fields', 'future', 'received')
+
+    def __init__(self, fields, future, received):
+        self.fields = fields
+        self.future = future
+        self.received = received
+
+
+def _error(field, value, reason):
+    return {'field': field, 'value': value, 'reason': reason}
+
+
+class MicroBatcher(object):
+    """
+    Collects payslip requests from any number of coroutines and calculates them in batches.  submit returns a future
+    for each request's response, and waits while max_queue requests are already waiting.
+    """
+
+    def __init__(self, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(max_queue)
+        self.calculators = {}
+        self.latency = LatencyRecorder()
+        self.batches = 0
+        self.batched_requests = 0
+        self.errors = 0
+
+    async def submit(self, fields):
+        """Queue one request's fields, returning a future for its response dictionary."""
+        request = _Request(fields, asyncio.get_running_loop().create_future(), time.perf_counter())
+        await self.queue.put(request)
+        return request.future
+
+    async def run(self):
+        """Take batches off the queue and calculate them, until cancelled."""
+        queue = self.queue
+        loop = asyncio.get_running_loop()
+        getter = None  # A get left waiting when the last batch timed out, which the next batch starts with.
+        batch = []
+        try:
+            while True:
+                batch = [await (getter or queue.get())]
+                getter = None
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    if not queue.empty():
+                        batch.append(queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    getter = asyncio.ensure_future(queue.get())
+                    done, __ = await asyncio.wait((getter,), timeout=timeout)
+                    if not done:
+                        break
+                    batch.append(getter.result())
+                    getter = None
+
+                try:
+                    self.calculate(batch)
+                except Exception as e:  # Answer the batch rather than leave its connections hanging.
+                    for request in batch:
+                        if not request.future.done():
+                            self._respond(request, error=_error('request', None, str(e)))
+        finally:
+            if getter is not None:
+                getter.cancel()
+            for request in batch:  # Taken off the queue, but never to be calculated now.
+                if not request.future.done():
+                    request.future.cancel()
+
+    def cancel_pending(self):
+        """Cancel the futures of the requests still waiting for a batch, e.g. when the server is closing."""
+        while not self.queue.empty():
+            self.queue.get_nowait().future.cancel()
+
+    def _calculator(self, tax_year):
+        calculator = self.calculators.get(tax_year)
+        if calculator is None:
+            if tax_year is not None and tax_year not in available_tax_years():
+                return None  # Checked first, so that no made up tax year a client sends is ever kept.
+            kwargs = {'tax_year': tax_year} if tax_year else {}
+            calculator = Taxation(**kwargs)
+            if not calculator.tax_table:
+                return None
+            self.calculators[tax_year] = calculator
+        return calculator
+
+    def calculate(self, batch):
+        """Calculate a batch of requests in one pass per tax year and pay period, and resolve their futures."""
+        groups = {}
+        for request in batch:
+            fields = request.fields
+            tax_year = fields.get('tax_year') or None
+            period = fields.get('period') or 'monthly'
+            if not isinstance(tax_year, (str, type(None))) or self._calculator(tax_year) is None:
+                self._respond(request, error=_error('tax_year', tax_year, 'is not a tax year with rates'))
+            elif not isinstance(period, str) or period not in PAY_PERIODS:
+                self._respond(request, error=_error('period', period,
+                                                    'is not one of ' + ', '.join(sorted(PAY_PERIODS))))
+            else:
+                groups.setdefault((tax_year, period), []).append(request)
+
+        for (tax_year, period), requests in groups.items():
+            errors = []
+            payslips = self.calculators[tax_year].calculate_payslips(
+                [request.fields.get('salary') for request in requests],
+                [request.fields.get('plan', 0) for request in requests], period, errors)
+            for error in errors:
+                self._respond(requests[error.row], error=_error(error.field, error.value, error.reason))
+            for request, payslip in zip(requests, payslips):
+                if payslip is not None:
+                    self._respond(request, payslip=payslip._asdict())
+
+        self.batches += 1
+        self.batched_requests += len(batch)
+
+    def _respond(self, request, **response):
+        if 'error' in response:
+            self.errors += 1
+        if 'id' in request.fields:
+            response = dict(id=request.fields['id'], **response)
+        if not request.future.done():
+            request.future.set_result(response)
+        self.latency.add(time.perf_counter() - request.received)
+
+    def metrics(self):
+        """Return the request, batch and error counts, the queue depth and the latency percentiles as a dictionary."""
+        return {'requests': self.latency.count, 'errors': self.errors, 'batches': self.batches,
+                'mean_batch_size': self.batched_requests / self.batches if self.batches else 0.0,
+                'queued': self.queue.qsize(), 'latency_ms': self.latency.percentiles()._asdict()}
+
+
+class PayeServer(object):
+    """The JSON lines TCP server.  Use start() and close() from a running event loop, or serve_forever()."""
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue=DEFAULT_MAX_QUEUE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.host = host
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self.batcher = MicroBatcher(max_batch_size, max_wait_ms, max_queue)
+        self.connections = 0
+        self._server = None
+        self._batcher_task = None
+        self._handlers = set()
+
+    async def start(self):
+        """Start listening.  With port 0 a free port is chosen, and self.port is set to it."""
+        self._batcher_task = asyncio.ensure_future(self.batcher.run())
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Stop listening, drop any open connections, cancel the requests they were waiting for and stop the batcher."""
+        self._server.close()
+        handlers = list(self._handlers)
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        self.batcher.cancel_pending()
+        self._batcher_task.cancel()
+        await asyncio.gather(self._batcher_task, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    def metrics(self):
+        return dict(self.batcher.metrics(), connections=self.connections)
+
+    async def _handle(self, reader, writer):
+        """Read requests from one connection and queue their responses, in order, for _write_responses."""
+        self.connections += 1
+        self._handlers.add(asyncio.current_task())
+        responses = asyncio.Queue()
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        writer_task = asyncio.ensure_future(self._write_responses(writer, responses, in_flight))
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await in_flight.acquire()
+                try:
+                    fields = json.loads(line)
+                except ValueError as e:
+                    fields = None
+                    reason = 'is not valid JSON ({})'.format(e)
+                else:
+                    reason = None if isinstance(fields, dict) else 'is not a JSON object'
+
+                if reason:
+                    response = loop.create_future()
+                    response.set_result({'error': _error('request', line.decode('utf-8', 'replace').strip(), reason)})
+                    self.batcher.errors += 1
+                elif fields.get('op') == 'metrics':
+                    response = loop.create_future()
+                    response.set_result(dict(self.metrics(), **({'id': fields['id']} if 'id' in fields else {})))
+                else:
+                    response = await self.batcher.submit(fields)
+                await responses.put(response)
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            # The server is closing, so the responses still to come will never be calculated.
+            writer_task.cancel()
+        finally:
+            await responses.put(None)
+            try:
+                await writer_task
+            except asyncio.CancelledError:
+                pass  # Cancelled by close(), along with the connection.
+            finally:
+                self.connections -= 1
+                self._handlers.discard(asyncio.current_task())
+
+    @staticmethod
+    async def _write_responses(writer, responses, in_flight):
+        try:
+            while True:
+                response = await responses.get()
+                if response is None:
+                    break
+                writer.write(json.dumps(await response).encode() + b'\n')
+                in_flight.release()
+                if responses.empty():
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def load_test(requests=100000, connections=50, pipeline=100, **server_options):
+    """
+    Run a PayeServer on a free local port and send it requests over several connections, each keeping up to pipeline
+    requests unanswered.  Returns the server's metrics, with the elapsed time and the requests per second.
+    """
+    server = PayeServer(port=0, **server_options)
+    await server.start()
+    years = ('2016-2017', '2017-2018', '2018-2019')
+
+    async def client(number, count):
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        sent = received = 0
+        while received < count:
+            while sent < count and sent - received < pipeline:
+                request = {'id': sent, 'salary': round(15000 + (number * 7919 + sent * 104729) % 150000, 2),
+                           'plan': sent % 3, 'tax_year': years[sent % len(years)]}
+                writer.write(json.dumps(request).encode() + b'\n')
+                sent += 1
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            if response.get('id') != received or 'payslip' not in response:
+                raise RuntimeError('Unexpected response {}'.format(response))
+            received += 1
+        writer.close()
+
+    started = time.perf_counter()
+    per_connection, extra = divmod(requests, connections)
+    await asyncio.gather(*(client(n, per_connection + (n < extra)) for n in range(connections)))
+    elapsed = time.perf_counter() - started
+    metrics = server.metrics()
+    await server.close()
+    metrics.update(seconds=elapsed, requests_per_second=requests / elapsed if elapsed else 0.0)
+    return metrics
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the Taxation calculators as JSON lines over TCP.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.  Defaults to 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help='Port to listen on.  Defaults to {}.'.format(DEFAULT_PORT))
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help='Most requests calculated in one batch.  Defaults to {}.'.format(DEFAULT_MAX_BATCH_SIZE))
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help='Longest wait for a batch to fill, in milliseconds.  Defaults to {}.'.format(
+                            DEFAULT_MAX_WAIT_MS))
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help='Most requests waiting for a batch before the server stops reading.  Defaults to {}.'.
+                        format(DEFAULT_MAX_QUEUE))
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help='Most unanswered requests per connection.  Defaults to {}.'.format(DEFAULT_MAX_IN_FLIGHT))
+    parser.add_argument('--load-test', type=int, metavar='REQUESTS',
+                        help='Instead of serving, send this many requests to a local server and print the metrics.')
+    parser.add_argument('--connections', type=int, default=50, help='Client connections for --load-test.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    options = dict(max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, max_queue=args.max_queue,
+                   max_in_flight=args.max_in_flight)
+    if args.load_test:
+        print(json.dumps(asyncio.run(load_test(args.load_test, args.connections, **options)), indent=2))
+        return 0
+
+    server = PayeServer(args.host, args.port, **options)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        sys.stderr.write('Stopped.  {}\n'.format(json.dumps(server.metrics())))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
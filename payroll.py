@@ -0,0 +1,674 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    Run the Taxation calculators over a whole payroll file.
+
+    Rows are streamed from a CSV or JSON-lines file with the columns
+
+        employee_id, salary, plan, tax_year
+
+    where salary is the annual salary, plan is the student loan repayment plan (0, 1 or 2, blank for 0) and tax_year is
+    of the form '2018-2019' (blank for the Taxation default).  Each row is written straight back out with its PAYE,
+    employee NI, employer NI, student loan repayment and net pay, so memory use stays flat however big the file is.
+
+    From the command line..
+
+        python payroll.py employees.csv -o results.csv
+
+    or from Python..
+
+        for result in calculate_rows(read_rows(open('employees.csv'))):
+            print(result.employee_id, result.net_pay)
+
+    With --workers, chunks of --chunk-size rows are calculated in a pool of processes and written back in the original
+    order, so the output is byte for byte the same as a single process run.
+
+    Normally the first invalid row stops the run.  With --errors, every row is validated before it is calculated and
+    invalid rows are written to a report of row, field, value and reason instead, while the valid rows carry on.
+
+    With --checkpoint FILE, the progress of the run is saved every --checkpoint-every rows, and if the run stops,
+    running the same command again carries on from the last checkpoint rather than from the first row.
+
+    With --summary, the amounts are also totalled by --group-by, e.g. cost_centre,department,tax_year from extra input
+    columns, exactly to the penny, and written with roll-up subtotals; see aggregation.py.
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque, namedtuple
+from itertools import islice
+
+from aggregation import Aggregator
+from lookup_tables import open_lookup_table
+from taxation import ResultCache, RowError, Taxation, plan_error, salary_error
+
+PayrollResult = namedtuple('PayrollResult', 'employee_id tax_year salary plan paye employee_ni employer_ni '
+                                            'student_loan net_pay')
+
+WorkerStats = namedtuple('WorkerStats', 'chunks rows seconds')
+
+OUTPUT_BUFFER_SIZE = 1 << 20
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_CHECKPOINT_EVERY = 100000
+
+# Changed whenever the contents of a checkpoint file change, so an old checkpoint is never carried on from.
+_CHECKPOINT_VERSION = 1
+
+
+def guess_format(path, default='csv'):
+    """Return 'jsonl' for .json / .jsonl / .ndjson file names, 'csv' for .csv and the default otherwise."""
+    if path:
+        extension = path.rsplit('.', 1)[-1].lower()
+        if extension in ('json', 'jsonl', 'ndjson'):
+            return 'jsonl'
+        if extension == 'csv':
+            return 'csv'
+    return default
+
+
+def read_rows(stream, file_format='csv'):
+    """Yield one dictionary per payroll row from an open CSV (with a header line) or JSON-lines stream."""
+    if file_format == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    elif file_format == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError('Error - The file format >>{}<< is not valid.  Use csv or jsonl.'.format(file_format))
+
+
+class RowReader(object):
+    """
+    Yields the same dictionaries as read_rows, from a payroll file opened in binary mode, keeping the byte offset just
+    past the last row read and the number of rows read, so that a run can later carry on from there.  To carry on,
+    give the offset, rows and fieldnames of an earlier reader.
+    """
+
+    def __init__(self, stream, file_format='csv', offset=None, rows=0, fieldnames=None):
+        if file_format not in ('csv', 'jsonl'):
+            raise ValueError('Error - The file format >>{}<< is not valid.  Use csv or jsonl.'.format(file_format))
+        self.stream = stream
+        self.file_format = file_format
+        self.fieldnames = fieldnames
+        self.rows = rows
+        if offset is not None:
+            stream.seek(offset)
+        self.offset = stream.tell()
+
+    def position(self):
+        return self.offset, self.rows
+
+    def __iter__(self):
+        stream = self.stream
+        # Lines are read one at a time, so the stream is never ahead of the last row given out.
+        lines = (line.decode('utf-8') for line in iter(stream.readline, b''))
+        if self.file_format == 'jsonl':
+            for line in lines:
+                if line.strip():
+                    self.offset = stream.tell()
+                    self.rows += 1
+                    yield json.loads(line)
+            return
+
+        reader = csv.reader(lines)
+        if self.fieldnames is None:
+            self.fieldnames = next(reader, [])
+            self.offset = stream.tell()
+        fieldnames = self.fieldnames
+        width = len(fieldnames)
+        for values in reader:
+            if not values:
+                continue
+            # The same dictionary csv.DictReader makes.
+            row = dict(zip(fieldnames, values))
+            if len(values) > width:
+                row[None] = values[width:]
+            elif len(values) < width:
+                for name in fieldnames[len(values):]:
+                    row[name] = None
+            self.offset = stream.tell()
+            self.rows += 1
+            yield row
+
+
+class _Calculators(dict):
+    """
+    One Taxation instance per tax year, created the first time a row for that year turns up.  lookup_tables is a list
+    of lookup table files, see lookup_tables.py; a year with one uses it.
+    """
+
+    def __init__(self, result_cache=None, lookup_tables=()):
+        super().__init__()
+        self.result_cache = result_cache
+        self.lookup_tables = lookup_tables
+
+    def __missing__(self, tax_year):
+        kwargs = {'tax_year': tax_year} if tax_year else {}
+        calculator = Taxation(result_cache=self.result_cache, **kwargs)
+        if not calculator.tax_table:
+            raise ValueError('Error - The tax year >>{}<< is not valid.'.format(tax_year))
+        for path in self.lookup_tables:
+            lookup_table = open_lookup_table(path)
+            if lookup_table.tax_year == calculator.schedule.tax_year and lookup_table.engine == 'float':
+                calculator = Taxation(result_cache=self.result_cache, lookup_table=lookup_table, **kwargs)
+        self[tax_year] = calculator
+        return calculator
+
+
+def _number(value, convert):
+    """Convert a CSV or JSON field with int or float, returning None rather than raising if it can't be."""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = convert(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if convert is int and isinstance(value, float) and number != value:
+        return None
+    return number
+
+
+def validate_row(row, row_number, calculators):
+    """
+    Check one payroll row without raising.
+    :return: A tuple of (employee_id, calculator, salary, plan) and None, or None and a RowError.
+    """
+    if not isinstance(row, dict):
+        return None, RowError(row_number, 'row', row, 'is not a dictionary of fields')
+
+    tax_year = row.get('tax_year') or None
+    calculator = calculators.get(tax_year)
+    if calculator is None:
+        try:
+            calculator = calculators[tax_year]
+        except ValueError:
+            return None, RowError(row_number, 'tax_year', tax_year, 'is not a tax year with rates')
+
+    value = row.get('salary')
+    salary = _number(value, float)
+    reason = 'is not a number' if salary is None else salary_error(salary)
+    if reason:
+        return None, RowError(row_number, 'salary', value, reason)
+
+    value = row.get('plan') or 0
+    plan = _number(value, int)
+    reason = 'is not a whole number' if plan is None else plan_error(plan, calculator.schedule)
+    if reason:
+        return None, RowError(row_number, 'plan', value, reason)
+
+    return (row.get('employee_id'), calculator, salary, plan), None
+
+
+def calculate_row(row, calculators, monthly=True):
+    """Work out the deductions for one payroll row, returning a PayrollResult."""
+    salary = float(row['salary'])
+    if not math.isfinite(salary) or salary < 0:
+        raise ValueError('Error - The salary >>{}<< is not valid.'.format(row['salary']))
+    plan = int(row.get('plan') or 0)
+    if plan not in (0, 1, 2):
+        raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< is not valid.'.format(plan))
+    payslip = calculators[row.get('tax_year') or None].calculate_validated_payslip(salary, plan,
+                                                                                   'monthly' if monthly else 'annual')
+
+    return PayrollResult(row.get('employee_id'), payslip.tax_year, salary, plan, payslip.paye, payslip.employee_ni,
+                         payslip.employer_ni, payslip.student_loan, payslip.net_pay)
+
+
+def calculate_rows(rows, monthly=True, calculators=None, start=1, result_cache=None, errors=None, lookup_tables=(),
+                   aggregator=None):
+    """
+    Generator which yields a PayrollResult for each row, one at a time.  start is the number of the first row.  If a
+    ResultCache is given, repeated salaries are looked up rather than calculated again, and whole pound salaries are
+    looked up in any of the lookup_tables files for their tax year.
+
+    Without errors, the first invalid row raises a ValueError.  If errors is given, anything with an append method
+    such as a list, each row is checked by validate_row and only valid rows reach the calculators, with no exception
+    handling; a RowError is appended to errors for every invalid row and the run carries on.
+
+    If an aggregation.Aggregator is given, each result is added to it, grouped by the labels of its row.
+    """
+    calculators = _Calculators(result_cache, lookup_tables) if calculators is None else calculators
+    if errors is None:
+        for row_number, row in enumerate(rows, start):
+            try:
+                result = calculate_row(row, calculators, monthly)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError('Error - Row {} is not valid.  {}'.format(row_number, e))
+            if aggregator is not None:
+                aggregator.add(result, aggregator.key_for(row, result))
+            yield result
+        return
+
+    period = 'monthly' if monthly else 'annual'
+    add_error = errors.append
+    for row_number, row in enumerate(rows, start):
+        inputs, error = validate_row(row, row_number, calculators)
+        if error:
+            add_error(error)
+            continue
+        employee_id, calculator, salary, plan = inputs
+        payslip = calculator.calculate_validated_payslip(salary, plan, period)
+        result = PayrollResult(employee_id, payslip.tax_year, salary, plan, payslip.paye, payslip.employee_ni,
+                               payslip.employer_ni, payslip.student_loan, payslip.net_pay)
+        if aggregator is not None:
+            aggregator.add(result, aggregator.key_for(row, result))
+        yield result
+
+
+def format_result(result, file_format='csv'):
+    """Return a PayrollResult as one line of output, including the line ending."""
+    if file_format == 'csv':
+        return '{},{},{:.2f},{},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f}\r\n'.format(
+            _csv_field(result.employee_id), result.tax_year, result.salary, result.plan, result.paye,
+            result.employee_ni, result.employer_ni, result.student_loan, result.net_pay)
+    return json.dumps(result._asdict()) + '\n'
+
+
+def _csv_field(value):
+    value = '' if value is None else str(value)
+    if any(c in value for c in ',"\r\n'):
+        value = '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def format_header(file_format='csv'):
+    return ','.join(PayrollResult._fields) + '\r\n' if file_format == 'csv' else ''
+
+
+def format_error(error):
+    """Return a RowError as one line of CSV, including the line ending."""
+    return '{},{},{},{}\r\n'.format(error.row, error.field, _csv_field(error.value), _csv_field(error.reason))
+
+
+class ErrorWriter(object):
+    """Writes each RowError appended to it straight to an open text stream as CSV, so errors never pile up."""
+
+    def __init__(self, stream, header=True):
+        self.stream = stream
+        self.count = 0
+        if header:
+            stream.write(','.join(RowError._fields) + '\r\n')
+
+    def append(self, error):
+        self.stream.write(format_error(error))
+        self.count += 1
+
+    def extend(self, errors):
+        for error in errors:
+            self.append(error)
+
+
+def write_results(results, stream, file_format='csv', header=True):
+    """Write the results to an open text stream, one line at a time.  Returns the number of rows written."""
+    count = 0
+    write = stream.write
+    if header:
+        write(format_header(file_format))
+    for result in results:
+        write(format_result(result, file_format))
+        count += 1
+    return count
+
+
+# Per process state for the worker pool, set up once by _init_worker so each worker only builds its Taxation
+# instances, and with them its rate tables, once.
+_worker = {}
+
+
+def _init_worker(monthly, output_format, cache_size, collect_errors=False, lookup_tables=(), group_by=None):
+    result_cache = ResultCache(cache_size) if cache_size else None
+    _worker.update(calculators=_Calculators(result_cache, lookup_tables), monthly=monthly, output_format=output_format,
+                   collect_errors=collect_errors, group_by=group_by)
+
+
+def _calculate_chunk(start, rows):
+    """
+    Calculate and format one chunk of rows in a worker, returning (pid, rows, seconds, formatted text, errors,
+    aggregator), where errors is a list of RowErrors if the pool is collecting them and None otherwise, and aggregator
+    is an Aggregator of the chunk's results if the pool is totalling them and None otherwise.
+    """
+    started = time.perf_counter()
+    output_format = _worker['output_format']
+    errors = [] if _worker['collect_errors'] else None
+    aggregator = Aggregator(_worker['group_by']) if _worker['group_by'] is not None else None
+    text = ''.join(format_result(result, output_format) for result in
+                   calculate_rows(rows, _worker['monthly'], _worker['calculators'], start, errors=errors,
+                                  aggregator=aggregator))
+    return os.getpid(), len(rows), time.perf_counter() - started, text, errors, aggregator
+
+
+def write_results_parallel(rows, stream, file_format='csv', monthly=True, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                           worker_stats=None, cache_size=0, errors=None, lookup_tables=(), aggregator=None,
+                           header=True, checkpoint=None, start=1):
+    """
+    Calculate the rows in a pool of worker processes and write the results to an open text stream in input order.
+    Only a couple of chunks per worker are in flight at once, so memory use stays flat.
+    :param workers : The number of processes, defaulting to the number of CPUs.
+    :param chunk_size : The number of rows sent to a worker at a time.
+    :param worker_stats : If a dictionary is given, it is filled with a WorkerStats for each worker process id.
+    :param cache_size : If not zero, each worker keeps a ResultCache of this size.
+    :param errors : If given, invalid rows are skipped and their RowErrors appended to it in input order, as for
+    calculate_rows.  Otherwise the first invalid row raises a ValueError.
+    :param lookup_tables : Lookup table files for the workers to use.  They are memory mapped, so the workers share
+    one copy of each.
+    :param aggregator : If an Aggregator is given, each worker totals its chunks in one of its own, and they are merged
+    into it.
+    :param header : Whether to write the header line first.
+    :param checkpoint : If a callable is given, rows must be a RowReader, and after each chunk is written checkpoint
+    is called with the reader's position at the end of the chunk and the number of rows written so far.
+    :param start : The number of the first row.
+    :return: The number of rows written.
+    """
+    workers = workers or os.cpu_count() or 1
+    reader = rows
+    rows = iter(rows)
+    count = 0
+    if header:
+        stream.write(format_header(file_format))
+
+    with multiprocessing.Pool(workers, _init_worker,
+                              (monthly, file_format, cache_size, errors is not None, lookup_tables,
+                               aggregator.group_by if aggregator is not None else None)) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                position = reader.position() if checkpoint is not None else None
+                pending.append((pool.apply_async(_calculate_chunk, (start, chunk)), position))
+                start += len(chunk)
+            if not pending:
+                break
+
+            result, position = pending.popleft()
+            pid, chunk_rows, seconds, text, chunk_errors, chunk_aggregator = result.get()
+            stream.write(text)
+            count += chunk_rows
+            if chunk_errors:
+                errors.extend(chunk_errors)
+                count -= len(chunk_errors)
+            if chunk_aggregator is not None:
+                aggregator.merge(chunk_aggregator)
+            if checkpoint is not None:
+                checkpoint(position, count)
+            if worker_stats is not None:
+                chunks, total_rows, total_seconds = worker_stats.get(pid, (0, 0, 0.0))
+                worker_stats[pid] = WorkerStats(chunks + 1, total_rows + chunk_rows, total_seconds + seconds)
+    return count
+
+
+def run(input_path, output_path=None, input_format=None, output_format=None, monthly=True, workers=1,
+        chunk_size=DEFAULT_CHUNK_SIZE, worker_stats=None, result_cache=None, errors=None, lookup_tables=(),
+        aggregator=None, checkpoint_path=None, checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+    """
+    Stream the payroll file at input_path through the calculators to output_path, or stdout if it is not given.
+    With more than one worker the rows are calculated by write_results_parallel.  If a ResultCache is given it is
+    used for a single process run; each worker process keeps its own cache of the same size.  If errors is given,
+    invalid rows are skipped and reported to it as RowErrors rather than stopping the run.  Whole pound salaries are
+    looked up in any of the lookup_tables files for their tax year.  If an Aggregator is given, the results are
+    totalled in it.
+
+    If checkpoint_path is given, the progress of the run is saved to it every checkpoint_every rows, see
+    run_checkpointed, and a run which finds a checkpoint there carries on from it.
+    :return: A tuple of the number of rows processed and the time taken in seconds.
+    """
+    input_format = input_format or guess_format(input_path)
+    output_format = output_format or guess_format(output_path, input_format)
+    if checkpoint_path:
+        return run_checkpointed(input_path, output_path, checkpoint_path, checkpoint_every, input_format,
+                                output_format, monthly, workers, chunk_size, worker_stats, result_cache, errors,
+                                lookup_tables, aggregator)
+
+    def write(rows, output_stream):
+        if workers == 1:
+            return write_results(calculate_rows(rows, monthly, result_cache=result_cache, errors=errors,
+                                                lookup_tables=lookup_tables, aggregator=aggregator), output_stream,
+                                 output_format)
+        return write_results_parallel(rows, output_stream, output_format, monthly, workers, chunk_size, worker_stats,
+                                      result_cache.maxsize if result_cache else 0, errors, lookup_tables, aggregator)
+
+    started = time.perf_counter()
+    with open(input_path, newline='') as input_stream:
+        rows = read_rows(input_stream, input_format)
+        if output_path:
+            with open(output_path, 'w', newline='', buffering=OUTPUT_BUFFER_SIZE) as output_stream:
+                count = write(rows, output_stream)
+        else:
+            count = write(rows, sys.stdout)
+            sys.stdout.flush()
+    return count, time.perf_counter() - started
+
+
+def _checkpoint_settings(input_path, output_path, input_format, output_format, monthly, errors, aggregator):
+    """Return what a checkpoint must match to be carried on from: the input file as it was, and the run's options."""
+    status = os.stat(input_path)
+    return {'version': _CHECKPOINT_VERSION, 'input': os.path.abspath(input_path), 'input_size': status.st_size,
+            'input_mtime_ns': status.st_mtime_ns, 'output': os.path.abspath(output_path),
+            'input_format': input_format, 'output_format': output_format, 'monthly': monthly,
+            'errors': errors is not None, 'group_by': list(aggregator.group_by) if aggregator is not None else None}
+
+
+def load_checkpoint(path, settings):
+    """
+    Return the state saved in the checkpoint file at path, or None if there isn't one.  Raises a ValueError if it was
+    saved by a run with other settings, or of an input file which has changed since.
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        raise ValueError('Error - The checkpoint {} is not valid.  Delete it to start the run again.'.format(path))
+    if state.get('settings') != settings:
+        raise ValueError('Error - The checkpoint {} is for a different run, or the input file has changed.  Delete it '
+                         'to start the run again.'.format(path))
+    return state
+
+
+def save_checkpoint(path, state):
+    """Write the state to the checkpoint file at path atomically, so it is either the old checkpoint or the new one."""
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+def _sync(stream):
+    """Flush an open text file to disk and return its length in bytes."""
+    stream.flush()
+    os.fsync(stream.fileno())
+    return stream.buffer.tell()
+
+
+def run_checkpointed(input_path, output_path, checkpoint_path, checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                     input_format=None, output_format=None, monthly=True, workers=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                     worker_stats=None, result_cache=None, errors=None, lookup_tables=(), aggregator=None):
+    """
+    Run the payroll file as run does, saving a checkpoint at least every checkpoint_every rows: the byte offset in
+    the input file, the number of rows read and written, the length of the output and errors files and the state of
+    the aggregator.  The output and errors files are flushed to disk first, and the checkpoint replaces the last one
+    atomically.
+
+    If checkpoint_path already holds a checkpoint of the same run, the output and errors files are cut back to their
+    lengths at the checkpoint and the run carries on from its offset in the input, so none of the earlier rows are
+    read or calculated again and the output is the same as a run which was never interrupted.  The checkpoint is
+    deleted once the run is complete.  With several workers, checkpoints are taken between chunks.
+    :param errors : None, or an ErrorWriter, which must be writing to a file opened for appending, so the errors
+    already reported are kept.
+    :return: A tuple of the number of rows processed, including any before the checkpoint, and the time taken in
+    seconds.
+    """
+    input_format = input_format or guess_format(input_path)
+    output_format = output_format or guess_format(output_path, input_format)
+    if not output_path:
+        raise ValueError('Error - A checkpointed run needs an output file.')
+    if errors is not None and not isinstance(errors, ErrorWriter):
+        raise ValueError('Error - A checkpointed run can only report errors to an ErrorWriter.')
+    if checkpoint_every < 1:
+        raise ValueError('Error - The checkpoint interval >>{}<< is not valid.'.format(checkpoint_every))
+
+    settings = _checkpoint_settings(input_path, output_path, input_format, output_format, monthly, errors, aggregator)
+    state = load_checkpoint(checkpoint_path, settings)
+    if state is not None and os.path.getsize(output_path) < state['output_offset']:
+        raise ValueError('Error - The output file {} is shorter than at the checkpoint {}.  Delete the checkpoint to '
+                         'start the run again.'.format(output_path, checkpoint_path))
+
+    started = time.perf_counter()
+    with open(input_path, 'rb') as input_stream, \
+            open(output_path, 'r+' if state else 'w', newline='', buffering=OUTPUT_BUFFER_SIZE) as output_stream:
+        if state is None:
+            reader = RowReader(input_stream, input_format)
+            output_stream.write(format_header(output_format))
+            state = {'settings': settings, 'rows': 0, 'count': 0}
+        else:
+            output_stream.seek(state['output_offset'])
+            output_stream.truncate()
+            if errors is not None:
+                errors.stream.flush()
+                errors.stream.seek(state['errors_offset'])
+                errors.stream.truncate()
+                errors.count = state['errors_count']
+            if aggregator is not None:
+                aggregator.merge(Aggregator.from_dict(state['aggregator']))
+            reader = RowReader(input_stream, input_format, state['offset'], state['rows'], state['fieldnames'])
+        first_count = state['count']
+
+        def checkpoint(position, count, force=False):
+            """Save a checkpoint at position, (offset, rows read), if one is due, with count rows written."""
+            offset, rows = position
+            if rows - state['rows'] < checkpoint_every and not force:
+                return
+            state.update(offset=offset, rows=rows, fieldnames=reader.fieldnames, count=first_count + count,
+                         output_offset=_sync(output_stream))
+            if errors is not None:
+                state.update(errors_offset=_sync(errors.stream), errors_count=errors.count)
+            if aggregator is not None:
+                state['aggregator'] = aggregator.to_dict()
+            save_checkpoint(checkpoint_path, state)
+
+        if 'offset' not in state:
+            checkpoint(reader.position(), 0, True)  # After the header, so a run stopped before the first is resumed.
+
+        if workers == 1:
+            def checkpointed(results):
+                # Each result has been written by the time the next one is asked for, and the reader has not yet
+                # gone past its row.
+                written = 0
+                for result in results:
+                    yield result
+                    written += 1
+                    checkpoint(reader.position(), written)
+
+            count = write_results(checkpointed(calculate_rows(reader, monthly, start=reader.rows + 1,
+                                                              result_cache=result_cache, errors=errors,
+                                                              lookup_tables=lookup_tables, aggregator=aggregator)),
+                                  output_stream, output_format, header=False)
+        else:
+            count = write_results_parallel(reader, output_stream, output_format, monthly, workers, chunk_size,
+                                           worker_stats, result_cache.maxsize if result_cache else 0, errors,
+                                           lookup_tables, aggregator, False, checkpoint, reader.rows + 1)
+
+    os.remove(checkpoint_path)
+    return first_count + count, time.perf_counter() - started
+
+
+def report(count, elapsed, stream=None):
+    stream = stream or sys.stderr
+    rate = count / elapsed if elapsed else 0.0
+    stream.write('Processed {:,} rows in {:.2f}s ({:,.0f} rows/s)\n'.format(count, elapsed, rate))
+
+
+def report_workers(worker_stats, stream=None):
+    stream = stream or sys.stderr
+    for number, (pid, stats) in enumerate(sorted(worker_stats.items()), 1):
+        rate = stats.rows / stats.seconds if stats.seconds else 0.0
+        stream.write('Worker {} (pid {}) : {:,} chunks, {:,} rows in {:.2f}s ({:,.0f} rows/s)\n'.format(
+            number, pid, stats.chunks, stats.rows, stats.seconds, rate))
+
+
+def report_cache(result_cache, stream=None):
+    stream = stream or sys.stderr
+    stats = result_cache.stats()
+    lookups = stats.hits + stats.misses
+    stream.write('Result cache : {:,} hits, {:,} misses ({:.1%} hit rate), {:,} evictions\n'.format(
+        stats.hits, stats.misses, stats.hits / lookups if lookups else 0.0, stats.evictions))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Calculate PAYE, NI and student loan deductions for a payroll file.')
+    parser.add_argument('input', help='CSV or JSON-lines file of employee_id, salary, plan, tax_year rows.')
+    parser.add_argument('-o', '--output', help='File to write the results to.  Defaults to stdout.')
+    parser.add_argument('--input-format', choices=('csv', 'jsonl'), help='Defaults to the input file extension.')
+    parser.add_argument('--output-format', choices=('csv', 'jsonl'), help='Defaults to the output file extension.')
+    parser.add_argument('--annual', action='store_true', help='Report annual rather than monthly amounts.')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of worker processes.  0 uses one per CPU.  Defaults to 1.')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Rows sent to a worker at a time.  Defaults to {}.'.format(DEFAULT_CHUNK_SIZE))
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='Cache up to this many results for repeated salaries.  Defaults to 0, no cache.')
+    parser.add_argument('--errors', metavar='FILE',
+                        help='Skip invalid rows, writing a CSV report of row, field, value and reason to this file.  '
+                             'Without it, the first invalid row stops the run.')
+    parser.add_argument('--lookup-table', action='append', default=[], metavar='FILE', dest='lookup_tables',
+                        help='Look up whole pound salaries in this table from lookup_tables.py.  Repeatable.')
+    parser.add_argument('--summary', metavar='FILE',
+                        help='Write the count and exact total, minimum and maximum of each amount by group, with '
+                             'roll-up subtotals, as CSV to this file.')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='Save the progress of the run to this file, and carry on from it if it is there.  Needs '
+                             '--output.')
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help='Rows between checkpoints.  Defaults to {}.'.format(DEFAULT_CHECKPOINT_EVERY))
+    parser.add_argument('--group-by', default='tax_year',
+                        help='Comma separated labels to group the summary by, result or input columns such as '
+                             'cost_centre,department,tax_year.  Defaults to tax_year.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    worker_stats = {}
+    result_cache = ResultCache(args.cache_size) if args.cache_size else None
+    aggregator = Aggregator(name.strip() for name in args.group_by.split(',')) if args.summary else None
+    try:
+        with contextlib.ExitStack() as stack:
+            errors = None
+            if args.errors:
+                # A run carrying on from a checkpoint appends to the errors it has already reported.
+                resuming = args.checkpoint and os.path.exists(args.checkpoint)
+                errors = ErrorWriter(stack.enter_context(open(args.errors, 'a' if resuming else 'w', newline='')),
+                                     header=not resuming)
+            count, elapsed = run(args.input, args.output, args.input_format, args.output_format, not args.annual,
+                                 args.workers or None, args.chunk_size, worker_stats, result_cache, errors,
+                                 args.lookup_tables, aggregator, args.checkpoint, args.checkpoint_every)
+            if aggregator is not None:
+                with open(args.summary, 'w', newline='') as f:
+                    aggregator.write_csv(f, rollup=True)
+    except (IOError, ValueError) as e:
+        sys.stderr.write(str(e) + '\n')
+        return 1
+    report_workers(worker_stats)
+    if result_cache and args.workers == 1:
+        report_cache(result_cache)
+    report(count, elapsed)
+    if errors is not None and errors.count:
+        sys.stderr.write('{:,} invalid rows skipped, see {}\n'.format(errors.count, args.errors))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    Render payslips in bulk, as the plain text tax tickets print_tax_ticket prints, CSV or JSON-lines.
+
+        from payslips import render_payslips
+
+        payslips = my_tax.calculate_payslips(salaries, plans)
+        with open('payslips.txt', 'w', buffering=1 << 20) as f:
+            render_payslips(payslips, f, 'text')
+
+    Each format is a template compiled once, so a payslip is a single format call, and payslips are written to the
+    stream in blocks rather than a line at a time.  render_payslip_files splits the output into one file per N
+    payslips, and both report how many payslips were written, how long it took and the rate.
+
+    From the command line, a payroll file (see payroll.py) is calculated and rendered..
+
+        python payslips.py employees.csv -o payslips-{shard:04d}.txt --shard-size 10000
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+from itertools import islice
+
+from payroll import OUTPUT_BUFFER_SIZE, _Calculators, _csv_field, guess_format, read_rows, validate_row
+from taxation import Payslip, format_tax_ticket
+
+RENDER_FORMATS = ('text', 'csv', 'jsonl')
+
+# Payslips rendered between writes to the stream.
+RENDER_BLOCK_SIZE = 1000
+
+RenderStats = namedtuple('RenderStats', 'payslips files seconds')
+
+
+def payslips_per_second(stats):
+    return stats.payslips / stats.seconds if stats.seconds else 0.0
+
+
+_CSV_HEADER = 'employee_id,' + ','.join(Payslip._fields) + '\r\n'
+_CSV_LINE = '{},{},{:.2f},{},{},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f}\r\n'.format
+_json_encode = json.JSONEncoder().encode
+
+
+def _render_text(employee_id, payslip):
+    if employee_id is None:
+        return format_tax_ticket(payslip)
+    return 'Employee {}\n'.format(employee_id) + format_tax_ticket(payslip)
+
+
+def _render_csv(employee_id, payslip):
+    return _CSV_LINE(_csv_field(employee_id), *payslip)
+
+
+def _render_jsonl(employee_id, payslip):
+    record = payslip._asdict()
+    if employee_id is not None:
+        record['employee_id'] = employee_id
+    return _json_encode(record) + '\n'
+
+
+_RENDERERS = {'text': _render_text, 'csv': _render_csv, 'jsonl': _render_jsonl}
+
+
+def _renderer(file_format):
+    if file_format not in _RENDERERS:
+        raise ValueError('Error - The payslip format >>{}<< is not valid.  Use text, csv or jsonl.'.format(file_format))
+    return _RENDERERS[file_format]
+
+
+def _pairs(payslips):
+    """Yield (employee_id, payslip) for each item, dropping the Nones calculate_payslips gives invalid rows."""
+    for item in payslips:
+        if item.__class__ is Payslip:
+            yield None, item
+        elif item and item[1]:
+            yield item
+
+
+def _write_payslips(pairs, stream, render, limit=None):
+    """Write up to limit (employee_id, payslip) pairs, in blocks of RENDER_BLOCK_SIZE, returning the number written."""
+    count = 0
+    write = stream.write
+    while limit is None or count < limit:
+        size = RENDER_BLOCK_SIZE if limit is None else min(RENDER_BLOCK_SIZE, limit - count)
+        block = [render(employee_id, payslip) for employee_id, payslip in islice(pairs, size)]
+        if block:
+            write(''.join(block))
+            count += len(block)
+        if len(block) < size:
+            break
+    return count
+
+
+def render_payslips(payslips, stream, file_format='text'):
+    """
+    Write payslips to an open text stream.
+    :param payslips : An iterable of Payslips, such as calculate_payslips returns, or of (employee_id, Payslip)
+                      pairs.  Nones are skipped.
+    :param stream : The stream to write to.  Open files with a large buffer, e.g. OUTPUT_BUFFER_SIZE.
+    :param file_format : 'text' for tax tickets, 'csv' (with a header line) or 'jsonl'.
+    :return: A RenderStats.
+    """
+    render = _renderer(file_format)
+    started = time.perf_counter()
+    if file_format == 'csv':
+        stream.write(_CSV_HEADER)
+    count = _write_payslips(_pairs(payslips), stream, render)
+    return RenderStats(count, 1, time.perf_counter() - started)
+
+
+def render_payslip_files(payslips, path, file_format='text', shard_size=None):
+    """
+    Write payslips, as render_payslips does, to files of shard_size payslips each, or all to one file if shard_size
+    is None.  Each file is opened with a buffer of OUTPUT_BUFFER_SIZE.
+    :param path : The file name, formatted with shard, the number of the file from 0, e.g. 'payslips-{shard:04d}.txt'.
+    :return: A RenderStats.
+    """
+    render = _renderer(file_format)
+    if shard_size is not None and shard_size < 1:
+        raise ValueError('Error - The shard size >>{}<< is not valid.'.format(shard_size))
+    started = time.perf_counter()
+    pairs = _pairs(payslips)
+    count = shard = 0
+    while True:
+        first = next(pairs, None)
+        if first is None and shard:
+            break
+        with open(path.format(shard=shard), 'w', newline='', buffering=OUTPUT_BUFFER_SIZE) as stream:
+            if file_format == 'csv':
+                stream.write(_CSV_HEADER)
+            if first is not None:
+                stream.write(render(*first))
+                count += 1 + _write_payslips(pairs, stream, render, None if shard_size is None else shard_size - 1)
+        shard += 1
+        if first is None or shard_size is None:
+            break
+    return RenderStats(count, shard, time.perf_counter() - started)
+
+
+def payroll_payslips(rows, monthly=True, errors=None, lookup_tables=()):
+    """
+    Generator which yields (employee_id, Payslip) for each payroll row, read by payroll.read_rows.  Invalid rows raise
+    a ValueError, or with errors are appended to it as RowErrors and skipped, as payroll.calculate_rows does.
+    """
+    calculators = _Calculators(lookup_tables=lookup_tables)
+    period = 'monthly' if monthly else 'annual'
+    for row_number, row in enumerate(rows, 1):
+        inputs, error = validate_row(row, row_number, calculators)
+        if error:
+            if errors is None:
+                raise ValueError('Error - Row {} is not valid.  The {} >>{}<< {}.'.format(*error))
+            errors.append(error)
+            continue
+        employee_id, calculator, salary, plan = inputs
+        yield employee_id, calculator.calculate_validated_payslip(salary, plan, period)
+
+
+def report(stats, stream=None):
+    stream = stream or sys.stderr
+    stream.write('Rendered {:,} payslips to {:,} files in {:.2f}s ({:,.0f} payslips/s)\n'.format(
+        stats.payslips, stats.files, stats.seconds, payslips_per_second(stats)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Calculate and render the payslips for a payroll file.')
+    parser.add_argument('input', help='CSV or JSON-lines file of employee_id, salary, plan, tax_year rows.')
+    parser.add_argument('-o', '--output',
+                        help='File to write the payslips to, with {shard} for the file number if --shard-size is '
+                             'given.  Defaults to stdout.')
+    parser.add_argument('--input-format', choices=('csv', 'jsonl'), help='Defaults to the input file extension.')
+    parser.add_argument('--format', choices=RENDER_FORMATS, default='text', dest='file_format',
+                        help='Defaults to text.')
+    parser.add_argument('--annual', action='store_true', help='Render annual rather than monthly payslips.')
+    parser.add_argument('--shard-size', type=int, help='Payslips per output file.  Defaults to one file.')
+    parser.add_argument('--lookup-table', action='append', default=[], metavar='FILE', dest='lookup_tables',
+                        help='Look up whole pound salaries in this table from lookup_tables.py.  Repeatable.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.shard_size and (not args.output or '{shard' not in args.output):
+        sys.stderr.write('Error - --shard-size needs an --output file name with {shard} in it.\n')
+        return 1
+    try:
+        with open(args.input, newline='') as input_stream:
+            rows = read_rows(input_stream, args.input_format or guess_format(args.input))
+            payslips = payroll_payslips(rows, not args.annual, lookup_tables=args.lookup_tables)
+            if args.output:
+                stats = render_payslip_files(payslips, args.output, args.file_format, args.shard_size)
+            else:
+                stats = render_payslips(payslips, sys.stdout, args.file_format)
+                sys.stdout.flush()
+    except (IOError, ValueError) as e:
+        sys.stderr.write(str(e) + '\n')
+        return 1
+    report(stats)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
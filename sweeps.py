@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+    Salary sweeps: the deductions, net pay, marginal rate and effective rate at every step of a salary range, for one
+    or more tax years, worked out in bulk with numpy.
+
+        from sweeps import sweep
+
+        for tax_year, result in sweep(100000, 130000, 1, ['2016-2017', '2018-2019']).items():
+            print(tax_year, result.marginal_rate.max())
+            for change in result.rate_changes:
+                print(change.salary, change.rate_below, change.rate_above, change.reason)
+
+    The deductions are the employee's: PAYE, employee NI and, for plan 1 or 2, Student Loan repayments, each the
+    annual amount exactly as the calculate_* methods give it.  The marginal rate is the share of the next pound that
+    goes in deductions, from the band rates, with the personal allowance taper counted at its average rate, so the
+    "60% trap" shows as 0.6 of PAYE plus 0.02 of NI.  The rate changes come straight from the band thresholds, not from
+    sampling, so they are exact whatever the step.
+
+    From the command line, a sweep is written as CSV..
+
+        python sweeps.py 100000 130000 --step 100 --year 2016-2017 --year 2018-2019 -o sweep.csv
+"""
+
+import argparse
+import math
+import sys
+from collections import namedtuple
+
+from taxation import Taxation, np
+
+# Arrays, one element per salary.  rate_changes is a list of RateChanges.
+SalarySweep = namedtuple('SalarySweep', 'tax_year plan salaries paye employee_ni student_loan tax net_pay '
+                                        'marginal_rate effective_rate rate_changes')
+
+# The marginal rate is rate_below up to and including salary, and rate_above just over it.
+RateChange = namedtuple('RateChange', 'salary rate_below rate_above reason')
+
+
+def sweep_salaries(start, stop, step=1):
+    """Return a numpy array of salaries from start to stop inclusive, step apart, each rounded to the penny."""
+    if np is None:
+        raise ImportError('Salary sweeps require numpy.  Install it with "pip install numpy".')
+    if step <= 0 or stop < start or start < 0:
+        raise ValueError('Error - The salary range {} to {} in steps of {} is not valid.'.format(start, stop, step))
+    count = int(math.floor((stop - start) / step + 1e-9)) + 1
+    return np.round(start + step * np.arange(count), 2)
+
+
+def _schedules(tax, plan):
+    """Return (schedule, label) for each schedule the employee's deductions come from."""
+    schedule = tax.schedule
+    schedules = [(schedule.paye, 'PAYE'), (schedule.employee_ni, 'employee NI')]
+    if plan:
+        schedules.append((schedule.student_loans[plan], 'Student Loan plan {}'.format(plan)))
+    return schedules
+
+
+def rate_changes(tax, plan=0, start=0, stop=float('inf')):
+    """
+    Return a RateChange for every salary from start to stop at which the total marginal rate changes, in order,
+    worked out from the band thresholds and taper of each schedule.
+    """
+    schedules = _schedules(tax, plan)
+    reasons = {}
+    for schedule, label in schedules:
+        labels = dict(zip(schedule.breakpoints[1:], schedule.labels[1:]))
+        for kink in schedule.kinks():
+            if kink == schedule.taper_start:
+                reason = '{} personal allowance taper starts'.format(label)
+            elif kink in labels:
+                reason = '{} {} starts'.format(label, labels[kink])
+            else:
+                reason = '{} personal allowance taper ends'.format(label)
+            reasons.setdefault(kink, []).append(reason)
+
+    changes = []
+    rate = sum(schedule.marginal_rate(0.0) for schedule, __ in schedules)  # The rate from zero up to the first kink.
+    for kink in sorted(reasons):
+        rate_above = sum(schedule.marginal_rate(kink) for schedule, __ in schedules)
+        if start <= kink <= stop and abs(rate_above - rate) > 1e-12:
+            changes.append(RateChange(kink, rate, rate_above, ', '.join(reasons[kink])))
+        rate = rate_above
+    return changes
+
+
+def sweep(start, stop, step=1, tax_years=None, plan=0):
+    """
+    Sweep a salary range for each tax year.
+    :param start : The first annual salary.
+    :param stop : The last annual salary, included if it is a whole number of steps from start.
+    :param step : The gap between salaries.
+    :param tax_years : The tax years to sweep, defaulting to the Taxation default year.
+    :param plan : The Student Loan repayment plan, 0, 1 or 2.
+    :return: A dictionary of SalarySweep by tax year, in the order the years were given.
+    """
+    salaries = sweep_salaries(start, stop, step)
+    results = {}
+    for tax_year in tax_years or [None]:
+        tax = Taxation(tax_year=tax_year) if tax_year else Taxation()
+        if not tax.tax_table:
+            raise ValueError('Error - The tax year >>{}<< is not valid.'.format(tax_year))
+        if plan != 0 and plan not in tax.schedule.student_loans:
+            raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< is not valid.'.
+                             format(plan))
+
+        paye = tax.calculate_paye_batch(salaries, False)
+        employee_ni = tax.calculate_employee_ni_batch(salaries, False)
+        student_loan = tax.calculate_student_loans_batch(salaries, plan, False)
+        total = paye + employee_ni + student_loan
+        marginal_rate = sum(schedule.marginal_rate_array(salaries) for schedule, __ in _schedules(tax, plan))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            effective_rate = np.where(salaries > 0, total / salaries, 0.0)
+
+        results[tax.schedule.tax_year] = SalarySweep(
+            tax.schedule.tax_year, plan, salaries, paye, employee_ni, student_loan, total, salaries - total,
+            marginal_rate, effective_rate, rate_changes(tax, plan, salaries[0], salaries[-1]))
+    return results
+
+
+def write_csv(results, stream):
+    """Write sweep results as CSV, one line per tax year and salary."""
+    stream.write('tax_year,salary,paye,employee_ni,student_loan,tax,net_pay,marginal_rate,effective_rate\r\n')
+    for result in results.values():
+        for row in zip(result.salaries.tolist(), result.paye.tolist(), result.employee_ni.tolist(),
+                       result.student_loan.tolist(), result.tax.tolist(), result.net_pay.tolist(),
+                       result.marginal_rate.tolist(), result.effective_rate.tolist()):
+            stream.write('{},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:.4f},{:.4f}\r\n'.format(result.tax_year,
+                                                                                                 *row))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep a salary range for marginal and effective rates.')
+    parser.add_argument('start', type=float, help='The first annual salary.')
+    parser.add_argument('stop', type=float, help='The last annual salary.')
+    parser.add_argument('--step', type=float, default=1.0, help='The gap between salaries.  Defaults to 1.')
+    parser.add_argument('--year', action='append', dest='years', help='Tax year to sweep.  Repeatable.')
+    parser.add_argument('--plan', type=int, default=0, help='Student Loan repayment plan.  Defaults to 0.')
+    parser.add_argument('-o', '--output', help='File to write the CSV to.  Defaults to stdout.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        results = sweep(args.start, args.stop, args.step, args.years, args.plan)
+        if args.output:
+            with open(args.output, 'w', newline='') as f:
+                write_csv(results, f)
+        else:
+            write_csv(results, sys.stdout)
+    except (IOError, ImportError, ValueError) as e:
+        sys.stderr.write(str(e) + '\n')
+        return 1
+    for result in results.values():
+        for change in result.rate_changes:
+            sys.stderr.write('{} : {:,.2f} marginal rate {:.1%} to {:.1%} ({})\n'.format(
+                result.tax_year, change.salary, change.rate_below, change.rate_above, change.reason))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -31,66 +31,973 @@
     under the sections "Class 1 National Insurance thresholds" and "Student loan recovery"
 """
 
+import itertools
+import json
+import marshal
+import math
+import numbers
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+from functools import lru_cache, wraps
+from types import MappingProxyType
+
+try:
+    import tomllib
+except ImportError:  # Python before 3.11 can only read TOML rate files if tomli is installed.
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
 __version__ = "0.1.6"
 
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the *_batch methods.
+    np = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('The batch calculations require numpy.  Install it with "pip install numpy".')
+
+
+def _as_salary_array(salaries):
+    """Convert an iterable of annual salaries to a float array, rejecting negative or non-finite values."""
+    _require_numpy()
+    salaries = np.asarray(salaries, dtype=float)
+    bad = ~np.isfinite(salaries) | (salaries < 0)
+    if bad.any():
+        raise ValueError('Error - The input value >>{}<< at position {} is not valid.  '
+                         'Salaries must be numbers of zero or more.'.format(salaries.flat[np.argmax(bad)],
+                                                                           int(np.argmax(bad))))
+    return salaries
+
+
+def _round_2dp(values):
+    """Round an array to 2 decimal places exactly as the builtin round(x, 2) does for each element.
+
+    numpy's round scales by 100 before rounding, which can land on the other side of a tie from the builtin, so
+    the handful of values that sit within a hair of a half penny are re-rounded one by one.  A 0-d input gives a
+    numpy scalar back.
+    """
+    values = np.asarray(values)
+    scaled = values * 100.0
+    rounded = np.array(np.rint(scaled) / 100.0)  # Always an array, even for 0-d input, so ties can be assigned.
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(x, 2) for x in values[near_tie].tolist()]
+    return rounded if rounded.ndim else rounded[()]
+
+
+def _round_pennies(amount):
+    """
+    Return round(amount, 2) for a float, several times faster than the builtin.  Rounding amount * 100 to a whole
+    number gives the same answer unless amount is within a hair of a half penny, when the builtin decides.
+    """
+    pennies = amount * 100.0
+    whole_pennies = round(pennies)
+    if abs(abs(pennies - whole_pennies) - 0.5) < 1e-6:
+        return round(amount, 2)
+    return whole_pennies / 100.0
+
+
+class BandSchedule(object):
+    """
+    A piecewise-linear tax schedule.  Band i runs from breakpoints[i] (exclusive) up to breakpoints[i + 1]
+    (inclusive), the first band starting at zero, and is taxed at rates[i] on the amount above starts[i], which is
+    normally the same as breakpoints[i].  The tax at any amount is the tax on the part of it in its own band plus the
+    tax on the whole of each band below, added in that order from the top band down, as the step by step calculation
+    peels the amount through the bands, so every result rounds exactly as that calculation does.
+
+    A schedule may also carry a personal allowance style taper: above taper_start the allowance falls by £1 for every
+    whole £2, down to nothing at taper_limit pounds of reduction, and the start of each band in taper_bands falls by
+    the allowance lost, so each pound of it is taxed again in the highest of those bands the amount reaches.
+    """
+
+    __slots__ = ('breakpoints', 'starts', 'rates', 'labels', 'taper_start', 'taper_limit', 'taper_shifts', 'below',
+                 'below_tax', 'tapered_tax', 'below_columns', 'cumulative', 'taper_rates')
+
+    def __init__(self, breakpoints, rates, labels, starts=None, taper_start=float('inf'), taper_limit=0.0,
+                 taper_bands=()):
+        self.breakpoints = tuple(breakpoints)
+        self.starts = tuple(starts) if starts is not None else self.breakpoints
+        self.rates = tuple(rates)
+        self.labels = tuple(labels)
+        self.taper_start = taper_start
+        self.taper_limit = taper_limit
+        self.taper_shifts = tuple(1.0 if i in taper_bands else 0.0 for i in range(len(self.rates)))
+
+        # For each band, (width, shift, rate) for each taxed band below it from the top down, where shift is how much
+        # the band widens by for each pound of allowance lost, and the tax on those bands with no taper and with the
+        # whole allowance lost.
+        shifts = self.taper_shifts
+        self.below = tuple(tuple((self.starts[k + 1] - self.starts[k], shifts[k] - shifts[k + 1], self.rates[k])
+                                 for k in range(i - 1, -1, -1) if self.rates[k]) for i in range(len(self.rates)))
+        self.below_tax = tuple(tuple(width * rate for width, __, rate in below) for below in self.below)
+        self.tapered_tax = tuple(tuple((width + taper_limit * shift) * rate for width, shift, rate in below)
+                                 for below in self.below)
+        self.below_columns = _below_columns(self, max(len(below) for below in self.below))
+
+        # The tax at the start of each band with no taper, and the rate each pound of lost allowance is taxed at.
+        self.cumulative = tuple((self.breakpoints[i] - self.starts[i]) * self.rates[i] + sum(self.below_tax[i])
+                                for i in range(len(self.rates)))
+        self.taper_rates = tuple(self.taper_shifts[i] * self.rates[i] +
+                                 sum(shift * rate for __, shift, rate in self.below[i]) for i in range(len(self.rates)))
+
+    @classmethod
+    def from_bands(cls, bands, **taper):
+        """Build a continuous schedule from (threshold, rate, label) tuples, the first threshold being zero."""
+        breakpoints, rates, labels = zip(*bands)
+        return cls(breakpoints, rates, labels, **taper)
+
+    def band(self, amount):
+        """Return the index of the band the amount falls in."""
+        return bisect_left(self.breakpoints, amount, 1) - 1
+
+    def __call__(self, amount):
+        i = bisect_left(self.breakpoints, amount, 1) - 1
+        if amount > self.taper_start:
+            reduction = int((amount - self.taper_start) / 2)
+            if reduction < self.taper_limit:
+                return self._tapered(amount, i, reduction)
+            tax = (amount - self.starts[i] + self.taper_limit * self.taper_shifts[i]) * self.rates[i]
+            below_tax = self.tapered_tax[i]
+        else:
+            tax = (amount - self.starts[i]) * self.rates[i]
+            below_tax = self.below_tax[i]
+        for band_tax in below_tax:
+            tax += band_tax
+        return tax
+
+    def _tapered(self, amount, i, reduction):
+        """Return the tax on an amount in band i with reduction pounds of allowance lost."""
+        tax = (amount - self.starts[i] + reduction * self.taper_shifts[i]) * self.rates[i]
+        for width, shift, rate in self.below[i]:
+            tax += (width + reduction * shift) * rate
+        return tax
+
+    def evaluate_array(self, amounts):
+        """Evaluate the schedule for a numpy array of amounts, with exactly the same arithmetic as a single call."""
+        i = np.maximum(np.searchsorted(self.breakpoints, amounts, side='left') - 1, 0)
+        reduction = 0.0
+        if self.taper_start != float('inf'):
+            tapered = amounts > self.taper_start
+            if tapered.any():
+                reduction = np.where(tapered, np.minimum(np.trunc((amounts - self.taper_start) / 2),
+                                                         self.taper_limit), 0.0)
+        return _evaluate_bands(self, lambda values: np.take(values, i, axis=-1), amounts, reduction)
+
+    def linear(self, amount):
+        """Evaluate the schedule with the taper falling smoothly rather than in whole pound steps."""
+        i = bisect_left(self.breakpoints, amount, 1) - 1
+        if amount > self.taper_start:
+            return self._tapered(amount, i, min((amount - self.taper_start) / 2, self.taper_limit))
+        return self._tapered(amount, i, 0.0)
+
+    def marginal_rate(self, amount):
+        """Return the rate at which tax rises just above amount, including the effect of any taper."""
+        i = max(bisect_right(self.breakpoints, amount) - 1, 0)
+        rate = self.rates[i]
+        if self.taper_start <= amount < self.taper_start + 2 * self.taper_limit:
+            rate += self.taper_rates[i] / 2
+        return rate
+
+    def marginal_rate_array(self, amounts):
+        """Return marginal_rate for a numpy array of amounts."""
+        i = np.maximum(np.searchsorted(self.breakpoints, amounts, side='right') - 1, 0)
+        rate = np.take(self.rates, i)
+        if self.taper_start != float('inf'):
+            tapered = (amounts >= self.taper_start) & (amounts < self.taper_start + 2 * self.taper_limit)
+            rate = np.where(tapered, rate + np.take(self.taper_rates, i) / 2, rate)
+        return rate
+
+    def kinks(self):
+        """Return the amounts at which the marginal rate can change: the band thresholds and the ends of any taper."""
+        kinks = set(self.breakpoints[1:])
+        if self.taper_start != float('inf'):
+            kinks.update((self.taper_start, self.taper_start + 2 * self.taper_limit))
+        return kinks
+
+
+def _below_columns(schedule, depth):
+    """
+    Return the bands below each band of a BandSchedule as depth tuples of (widths, shifts, rates), each with an element
+    per band, padded with zeros, so that they can be evaluated for many amounts at once.
+    """
+    padded = [below + ((0.0, 0.0, 0.0),) * (depth - len(below)) for below in schedule.below]
+    return tuple(tuple(tuple(below[level][j] for below in padded) for j in range(3)) for level in range(depth))
+
+
+def _evaluate_bands(schedule, take, amounts, reduction):
+    """
+    Evaluate a BandSchedule or StackedSchedule for an array of amounts with reduction pounds of allowance lost, where
+    take picks out each amount's element of an array with an element per band, with the same arithmetic as one call.
+    """
+    tax = (amounts - take(schedule.starts) + reduction * take(schedule.taper_shifts)) * take(schedule.rates)
+    for widths, shifts, rates in schedule.below_columns:
+        tax = tax + (take(widths) + reduction * take(shifts)) * take(rates)
+    return tax
+
+
+# serial is unique to each compilation, so results cached against one set of rates can never be returned for another.
+TaxYearSchedule = namedtuple('TaxYearSchedule', 'tax_year paye employee_ni employer_ni student_loans serial')
+
+_schedule_serials = itertools.count(1)
+
+# Everything on a payslip for one employee and pay period, as returned by Taxation.calculate_payslip.
+Payslip = namedtuple('Payslip', 'tax_year salary plan period gross_pay paye employee_ni employer_ni student_loan '
+                                'net_pay employer_cost')
+
+# The number of pay periods in a year, for each period calculate_payslip understands.
+PAY_PERIODS = {'annual': 1, 'monthly': 12}
+
+# The amounts for a whole payroll of one pay frequency, as returned by Taxation.calculate_period_batch.  Each amount
+# is an array with an element per employee.
+PeriodBatch = namedtuple('PeriodBatch', 'tax_year frequency pay paye employee_ni employer_ni student_loan net_pay '
+                                        'employer_cost')
+
+# One invalid input found by Taxation.validate_payslip_inputs.  row is the position of the input, field the name of the
+# bad input ('salary' or 'plan'), value the input itself and reason a short description of what is wrong with it.
+RowError = namedtuple('RowError', 'row field value reason')
+
+
+def salary_error(salary):
+    """Return the reason salary is not a valid annual salary, or None if it is.  Never raises."""
+    if isinstance(salary, bool) or not isinstance(salary, numbers.Real):
+        return 'is not a number'
+    if not math.isfinite(salary):
+        return 'is not a finite number'
+    if salary < 0:
+        return 'is less than zero'
+    return None
+
+
+def plan_error(plan, schedule):
+    """Return the reason plan is not a Student Loan repayment plan of the schedule, or None if it is."""
+    if isinstance(plan, bool) or not isinstance(plan, numbers.Integral):
+        return 'is not a whole number'
+    if plan != 0 and plan not in schedule.student_loans:
+        return 'is not 0, 1 or 2'
+    return None
+
+
+def compile_schedule(tax_table):
+    """
+    Compile one year's tax_table into a TaxYearSchedule holding a BandSchedule for PAYE, employee NI, employer NI
+    and each student loan plan (student_loans is a dictionary keyed by plan number).
+    """
+    personal_allowance = tax_table['default_personal_allowance']
+    basic_rate_threshold = tax_table['basic_rate_threshold']
+    higher_rate_threshold = tax_table['higher_rate_threshold']
+    additional_threshold = tax_table['additional_rate_threshold']
+    basic_rate = tax_table['basic_tax_rate']
+    higher_rate = tax_table['higher_tax_rate']
+    basic_band = higher_rate_threshold - basic_rate_threshold
+
+    # PAYE peels the salary through the bands from the top.  The basic rate band is taxed from the personal allowance
+    # rather than the basic rate threshold, in case they ever differ, and the allowance lost to the taper moves the
+    # basic and higher rate bands down with it.
+    paye = BandSchedule(
+        breakpoints=(0.0, basic_rate_threshold, higher_rate_threshold, additional_threshold),
+        rates=(0.0, basic_rate, higher_rate, tax_table['additional_tax_rate']),
+        labels=('personal allowance', 'basic rate', 'higher rate', 'additional rate'),
+        starts=(0.0, personal_allowance, personal_allowance + basic_band, additional_threshold),
+        taper_start=tax_table['personal_allowance_reduction_point'],
+        taper_limit=personal_allowance,
+        taper_bands=(1, 2))
+
+    employee_ni = BandSchedule.from_bands((
+        (0.0, tax_table['lel_to_pt'], 'below primary threshold'),
+        (tax_table['primary_threshold'], tax_table['pt_to_uel'], 'primary threshold to UEL'),
+        (tax_table['upper_earnings_limit'], tax_table['uel_and_above'], 'above UEL')))
+
+    employer_ni = BandSchedule.from_bands((
+        (0.0, tax_table['employer_lel_to_pt'], 'below secondary threshold'),
+        (tax_table['secondary_threshold'], tax_table['employer_pt_to_uel'], 'secondary threshold to UEL'),
+        (tax_table['upper_earnings_limit'], tax_table['employer_uel_and_above'], 'above UEL')))
+
+    student_loans = {}
+    for plan in (1, 2):
+        student_loans[plan] = BandSchedule.from_bands((
+            (0.0, 0.0, 'below repayment threshold'),
+            (tax_table['annual_repayment_threshold_plan_{}'.format(plan)], tax_table['sl_interest_rate'],
+             'above repayment threshold')))
+
+    return TaxYearSchedule(tax_table['tax-year'], paye, employee_ni, employer_ni, student_loans,
+                           next(_schedule_serials))
 
-class Taxation:
-    def __init__(self, full_time=True, student_loan_plan=None, hours_per_week=40, **kwargs):
-        # define class variables.
-        self.__version__ = __version__
-        self.full_time = full_time
-        self.tax_table_all_data = {
 
-            'tax-year': ['2016-2017', '2017-2018', '2018-2019'],
+class NetPaySchedule(object):
+    """
+    Annual net pay (gross less PAYE, employee NI and Student Loan repayments) as a piecewise-linear function of gross
+    salary, for one tax year and repayment plan.  The whole pound steps of the taper and of Student Loan repayments
+    are smoothed out, which can only understate net pay, and by less than £2.  Net pay rises in every band, so it can
+    be inverted exactly: find the band containing a net amount with a bisect, then solve one linear equation.
+    """
+
+    __slots__ = ('breakpoints', 'net_pay', 'slopes')
+
+    def __init__(self, schedule, plan):
+        components = [schedule.paye, schedule.employee_ni]
+        if plan:
+            components.append(schedule.student_loans[plan])
+
+        kinks = set()
+        for component in components:
+            kinks.update(component.kinks())
+        self.breakpoints = tuple(sorted(kinks | {0.0}))
+        self.net_pay = tuple(gross - sum(component.linear(gross) for component in components)
+                             for gross in self.breakpoints)
+        self.slopes = tuple(1.0 - sum(component.marginal_rate(gross) for component in components)
+                            for gross in self.breakpoints)
+
+    def gross(self, net_pay):
+        """Return the annual gross salary at which the smoothed annual net pay reaches net_pay."""
+        i = max(bisect_right(self.net_pay, net_pay) - 1, 0)
+        return self.breakpoints[i] + (net_pay - self.net_pay[i]) / self.slopes[i]
+
+    def gross_array(self, net_pay):
+        """Return gross for a numpy array of annual net pay."""
+        i = np.maximum(np.searchsorted(self.net_pay, net_pay, side='right') - 1, 0)
+        return np.take(self.breakpoints, i) + (net_pay - np.take(self.net_pay, i)) / np.take(self.slopes, i)
+
+
+# calculate_gross_salary checks its answer against the rounded payslip and corrects it at most this many times.
+_GROSS_UP_CORRECTIONS = 8
+
+
+def _gross_up_step(salary, annual_shortfall, net_pay_schedule):
+    """Raise a salary by enough to cover an annual net pay shortfall at the local slope, and by at least a penny."""
+    i = max(bisect_right(net_pay_schedule.breakpoints, salary) - 1, 0)
+    return salary + max(math.ceil(annual_shortfall / net_pay_schedule.slopes[i] * 100), 1) / 100
+
+
+# Net pay schedules keyed on (schedule serial, plan), built the first time they are needed.
+_net_pay_schedules = {}
+
+
+def get_net_pay_schedule(schedule, plan):
+    """Return the NetPaySchedule for a compiled TaxYearSchedule and repayment plan."""
+    key = (schedule.serial, plan)
+    net_pay_schedule = _net_pay_schedules.get(key)
+    if net_pay_schedule is None:
+        net_pay_schedule = _net_pay_schedules.setdefault(key, NetPaySchedule(schedule, plan))
+    return net_pay_schedule
+
+
+# The rates, limits and thresholds for every tax year, one column per year.  The data is read only and shared by
+# every Taxation instance; get_tax_table() and get_schedule() pick out and cache a single year.
+
+tax_table_all_data = MappingProxyType({
+
+    'tax-year': ('2016-2017', '2017-2018', '2018-2019'),
+
+    # Section from link above entitled "Tax thresholds, rates and codes"
+
+    'personal_allowance_reduction_point': (100000.00, 100000.00, 100000.00),
+    'default_personal_allowance': (11000.00, 11500.00, 11850.00),
+
+    'basic_rate_threshold': (11000.00, 11500.00, 11850.00),
+    'higher_rate_threshold': (43000.00, 45001.00, 46351.00),
+    'additional_rate_threshold': (150000.00, 150000.00, 150000.00),
+
+    'basic_tax_rate': (0.20, 0.20, 0.20),
+    'higher_tax_rate': (0.40, 0.40, 0.40),
+    'additional_tax_rate': (0.45, 0.45, 0.45),
+
+    # Section from link above entitled "Class 1 National Insurance thresholds"
+
+    'lower_earnings_limit': (5824.00, 5876.00, 6032.00),
+    'primary_threshold': (8060.00, 8164.00, 8424.00),
+    'secondary_threshold': (8112.00, 8164.00, 8424.00),
+    'upper_secondary_threshold_U21': (43000.00, 45000.00, 46350.00),
+    'apprentice_upper_secondary_threshold_U25': (43000.00, 45000.00, 46350.00),
+    'upper_earnings_limit': (43000.00, 45000.00, 46350.00),
+
+    # Section from link above entitled "Class 1 National Insurance rates"
+
+    'lel_to_pt': (0.0, 0.0, 0.0),
+    'pt_to_uel': (0.12, 0.12, 0.12),
+    'uel_and_above': (0.02, 0.02, 0.02),
+
+    # Section from link above entitled "Employer (secondary) contribution rates"
+
+    'employer_lel_to_pt': (0.0, 0.0, 0.0),
+    'employer_pt_to_uel': (0.1380, 0.1380, 0.1380),
+    'employer_uel_and_above': (0.1380, 0.1380, 0.1380),
+
+    # Section from link above entitled "Student loan recovery"
+    # https://www.gov.uk/guidance/rates-and-thresholds-for-employers-2016-to-2017#student-loan-recovery
+
+    'annual_repayment_threshold_plan_1': (17495.00, 17775.00, 18330.00),  # From tax threshold table, Plan 1.
+    'annual_repayment_threshold_plan_2': (21000.00, 21000.00, 25000.00),  # From tax threshold table, Plan 2.
+    'sl_interest_rate': (0.09, 0.09, 0.09)  # 9% for 2016-2017, 2017-2018, 2018-2019
+})
 
-            # Section from link above entitled "Tax thresholds, rates and codes"
 
-            'personal_allowance_reduction_point': [100000.00, 100000.00, 100000.00],
-            'default_personal_allowance': [11000.00, 11500.00, 11850.00],
+# Tax years after the ones above are read from one TOML or JSON file per year, named after the year, e.g.
+# tax_years/2019-2020.json, holding a value for every key of tax_table_all_data.  A file for a year above takes its
+# place.  Set the PAYE_TAX_YEARS environment variable, or call set_rate_data_directory, to read them from elsewhere.
+rate_data_directory = os.environ.get('PAYE_TAX_YEARS',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tax_years'))
 
-            'basic_rate_threshold': [11000.00, 11500.00, 11850.00],
-            'higher_rate_threshold': [43000.00, 45001.00, 46351.00],
-            'additional_rate_threshold': [150000.00, 150000.00, 150000.00],
+_TAX_YEAR_PATTERN = re.compile(r'^\d{4}-\d{4}$')
+_RATE_FILE_EXTENSIONS = ('.toml', '.json')
 
-            'basic_tax_rate': [0.20, 0.20, 0.20],
-            'higher_tax_rate': [0.40, 0.40, 0.40],
-            'additional_tax_rate': [0.45, 0.45, 0.45],
+# Bumped whenever the layout of the compiled rate files changes, so old ones are ignored.
+_COMPILED_RATES_VERSION = 1
 
-            # Section from link above entitled "Class 1 National Insurance thresholds"
 
-            'lower_earnings_limit': [5824.00, 5876.00, 6032.00],
-            'primary_threshold': [8060.00, 8164.00, 8424.00],
-            'secondary_threshold': [8112.00, 8164.00, 8424.00],
-            'upper_secondary_threshold_U21': [43000.00, 45000.00, 46350.00],
-            'apprentice_upper_secondary_threshold_U25': [43000.00, 45000.00, 46350.00],
-            'upper_earnings_limit': [43000.00, 45000.00, 46350.00],
+def set_rate_data_directory(directory):
+    """Read tax year rate files from directory from now on, forgetting any rates already read."""
+    global rate_data_directory
+    rate_data_directory = directory
+    reload_rates()
 
-            # Section from link above entitled "Class 1 National Insurance rates"
 
-            'lel_to_pt': [0.0, 0.0, 0.0],
-            'pt_to_uel': [0.12, 0.12, 0.12],
-            'uel_and_above': [0.02, 0.02, 0.02],
+def available_tax_years():
+    """Return every tax year there are rates for, built in or in the rate data directory, in order.  No file is read."""
+    tax_years = set(tax_table_all_data['tax-year'])
+    try:
+        names = os.listdir(rate_data_directory)
+    except OSError:
+        names = ()
+    for name in names:
+        tax_year, extension = os.path.splitext(name)
+        if extension in _RATE_FILE_EXTENSIONS and _TAX_YEAR_PATTERN.match(tax_year):
+            tax_years.add(tax_year)
+    return tuple(sorted(tax_years))
 
-            # Section from link above entitled "Employer (secondary) contribution rates"
 
-            'employer_lel_to_pt': [0.0, 0.0, 0.0],
-            'employer_pt_to_uel': [0.1380, 0.1380, 0.1380],
-            'employer_uel_and_above': [0.1380, 0.1380, 0.1380],
+def _rate_file(tax_year):
+    """Return the path of the rate file for the tax year, or None if there isn't one."""
+    if not isinstance(tax_year, str) or not _TAX_YEAR_PATTERN.match(tax_year):
+        return None
+    for extension in _RATE_FILE_EXTENSIONS:
+        path = os.path.join(rate_data_directory, tax_year + extension)
+        if os.path.isfile(path):
+            return path
+    return None
 
-            # Section from link above entitled "Student loan recovery"
-            # https://www.gov.uk/guidance/rates-and-thresholds-for-employers-2016-to-2017#student-loan-recovery
 
-            'annual_repayment_threshold_plan_1': [17495.00, 17775.00, 18330.00],  # From tax threshold table, Plan 1.
-            'annual_repayment_threshold_plan_2': [21000.00, 21000.00, 25000.00],  # From tax threshold table, Plan 2.
-            'sl_interest_rate': [0.09, 0.09, 0.09]  # 9% for 2016-2017, 2017-2018, 2018-2019
-        }
+def _parse_rate_file(path, tax_year):
+    """Read and check a TOML or JSON rate file, returning its values as a dictionary."""
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ImportError('Reading {} needs Python 3.11 or tomli.  Install it with "pip install tomli".'.
+                              format(path))
+        with open(path, 'rb') as f:
+            table = tomllib.load(f)
+    else:
+        with open(path, encoding='utf-8') as f:
+            table = json.load(f)
+
+    if not isinstance(table, dict):
+        raise ValueError('Error - The rate file {} does not hold a table of values.'.format(path))
+    missing = [key for key in tax_table_all_data if key not in table]
+    if missing:
+        raise ValueError('Error - The rate file {} is missing {}.'.format(path, ', '.join(missing)))
+    if table['tax-year'] != tax_year:
+        raise ValueError('Error - The rate file {} is for the tax year >>{}<<.'.format(path, table['tax-year']))
+    for key in tax_table_all_data:
+        value = table[key]
+        if key != 'tax-year' and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError('Error - The rate file {} value {} >>{}<< is not a number.'.format(path, key, value))
+        table[key] = float(value) if key != 'tax-year' else value
+    return table
+
+
+def _load_rate_file(path, tax_year):
+    """
+    Return the values in a rate file, from its compiled form in __pycache__ beside it if that was made from the file as
+    it is now (the same size and modification time), parsing the file and saving a new compiled form otherwise.
+    """
+    stat = os.stat(path)
+    source = (_COMPILED_RATES_VERSION, stat.st_size, stat.st_mtime_ns)
+    compiled_path = os.path.join(os.path.dirname(path), '__pycache__', os.path.basename(path) + '.marshal')
+    try:
+        with open(compiled_path, 'rb') as f:
+            compiled_source, table = marshal.load(f)
+        if compiled_source == source:
+            return table
+    except (OSError, EOFError, ValueError, TypeError):
+        pass  # Missing, stale or unreadable, so compile it again.
+
+    table = _parse_rate_file(path, tax_year)
+    try:
+        os.makedirs(os.path.dirname(compiled_path), exist_ok=True)
+        temporary_path = '{}.{}.tmp'.format(compiled_path, os.getpid())
+        with open(temporary_path, 'wb') as f:
+            marshal.dump((source, table), f)
+        os.replace(temporary_path, compiled_path)
+    except OSError:
+        pass  # A read only data directory just means parsing the file every time.
+    return table
+
+
+@lru_cache(maxsize=None)
+def get_tax_table(tax_year):
+    """ Given the correct tax year value, read the limits, rates and threshold values from the tax year's rate file, or
+    from tax_table_all_data if there isn't one, to a matching read only dictionary, with only that year's values in it.
+    Each year is read the first time it is asked for, then shared.
+
+    :param tax_year: must be a string of the form '2015-2016', '2016-2017' etc.  This year value must be in
+    tax_table_all_data['tax-year'] or have a rate file in rate_data_directory.
+    :return: Either the dictionary object tax_table or FALSE if the tax_year date was not found.
+    """
+    path = _rate_file(tax_year)
+    if path:
+        return MappingProxyType(_load_rate_file(path, tax_year))
+
+    try:
+        index = tax_table_all_data['tax-year'].index(tax_year)  # Find the index of the tax year value.
+    except ValueError:
+        return False  # The tax year was not found, so return FALSE from the function.
+
+    return MappingProxyType({k: dk[index] for k, dk in tax_table_all_data.items()})
+
+
+@lru_cache(maxsize=None)
+def get_schedule(tax_year):
+    """Return the compiled TaxYearSchedule for the tax year, compiling it the first time it is asked for."""
+    tax_table = get_tax_table(tax_year)
+    return compile_schedule(tax_table) if tax_table else None
+
+
+# The number of pay periods in a tax year for each pay frequency.  A year paid weekly, fortnightly or four-weekly can
+# have one more pay day, Week 53 (or 54 or 56), which is worked out with the same per period thresholds.
+PAY_FREQUENCIES = {'weekly': 52, 'fortnightly': 26, 'four_weekly': 13, 'monthly': 12, 'annual': 1}
+_WEEKS_PER_PERIOD = {'weekly': 1, 'fortnightly': 2, 'four_weekly': 4}
+
+# The sums of the tax table which are spread evenly over the pay periods, in pounds and pence.
+_PERIOD_PAYE_KEYS = ('personal_allowance_reduction_point', 'default_personal_allowance', 'basic_rate_threshold',
+                     'higher_rate_threshold', 'additional_rate_threshold')
+
+
+def _ni_period_threshold(annual, frequency, round_up=False):
+    """
+    Return an NI threshold for one pay period as HMRC publish it: the weekly threshold is the annual one over 52 to the
+    nearest pound (the upper earnings limit is rounded up), fortnightly and four-weekly ones are two and four times the
+    weekly one, and the monthly one is the annual one over 12 to the nearest pound.
+    """
+    if frequency in _WEEKS_PER_PERIOD:
+        weekly = annual / 52
+        return (math.ceil(weekly) if round_up else int(weekly + 0.5)) * _WEEKS_PER_PERIOD[frequency]
+    if frequency == 'annual':
+        return annual
+    return int(annual / PAY_FREQUENCIES[frequency] + 0.5)
+
+
+def compile_period_schedule(tax_table, frequency):
+    """
+    Compile one year's tax_table into a TaxYearSchedule for the pay of a single period of the frequency, as on the
+    Week 1 / Month 1 basis.  The PAYE bands and allowance are the annual ones spread evenly over the periods, the NI
+    thresholds are rounded as HMRC round them and the Student Loan thresholds are cut down to the penny.
+    """
+    periods = PAY_FREQUENCIES[frequency]
+    period_table = dict(tax_table)
+    for key in _PERIOD_PAYE_KEYS:
+        period_table[key] = tax_table[key] / periods
+    for key in ('primary_threshold', 'secondary_threshold'):
+        period_table[key] = _ni_period_threshold(tax_table[key], frequency)
+    period_table['upper_earnings_limit'] = _ni_period_threshold(tax_table['upper_earnings_limit'], frequency, True)
+    for plan in (1, 2):
+        key = 'annual_repayment_threshold_plan_{}'.format(plan)
+        period_table[key] = math.floor(tax_table[key] * 100 / periods + 1e-6) / 100
+    return compile_schedule(period_table)
+
+
+@lru_cache(maxsize=None)
+def get_period_schedule(tax_year, frequency):
+    """
+    Return the TaxYearSchedule of per period thresholds for the tax year and pay frequency, compiling it the first
+    time it is asked for.
+    """
+    if frequency not in PAY_FREQUENCIES:
+        raise ValueError('Error - The pay frequency >>{}<< is not valid.  Use one of {}.'.
+                         format(frequency, ', '.join(sorted(PAY_FREQUENCIES))))
+    tax_table = get_tax_table(tax_year)
+    return compile_period_schedule(tax_table, frequency) if tax_table else None
+
+
+# The integer pence engine works in ten-thousandths of a penny, so a threshold in pence times a rate in basis points
+# is exact.
+_PENCE_UNIT = 10000
+
+
+def _to_pence(amount):
+    """Convert an amount of pounds to a whole number of pence."""
+    return int(round(amount * 100))
+
+
+# Salaries in pence below this are worked out in int64 arrays; the tax on them in ten-thousandths of a penny, doubled
+# for rounding, can't overflow.  Larger ones are worked out in Python ints.
+_MAX_INT64_PENCE = 10 ** 14
+
+
+def _as_pence_array(salaries):
+    """Convert an iterable of annual salaries to an array of whole pence, as _to_pence converts one salary."""
+    pence = np.rint(_as_salary_array(salaries) * 100)
+    if pence.size and pence.max() >= _MAX_INT64_PENCE:
+        return np.array([int(x) for x in pence.ravel().tolist()], dtype=object).reshape(pence.shape)
+    return pence.astype(np.int64)
+
+
+def _exact_int(value, scale, name):
+    """Return value * scale as an int, refusing values which don't convert exactly."""
+    scaled = round(value * scale)
+    if abs(value * scale - scaled) > 1e-6:
+        raise ValueError('Error - The rate data value {} >>{}<< can not be held exactly as an integer.'.format(name,
+                                                                                                          value))
+    return int(scaled)
+
+
+class PenceSchedule(object):
+    """
+    The integer version of a BandSchedule: breakpoints and the taper in pence, rates in basis points and the tax at the
+    start of each band in ten-thousandths of a penny, so evaluating it is exact integer arithmetic.
+    """
+
+    __slots__ = ('breakpoints', 'cumulative', 'rates', 'offsets', 'taper_start', 'taper_limit', 'taper_rates')
+
+    def __init__(self, schedule):
+        """Convert a BandSchedule, whose values must all be whole pence and whole basis points."""
+        self.breakpoints = tuple(_exact_int(x, 100, 'threshold') for x in schedule.breakpoints)
+        self.cumulative = tuple(_exact_int(x, 100 * _PENCE_UNIT, 'cumulative tax') for x in schedule.cumulative)
+        self.rates = tuple(_exact_int(x, 10000, 'rate') for x in schedule.rates)
+        # The tax in band i is pence * rates[i] + offsets[i].
+        self.offsets = tuple(c - b * r for c, b, r in zip(self.cumulative, self.breakpoints, self.rates))
+        self.taper_rates = tuple(_exact_int(x, 10000, 'rate') for x in schedule.taper_rates)
+        if schedule.taper_start == float('inf'):
+            self.taper_start, self.taper_limit = None, 0
+        else:
+            self.taper_start = _exact_int(schedule.taper_start, 100, 'taper start')
+            self.taper_limit = _exact_int(schedule.taper_limit, 100, 'taper limit')
+
+    def __call__(self, pence):
+        """Return the tax on an amount in pence, in ten-thousandths of a penny."""
+        i = bisect_left(self.breakpoints, pence, 1) - 1
+        tax = pence * self.rates[i] + self.offsets[i]
+        if self.taper_start is not None and pence > self.taper_start:
+            # The allowance goes down by £1 for every whole £2 over the taper start.
+            tax += self.taper_rates[i] * min((pence - self.taper_start) // 200 * 100, self.taper_limit)
+        return tax
+
+    def evaluate_array(self, pence):
+        """Evaluate the schedule for an array from _as_pence_array, with exactly the same arithmetic as a call."""
+        i = np.maximum(np.searchsorted(self.breakpoints, pence, side='left') - 1, 0)
+        dtype = pence.dtype  # int64, or object for Python ints.
+        tax = pence * np.array(self.rates, dtype=dtype)[i] + np.array(self.offsets, dtype=dtype)[i]
+        if self.taper_start is not None:
+            lost = np.minimum((pence - self.taper_start) // 200 * 100, self.taper_limit)
+            tax = tax + np.where(pence > self.taper_start, np.array(self.taper_rates, dtype=dtype)[i] * lost, 0)
+        return tax
+
+
+class PenceTaxYearSchedule(object):
+    """
+    A tax year's schedules in integer pence, rounded the way HMRC's rules say: PAYE is rounded down to the penny, NI
+    is rounded to the nearest penny with exactly half a penny rounded down, and Student Loan repayments are rounded
+    down to the whole pound.  Each method takes an annual salary in pence and the number of pay periods it is to be
+    spread over, and returns the amount in pence.  A period's share of the Student Loan repayment is rounded down to
+    the penny, where the float engine rounds it to the nearest penny, so the two can differ by a penny.
+    """
+
+    __slots__ = ('tax_year', 'paye_schedule', 'employee_ni_schedule', 'employer_ni_schedule', 'student_loans',
+                 'serial')
+
+    def __init__(self, schedule):
+        self.tax_year = schedule.tax_year
+        self.paye_schedule = PenceSchedule(schedule.paye)
+        self.employee_ni_schedule = PenceSchedule(schedule.employee_ni)
+        self.employer_ni_schedule = PenceSchedule(schedule.employer_ni)
+        self.student_loans = {plan: PenceSchedule(sl) for plan, sl in schedule.student_loans.items()}
+        self.serial = next(_schedule_serials)
+
+    def paye(self, pence, periods=1):
+        return self.paye_schedule(pence) // (_PENCE_UNIT * periods)
+
+    def employee_ni(self, pence, periods=1):
+        return _round_half_down(self.employee_ni_schedule(pence), _PENCE_UNIT * periods)
+
+    def employer_ni(self, pence, periods=1):
+        return _round_half_down(self.employer_ni_schedule(pence), _PENCE_UNIT * periods)
+
+    def student_loan(self, pence, plan, periods=1):
+        if not plan:
+            return 0
+        return self.student_loans[plan](pence) // (100 * _PENCE_UNIT) * 100 // periods
+
+    # The same calculations for an array of salaries in pence from _as_pence_array, with one plan or an array of them.
+
+    def paye_array(self, pence, periods=1):
+        return self.paye_schedule.evaluate_array(pence) // (_PENCE_UNIT * periods)
+
+    def employee_ni_array(self, pence, periods=1):
+        return _round_half_down(self.employee_ni_schedule.evaluate_array(pence), _PENCE_UNIT * periods)
+
+    def employer_ni_array(self, pence, periods=1):
+        return _round_half_down(self.employer_ni_schedule.evaluate_array(pence), _PENCE_UNIT * periods)
+
+    def student_loan_array(self, pence, plans, periods=1):
+        plans = np.broadcast_to(np.asarray(plans), pence.shape)
+        repayment = np.zeros(pence.shape, dtype=pence.dtype)
+        for plan, schedule in self.student_loans.items():
+            on_plan = plans == plan
+            if on_plan.any():
+                repayment[on_plan] = schedule.evaluate_array(pence[on_plan]) // (100 * _PENCE_UNIT) * 100 // periods
+        return repayment
+
+
+def _round_half_down(numerator, denominator):
+    """Divide two positive ints, rounding to the nearest whole number with exact halves rounded down."""
+    return (2 * numerator + denominator - 1) // (2 * denominator)
+
+
+@lru_cache(maxsize=None)
+def get_pence_schedule(tax_year):
+    """Return the PenceTaxYearSchedule for the tax year, converting it the first time it is asked for."""
+    schedule = get_schedule(tax_year)
+    return PenceTaxYearSchedule(schedule) if schedule else None
+
+
+class StackedSchedule(object):
+    """
+    The BandSchedules of the same tax for several tax years, stacked into 2-D arrays with a row per year, so a set
+    of salaries can be evaluated against every year in one pass.  Each element of the result is exactly what the
+    year's own BandSchedule gives.
+    """
+
+    __slots__ = ('breakpoints', 'starts', 'rates', 'taper_start', 'taper_limit', 'taper_shifts', 'below_columns')
+
+    def __init__(self, schedules):
+        _require_numpy()
+        if len(set(len(schedule.breakpoints) for schedule in schedules)) > 1:
+            raise ValueError('Error - Schedules with different numbers of bands can not be stacked.')
+        self.breakpoints = np.array([schedule.breakpoints for schedule in schedules], dtype=float)
+        self.starts = np.array([schedule.starts for schedule in schedules], dtype=float)
+        self.rates = np.array([schedule.rates for schedule in schedules], dtype=float)
+        self.taper_shifts = np.array([schedule.taper_shifts for schedule in schedules], dtype=float)
+        self.taper_start = np.array([schedule.taper_start for schedule in schedules], dtype=float)
+        self.taper_limit = np.array([schedule.taper_limit for schedule in schedules], dtype=float)
+        depth = max(len(below) for schedule in schedules for below in schedule.below)
+        columns = [_below_columns(schedule, depth) for schedule in schedules]
+        self.below_columns = tuple(tuple(np.array([year[level][j] for year in columns], dtype=float) for j in range(3))
+                                   for level in range(depth))
+
+    def evaluate_array(self, amounts):
+        """Evaluate a 1-D array of amounts against every year, returning an amounts x years array."""
+        amounts = amounts[:, np.newaxis]
+        # Counting the thresholds each amount is over is the same as the bisect in BandSchedule, a year at a time.
+        i = (amounts[:, :, np.newaxis] > self.breakpoints[np.newaxis, :, 1:]).sum(axis=2)
+
+        def take(values):
+            return np.take_along_axis(values[np.newaxis, :, :], i[:, :, np.newaxis], axis=2)[:, :, 0]
+
+        reduction = 0.0
+        tapered = amounts > self.taper_start
+        if tapered.any():
+            reduction = np.where(tapered, np.minimum(np.trunc((amounts - self.taper_start) / 2), self.taper_limit), 0.0)
+        return _evaluate_bands(self, take, amounts, reduction)
+
+
+# Each amount is a salaries x tax years array, in the order of tax_years.
+YearMatrix = namedtuple('YearMatrix', 'tax_years salaries paye employee_ni employer_ni student_loan')
+
+
+@lru_cache(maxsize=None)
+def get_stacked_schedules(tax_years):
+    """
+    Return a dictionary of StackedSchedule for the tuple of tax years, keyed 'paye', 'employee_ni', 'employer_ni',
+    1 and 2 (the Student Loan plans), building it the first time it is asked for.
+    """
+    schedules = []
+    for tax_year in tax_years:
+        schedule = get_schedule(tax_year)
+        if schedule is None:
+            raise ValueError('Error - The tax year >>{}<< is not valid.'.format(tax_year))
+        schedules.append(schedule)
+    stacked = {name: StackedSchedule([getattr(schedule, name) for schedule in schedules])
+               for name in ('paye', 'employee_ni', 'employer_ni')}
+    for plan in schedules[0].student_loans:
+        stacked[plan] = StackedSchedule([schedule.student_loans[plan] for schedule in schedules])
+    return stacked
+
+
+def calculate_across_years(salaries, tax_years=None, plans=0, monthly=True):
+    """
+    Calculates PAYE, employee NI, employer NI and Student Loan repayments for one or many annual salaries against
+    several tax years at once, in one vectorized pass over the years rather than a Taxation instance per year.  Every
+    amount matches the calculate_* methods of a Taxation instance for that year.
+    :param salaries : An annual salary, or a numpy array, or anything numpy can turn into one, of annual salaries.
+    :param tax_years : The tax years to use, defaulting to every year with rates.
+    :param plans : The Student Loan repayment plan, 0, 1 or 2, for every salary, or an array of plans, one per salary.
+    :param monthly : Returns the monthly amounts if set to True, returns the annual amounts if set to False.
+    :return: A YearMatrix with a row per salary and a column per tax year.
+    """
+    tax_years = tuple(tax_years) if tax_years else available_tax_years()
+    stacked = get_stacked_schedules(tax_years)
+    salaries = np.atleast_1d(_as_salary_array(salaries))
+    plans = np.broadcast_to(np.asarray(plans), salaries.shape)
+    bad = ~np.isin(plans, (0,) + tuple(key for key in stacked if not isinstance(key, str)))
+    if bad.any():
+        raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< at position {} is not '
+                         'valid.'.format(plans.flat[np.argmax(bad)], int(np.argmax(bad))))
+
+    periods = 12 if monthly else 1
+    sl_repayment = np.zeros((len(salaries), len(tax_years)))
+    for plan in np.unique(plans).tolist():
+        if plan:
+            on_plan = plans == plan
+            # Round each result down to the nearest whole number.
+            sl_repayment[on_plan] = np.trunc(stacked[plan].evaluate_array(salaries[on_plan]))
+
+    return YearMatrix(tax_years, salaries,
+                      _round_2dp(stacked['paye'].evaluate_array(salaries) / periods),
+                      _round_2dp(stacked['employee_ni'].evaluate_array(salaries) / periods),
+                      _round_2dp(stacked['employer_ni'].evaluate_array(salaries) / periods),
+                      _round_2dp(sl_repayment / periods))
+
+
+def reload_rates():
+    """
+    Forget every cached rate table and compiled schedule, so they are rebuilt from the rate data the next time they are
+    asked for.  Rate files which have changed since they were last read are read again.  Taxation instances created
+    afterwards pick up the new rates; cached results for the old rates are never returned to them.
+    """
+    get_tax_table.cache_clear()
+    get_schedule.cache_clear()
+    get_pence_schedule.cache_clear()
+    get_period_schedule.cache_clear()
+    get_stacked_schedules.cache_clear()
+
+
+CacheStats = namedtuple('CacheStats', 'hits misses evictions size maxsize')
+
+
+class ResultCache(object):
+    """
+    A bounded, least recently used cache of calculator results, which can be shared by any number of Taxation
+    instances and threads.  Results are keyed on the compiled rates for the tax year, the calculator and its
+    arguments, so salaries that come up again and again are only calculated once.
+    """
+
+    _missing = object()
+
+    def __init__(self, maxsize=65536):
+        """
+        :param maxsize : The most results to keep.  When the cache is full the least recently used result is dropped.
+        """
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            result = self._results.get(key, self._missing)
+            if result is self._missing:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._results.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached result and reset the counters."""
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the hit, miss and eviction counts and the current and maximum size as a CacheStats."""
+        with self._lock:
+            return CacheStats(self.hits, self.misses, self.evictions, len(self._results), self.maxsize)
+
+
+# The cache used by Taxation(result_cache=True).
+default_result_cache = ResultCache()
+
+
+def _cached(method):
+    """Decorator which looks up and stores a calculator's results in the instance's result cache, if it has one."""
+    name = method.__name__
+    missing = ResultCache._missing
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self.result_cache
+        schedule = self.pence_schedule or self.schedule
+        if cache is None or schedule is None:
+            return method(self, *args, **kwargs)
+        key = (schedule.serial, name) + args
+        if kwargs:
+            key += tuple(sorted(kwargs.items()))
+        try:
+            result = cache.get(key, missing)
+        except TypeError:  # Unhashable arguments can't be cached, or be valid.
+            return method(self, *args, **kwargs)
+        if result is missing:
+            result = method(self, *args, **kwargs)
+            if result is not False:  # Errors are reported every time.
+                cache.put(key, result)
+        return result
+
+    return wrapper
+
+
+class Taxation:
+    # Instances only hold their own settings and references to the shared, per-year rate data, so they are cheap to
+    # create and small enough to keep one per employee.
+    # Nothing is written to an instance after __init__, so one instance can be shared by any number of threads.
+    __slots__ = ('full_time', 'student_loan_plan', 'hours_per_week', 'tax_table', 'schedule', 'pence_schedule',
+                 'result_cache', 'lookup_table')
+
+    __version__ = __version__
+    tax_table_all_data = tax_table_all_data
+
+    def __init__(self, full_time=True, student_loan_plan=None, hours_per_week=40, **kwargs):
+        # define class variables.
+        self.full_time = full_time
         self.hours_per_week = hours_per_week
+
+        # Pass result_cache=True to share default_result_cache, or a ResultCache of your own.  Off by default.
+        result_cache = kwargs.get('result_cache')
+        self.result_cache = default_result_cache if result_cache is True else result_cache or None
+
+        # Pass engine='pence' to work in exact integer pence with HMRC's rounding rules, rather than in floating point.
+        engine = kwargs.get('engine', 'float')
+        lookup_table = kwargs.get('lookup_table')
+        if engine not in ('float', 'pence'):
+            raise ValueError('Error - The engine >>{}<< is not valid.  Use float or pence.'.format(engine))
+
         if not 'tax_year' in kwargs:  # If a value for tax_year is not given, assume it is '2016-2017' for backwards compatibility.
             kwargs = {'tax_year': '2016-2017'}
         else:
             kwargs = {'tax_year': kwargs['tax_year']}
 
         self.tax_table = self.set_rates_and_values(**kwargs)
+        self.schedule = get_schedule(kwargs['tax_year'])
+        self.pence_schedule = get_pence_schedule(kwargs['tax_year']) if engine == 'pence' else None
+
+        # Pass a LookupTable from lookup_tables.open_lookup_table to look up whole pound salaries in its range rather
+        # than calculate them.  It must have been built for the same tax year and engine.
+        self.lookup_table = lookup_table
+        if lookup_table is not None and (lookup_table.tax_year, lookup_table.engine) != (kwargs['tax_year'], engine):
+            raise ValueError('Error - The lookup table is for {} with the {} engine, not {} with the {} engine.'.
+                             format(lookup_table.tax_year, lookup_table.engine, kwargs['tax_year'], engine))
 
         if not 'student_loan_plan' in (0, 1, 2):
             self.student_loan_plan = 0
@@ -99,25 +1006,15 @@ class Taxation:
 
     def set_rates_and_values(self, tax_year):
 
-        """ Given the correct tax year value, read the limits, rates and threshold values from the main tax table to a
-        matching dictionary, with only thos year's values in it.
+        """ Given the correct tax year value, return the limits, rates and threshold values for that year from the main
+        tax table as a read only dictionary.  The dictionary is shared by every instance for the same year.
 
         :param tax_year: must be a string of the form '2015-2016', '2016-2017' etc.  This year value must be in the
-        tax_table_all_data['tax-year'] dictionary, set in the __init__ section of the class, above.
+        tax_table_all_data['tax-year'] column, set at the top of this module.
         :return: Either the dictionary object tax_table or FALSE if the tay_year date was not found.
         """
 
-        tax_table = {}
-        try:
-            index = self.tax_table_all_data['tax-year'].index(tax_year)  # Find the index of the tax year value.
-        except ValueError:
-            index = False  # The tax year was not found, so return FALSE from the function.
-            return (index)
-
-        for k, dk in self.tax_table_all_data.items():  # Read the elements of the dictionary for the given index into a new dictionary called tax_table.
-            tax_table[k] = dk[index]
-
-        return (tax_table)  # Return the tax_table dictionary for use.
+        return get_tax_table(tax_year)
 
     def is_valid_number(self, myinput):
         """Check to see if input is a number.
@@ -125,7 +1022,6 @@ class Taxation:
         """
         try:
             if myinput < 0:
-                self.error_message = 'The value given is less than zero'
                 return False
             else:
                 myinput = float(myinput)
@@ -134,9 +1030,24 @@ class Taxation:
             print("Error : " + str(e))
             return False
 
+    @staticmethod
+    def number_error(myinput):
+        """
+        The same check as is_valid_number, but returns the reason the input is not valid, or None if it is, rather
+        than printing anything.  The calculators use this so that they never write to the instance.
+        """
+        try:
+            if myinput < 0:
+                return 'The value given is less than zero'
+            float(myinput)
+        except Exception as e:
+            return str(e)
+        return None
+
     def get_version(self):
         return self.__version__
 
+    @_cached
     def calculate_employee_ni(self, salary, monthly=True):
         """
         Calculates employee's monthly National Insurance contribution for a given annual salary.
@@ -144,26 +1055,20 @@ class Taxation:
         :param monthly : Returns the monthly amount if set to True, returns the annual amount if set to False.
         """
         try:
-            if not self.is_valid_number(salary):
+            reason = self.number_error(salary)
+            if reason:
                 raise ValueError('Error - The input value >>{}<< is not valid.  '
-                                 '{}.  Try again.'.format(salary, self.error_message))
-
-            nic = 0
+                                 '{}.  Try again.'.format(salary, reason))
 
-            if salary > self.tax_table['upper_earnings_limit']:
-                taxable_amount = salary - self.tax_table['upper_earnings_limit']
-                nic += taxable_amount * self.tax_table['uel_and_above']
-                salary -= taxable_amount
+            if self.lookup_table is not None:
+                amount = self.lookup_table.get(salary, 'employee_ni', 'monthly' if monthly else 'annual')
+                if amount is not None:
+                    return amount
 
-            if self.tax_table['primary_threshold'] < salary <= self.tax_table['upper_earnings_limit']:
-                taxable_amount = salary - self.tax_table['primary_threshold']
-                nic += taxable_amount * self.tax_table['pt_to_uel']
-                salary -= taxable_amount
+            if self.pence_schedule:
+                return self.pence_schedule.employee_ni(_to_pence(salary), 12 if monthly else 1) / 100
 
-            if 0 <= salary <= self.tax_table['primary_threshold']:
-                taxable_amount = salary
-                nic += taxable_amount * self.tax_table['lel_to_pt']
-                salary -= taxable_amount
+            nic = self.schedule.employee_ni(salary)
 
             if monthly:
                 return round(nic / 12, 2)  # Return MONTHLY nic amount
@@ -174,6 +1079,7 @@ class Taxation:
             print("Error : " + str(e))
             return False
 
+    @_cached
     def calculate_employer_ni(self, salary, monthly=True):
         """
         Calculates employer's monthly National Insurance contribution for a given annual salary.
@@ -182,27 +1088,19 @@ class Taxation:
         """
 
         try:
-            if not self.is_valid_number(salary):
+            reason = self.number_error(salary)
+            if reason:
                 raise ValueError('Error - The input value >>{}<< is not valid.  '
-                                 '{}.  Try again.'.format(salary, self.error_message))
-            nic = 0
+                                 '{}.  Try again.'.format(salary, reason))
+            if self.lookup_table is not None:
+                amount = self.lookup_table.get(salary, 'employer_ni', 'monthly' if monthly else 'annual')
+                if amount is not None:
+                    return amount
 
-            # Calculate Employer's NICs
+            if self.pence_schedule:
+                return self.pence_schedule.employer_ni(_to_pence(salary), 12 if monthly else 1) / 100
 
-            if salary > self.tax_table['upper_earnings_limit']:
-                taxable_amount = salary - self.tax_table['upper_earnings_limit']
-                nic += taxable_amount * self.tax_table['employer_uel_and_above']
-                salary -= taxable_amount
-
-            if self.tax_table['secondary_threshold'] < salary <= self.tax_table['upper_earnings_limit']:
-                taxable_amount = salary - self.tax_table['secondary_threshold']
-                nic += taxable_amount * self.tax_table['employer_pt_to_uel']
-                salary -= taxable_amount
-
-            if 0 <= salary <= self.tax_table['secondary_threshold']:
-                taxable_amount = salary
-                nic += taxable_amount * self.tax_table['employer_lel_to_pt']
-                salary -= taxable_amount
+            nic = self.schedule.employer_ni(salary)  # Calculate Employer's NICs
 
             if monthly:
                 return round(nic / 12, 2)  # Return MONTHLY nic amount
@@ -213,6 +1111,7 @@ class Taxation:
             print("Error : " + str(e))
             return False
 
+    @_cached
     def calculate_paye(self, salary, monthly=True):
         """
         Calculate the employee's monthly PAYE contribution for a given annual salary.
@@ -222,64 +1121,28 @@ class Taxation:
         """
 
         try:
-            if not self.is_valid_number(salary):
+            reason = self.number_error(salary)
+            if reason:
                 raise ValueError('Error - The input value >>{}<< is not valid.  '
-                                 '{}.  Try again.'.format(salary, self.error_message))
-
-            original_salary = salary
-            paye = 0
-            personal_allowance = self.tax_table['default_personal_allowance']
-
-            basic_rate_threshold = self.tax_table['basic_rate_threshold']
-            higher_rate_threshold = self.tax_table['higher_rate_threshold']
-            additional_threshold = self.tax_table['additional_rate_threshold']
-
-            # STEP 1 : Check to see if salary is even considered for PAYE.
-            if salary <= personal_allowance:
-                return 0.00
-
-            # STEP 2 : Calculate personal allowance
+                                 '{}.  Try again.'.format(salary, reason))
 
+            # The schedule works through the personal allowance, basic, higher and additional rate bands.
             # Your Personal Allowance goes down by £1 for every WHOLE * £2 that your adjusted net income
             # is above £100,000.  This means your allowance is zero if your income is £122,000 or above.
             # https://www.gov.uk/income-tax-rates/income-over-100000
             # http://tools.hmrc.gov.uk/hmrctaxcalculator/screen/Personal+Tax+Calculator/en-GB/summary?user=guest
 
-            if salary > self.tax_table['personal_allowance_reduction_point']:
-
-                personal_allowance_reduction = int((salary - self.tax_table['personal_allowance_reduction_point']) / 2)
-                personal_allowance -= personal_allowance_reduction
-                if personal_allowance < 0:
-                    personal_allowance = 0
-
-            # STEP 3: Check the highest tax bracket and remove it.
-
-            if salary > additional_threshold:
-                taxable_chunk = salary - additional_threshold
-                paye += taxable_chunk * self.tax_table['additional_tax_rate']
-                salary -= taxable_chunk
-
-            # STEP 4: Check the additional to higher rate tax bracket, calculate the tax in this bracket and remove it.
+            if self.lookup_table is not None:
+                amount = self.lookup_table.get(salary, 'paye', 'monthly' if monthly else 'annual')
+                if amount is not None:
+                    return amount
 
-            if higher_rate_threshold < salary <= additional_threshold:
-                taxable_chunk = salary - personal_allowance - (higher_rate_threshold - basic_rate_threshold)
-                paye += taxable_chunk * self.tax_table['higher_tax_rate']
-                salary -= taxable_chunk
+            if self.pence_schedule:
+                return self.pence_schedule.paye(_to_pence(salary), 12 if monthly else 1) / 100
 
-            # STEP 5: Check the basic rate to additional rate tax bracket, calculate the tax in this bracket and
-            # remove it.
+            paye = self.schedule.paye(salary)
 
-            if basic_rate_threshold < salary <= higher_rate_threshold:
-
-                if original_salary > higher_rate_threshold:
-                    taxable_chunk = higher_rate_threshold - basic_rate_threshold
-                else:
-                    taxable_chunk = salary - personal_allowance
-
-                paye += taxable_chunk * self.tax_table['basic_tax_rate']
-                salary -= taxable_chunk
-
-            # STEP 6 : Return the values for PAYE, rounded to 2 DP
+            # Return the values for PAYE, rounded to 2 DP
 
             if monthly:
                 return round(paye / 12, 2)  # Return MONTHLY amount
@@ -290,6 +1153,7 @@ class Taxation:
             print("Error : " + str(e))
             return False
 
+    @_cached
     def calculate_student_loans(self, salary, plan, monthly=True):
         """
         Calculates employee's monthly Student Loan repayments for a given annual salary.
@@ -303,26 +1167,28 @@ class Taxation:
         """
 
         try:
-            if not self.is_valid_number(salary):
+            reason = self.number_error(salary)
+            if reason:
                 raise ValueError('Error - The input value >>{}<< is not valid.  '
-                                 '{}.  Try again.'.format(salary, self.error_message))
+                                 '{}.  Try again.'.format(salary, reason))
 
             if plan == 0:
                 return 0.00
-            if plan == 1:
-                annual_repayment_threshold = self.tax_table['annual_repayment_threshold_plan_1']
-            elif plan == 2:
-                annual_repayment_threshold = self.tax_table['annual_repayment_threshold_plan_2']
-            else:
+            if plan not in self.schedule.student_loans:
                 raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< is not valid.'.
-                                 format(plan, self.error_message))
+                                 format(plan))
 
-            if salary > annual_repayment_threshold:  # Annual salary exceeds threshold.  Let's charge tax.
-                salary -= annual_repayment_threshold
-                sl_repayment = int(
-                    salary * self.tax_table['sl_interest_rate'])  # Round result down to nearest whole number.
-            else:
-                sl_repayment = 0.00
+            if self.lookup_table is not None:
+                amount = self.lookup_table.get(salary, 'student_loan_{:d}'.format(int(plan)),
+                                               'monthly' if monthly else 'annual')
+                if amount is not None:
+                    return amount
+
+            if self.pence_schedule:
+                return self.pence_schedule.student_loan(_to_pence(salary), plan, 12 if monthly else 1) / 100
+
+            # Round result down to nearest whole number.
+            sl_repayment = int(self.schedule.student_loans[plan](salary))
 
             if monthly:
                 return round(sl_repayment / 12, 2)  # Return MONTHLY amount
@@ -333,29 +1199,531 @@ class Taxation:
             print("Error : " + str(e))
             return False
 
+    def calculate_employee_ni_batch(self, salaries, monthly=True):
+        """
+        Calculates employee's National Insurance contributions for an array of annual salaries in one pass.
+        Results match calculate_employee_ni element for element.
+        :param salaries : A numpy array, or anything numpy can turn into one, of annual salaries.
+        :param monthly : Returns the monthly amounts if set to True, returns the annual amounts if set to False.
+        """
+        if self.pence_schedule:
+            return self.pence_schedule.employee_ni_array(_as_pence_array(salaries), 12 if monthly else 1) / 100
+
+        nic = self.schedule.employee_ni.evaluate_array(_as_salary_array(salaries))
+        if monthly:
+            return _round_2dp(nic / 12)  # Return MONTHLY nic amounts
+        else:
+            return _round_2dp(nic)  # Return ANNUAL nic amounts
+
+    def calculate_employer_ni_batch(self, salaries, monthly=True):
+        """
+        Calculates employer's National Insurance contributions for an array of annual salaries in one pass.
+        Results match calculate_employer_ni element for element.
+        :param salaries : A numpy array, or anything numpy can turn into one, of annual salaries.
+        :param monthly : Returns the monthly amounts if set to True, returns the annual amounts if set to False.
+        """
+        if self.pence_schedule:
+            return self.pence_schedule.employer_ni_array(_as_pence_array(salaries), 12 if monthly else 1) / 100
+
+        nic = self.schedule.employer_ni.evaluate_array(_as_salary_array(salaries))
+        if monthly:
+            return _round_2dp(nic / 12)  # Return MONTHLY nic amounts
+        else:
+            return _round_2dp(nic)  # Return ANNUAL nic amounts
+
+    def calculate_paye_batch(self, salaries, monthly=True):
+        """
+        Calculate PAYE for an array of annual salaries in one pass.  Results match calculate_paye element for element.
+        :param salaries : A numpy array, or anything numpy can turn into one, of annual salaries.
+        :param monthly : If set to True, the function returns the monthly PAYE amounts payable.  Set to False,
+        it returns the annual PAYE payable.
+        """
+        if self.pence_schedule:
+            return self.pence_schedule.paye_array(_as_pence_array(salaries), 12 if monthly else 1) / 100
+
+        paye = self.schedule.paye.evaluate_array(_as_salary_array(salaries))
+        if monthly:
+            return _round_2dp(paye / 12)  # Return MONTHLY amounts
+        else:
+            return _round_2dp(paye)  # Return ANNUAL amounts
+
+    def calculate_student_loans_batch(self, salaries, plans, monthly=True):
+        """
+        Calculates Student Loan repayments for an array of annual salaries in one pass.  Results match
+        calculate_student_loans element for element.
+        :param salaries : A numpy array, or anything numpy can turn into one, of annual salaries.
+        :param plans : An array of repayment plans (0, 1 or 2) the same length as salaries, or a single plan for all.
+        :param monthly : If set to True, the function returns the monthly Student Loan repayments payable.
+        Set to False, it returns the annual Student Loan repayments payable.
+        """
+        salary = _as_salary_array(salaries)
+        plans = np.broadcast_to(np.asarray(plans), salary.shape)
+        bad = ~np.isin(plans, (0,) + tuple(self.schedule.student_loans))
+        if bad.any():
+            raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< at position {} is not '
+                             'valid.'.format(plans.flat[np.argmax(bad)], int(np.argmax(bad))))
+
+        if self.pence_schedule:
+            return self.pence_schedule.student_loan_array(_as_pence_array(salary), plans, 12 if monthly else 1) / 100
+
+        sl_repayment = np.zeros(salary.shape)
+        for plan, schedule in self.schedule.student_loans.items():
+            on_plan = plans == plan
+            if on_plan.any():
+                # Round each result down to the nearest whole number.
+                sl_repayment[on_plan] = np.trunc(schedule.evaluate_array(salary[on_plan]))
+
+        if monthly:
+            return _round_2dp(sl_repayment / 12)  # Return MONTHLY amounts
+        else:
+            return _round_2dp(sl_repayment)  # Return ANNUAL amounts
+
+    def calculate_payslip(self, salary, plan=0, period='monthly'):
+        """
+        Calculates PAYE, employee NI, employer NI, Student Loan repayments, net pay and the total cost to the employer
+        for a given annual salary in one pass.  Each amount is the same as the matching calculate_* method returns.
+        :param salary : This is the annual salary for which the payslip is to be calculated.
+        :param plan : The Student Loan repayment plan, 0, 1 or 2.
+        :param period : 'monthly' for the monthly amounts or 'annual' for the annual amounts.
+        :return: A Payslip, or False if the inputs are not valid.
+        """
+
+        try:
+            reason = self.number_error(salary)
+            if reason:
+                raise ValueError('Error - The input value >>{}<< is not valid.  '
+                                 '{}.  Try again.'.format(salary, reason))
+            if period not in PAY_PERIODS:
+                raise ValueError('Error - The pay period >>{}<< is not valid.  Use one of {}.'.
+                                 format(period, ', '.join(sorted(PAY_PERIODS))))
+            if plan != 0 and plan not in self.schedule.student_loans:
+                raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< is not valid.'.
+                                 format(plan))
+
+            return self.calculate_validated_payslip(salary, plan, period)
+
+        except Exception as e:
+            print("Error : " + str(e))
+            return False
+
+    @_cached
+    def calculate_validated_payslip(self, salary, plan=0, period='monthly'):
+        """
+        The fast path of calculate_payslip.  Nothing is checked and no exceptions are caught, so the inputs must
+        already have passed validate_payslip_inputs (or salary_error and plan_error) and period must be in PAY_PERIODS.
+        :param salary : This is the annual salary for which the payslip is to be calculated.
+        :param plan : The Student Loan repayment plan, 0, 1 or 2.
+        :param period : 'monthly' for the monthly amounts or 'annual' for the annual amounts.
+        :return: A Payslip.
+        """
+        periods = PAY_PERIODS[period]
+        if self.lookup_table is not None:
+            amounts = self.lookup_table.payslip_pence(salary, plan, period)
+            if amounts is not None:
+                if self.pence_schedule:
+                    return self._pence_payslip(salary, plan, period, _round_half_down(_to_pence(salary), periods),
+                                               *amounts)
+                paye, employee_ni, employer_ni, student_loan = amounts
+                return self._float_payslip(salary, plan, period, salary / periods, paye / 100, employee_ni / 100,
+                                           employer_ni / 100, student_loan / 100)
+
+        if self.pence_schedule:
+            return self._calculate_payslip_pence(salary, plan, period, periods)
+
+        schedule = self.schedule
+        # Round the Student Loan repayment down to the nearest whole number.
+        sl_repayment = int(schedule.student_loans[plan](salary)) if plan else 0
+        return self._float_payslip(salary, plan, period, salary / periods,
+                                   _round_pennies(schedule.paye(salary) / periods),
+                                   _round_pennies(schedule.employee_ni(salary) / periods),
+                                   _round_pennies(schedule.employer_ni(salary) / periods),
+                                   _round_pennies(sl_repayment / periods))
+
+    def _float_payslip(self, salary, plan, period, gross_pay, paye, employee_ni, employer_ni, student_loan):
+        return Payslip(self.schedule.tax_year, salary, plan, period, _round_pennies(gross_pay), paye, employee_ni,
+                       employer_ni, student_loan, _round_pennies(gross_pay - paye - student_loan - employee_ni),
+                       _round_pennies(gross_pay + employer_ni))
+
+    def validate_payslip_inputs(self, salaries, plans=0, start=0):
+        """
+        Checks every salary and plan in one pass, without raising, printing or touching the instance.
+        :param salaries : An iterable of annual salaries.
+        :param plans : A single Student Loan repayment plan for every salary, or an iterable of plans, one per salary.
+        :param start : The row number given to the first salary.
+        :return: A tuple of the list of valid (row, salary, plan) inputs and the list of RowErrors for the rest.
+        """
+        if isinstance(plans, (numbers.Integral, str)) or plans is None:
+            plans = itertools.repeat(plans)
+        schedule = self.schedule
+        valid = []
+        errors = []
+        for row, (salary, plan) in enumerate(zip(salaries, plans), start):
+            reason = salary_error(salary)
+            if reason:
+                errors.append(RowError(row, 'salary', salary, reason))
+                continue
+            reason = plan_error(plan, schedule)
+            if reason:
+                errors.append(RowError(row, 'plan', plan, reason))
+                continue
+            valid.append((row, salary, plan))
+        return valid, errors
+
+    def calculate_payslips(self, salaries, plans=0, period='monthly', errors=None):
+        """
+        Calculates a payslip for every salary.  All of the inputs are validated first, in bulk, then the valid ones go
+        through calculate_validated_payslip with no further checks.  Invalid inputs are not printed and do not stop the
+        run; each is reported as a RowError instead.
+        :param salaries : An iterable of annual salaries.
+        :param plans : A single Student Loan repayment plan for every salary, or an iterable of plans, one per salary.
+        :param period : 'monthly' for the monthly amounts or 'annual' for the annual amounts.
+        :param errors : If a list is given, a RowError is appended to it for each invalid input.
+        :return: A list with a Payslip for each valid input and None in place of each invalid one.
+        """
+        if period not in PAY_PERIODS:
+            raise ValueError('Error - The pay period >>{}<< is not valid.  Use one of {}.'.
+                             format(period, ', '.join(sorted(PAY_PERIODS))))
+        salaries = list(salaries)
+        valid, row_errors = self.validate_payslip_inputs(salaries, plans)
+        if errors is not None:
+            errors.extend(row_errors)
+
+        payslips = [None] * len(salaries)
+        calculate = self.calculate_validated_payslip
+        for row, salary, plan in valid:
+            payslips[row] = calculate(salary, plan, period)
+        return payslips
+
+    def _calculate_payslip_pence(self, salary, plan, period, periods):
+        schedule = self.pence_schedule
+        pence = _to_pence(salary)
+        return self._pence_payslip(salary, plan, period, _round_half_down(pence, periods),
+                                   schedule.paye(pence, periods), schedule.employee_ni(pence, periods),
+                                   schedule.employer_ni(pence, periods), schedule.student_loan(pence, plan, periods))
+
+    def _pence_payslip(self, salary, plan, period, gross_pay, paye, employee_ni, employer_ni, student_loan):
+        return Payslip(self.schedule.tax_year, salary, plan, period, gross_pay / 100, paye / 100, employee_ni / 100,
+                       employer_ni / 100, student_loan / 100, (gross_pay - paye - employee_ni - student_loan) / 100,
+                       (gross_pay + employer_ni) / 100)
+
+    def calculate_gross_salary(self, net_pay, plan=0, period='monthly'):
+        """
+        Works out the annual gross salary needed for a given net pay, i.e. the salary at which the net_pay of
+        calculate_payslip(salary, plan, period) first reaches net_pay.  The band containing the answer is found and
+        inverted directly, then checked against the real, rounded, payslip and nudged up by a penny or so if the
+        rounding falls short.  Because HMRC's whole pound steps are smoothed out first, a salary up to a few pounds
+        lower can sometimes give the same net pay.
+        :param net_pay : The net pay wanted for each period.
+        :param plan : The Student Loan repayment plan, 0, 1 or 2.
+        :param period : 'monthly' if net_pay is monthly or 'annual' if it is annual.
+        :return: The annual gross salary to the penny, or False if the inputs are not valid.
+        """
+
+        try:
+            reason = self.number_error(net_pay)
+            if reason:
+                raise ValueError('Error - The input value >>{}<< is not valid.  '
+                                 '{}.  Try again.'.format(net_pay, reason))
+            if period not in PAY_PERIODS:
+                raise ValueError('Error - The pay period >>{}<< is not valid.  Use one of {}.'.
+                                 format(period, ', '.join(sorted(PAY_PERIODS))))
+            if plan != 0 and plan not in self.schedule.student_loans:
+                raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< is not valid.'.
+                                 format(plan))
+
+            net_pay_schedule = get_net_pay_schedule(self.schedule, plan)
+            periods = PAY_PERIODS[period]
+            salary = math.ceil(net_pay_schedule.gross(net_pay * periods) * 100 - 1e-6) / 100
+            for __ in range(_GROSS_UP_CORRECTIONS):
+                shortfall = net_pay - self.calculate_payslip(salary, plan, period).net_pay
+                if shortfall <= 0:
+                    break
+                salary = _gross_up_step(salary, shortfall * periods, net_pay_schedule)
+            return salary
+
+        except Exception as e:
+            print("Error : " + str(e))
+            return False
+
+    def calculate_gross_salary_batch(self, net_pays, plans=0, period='monthly'):
+        """
+        Works out the annual gross salaries needed for an array of net pay in one pass.  Results match
+        calculate_gross_salary element for element.
+        :param net_pays : A numpy array, or anything numpy can turn into one, of net pay for each period.
+        :param plans : An array of repayment plans (0, 1 or 2) the same length as net_pays, or a single plan for all.
+        :param period : 'monthly' if net_pays are monthly or 'annual' if they are annual.
+        """
+        net_pays = _as_salary_array(net_pays)
+        plans = np.broadcast_to(np.asarray(plans), net_pays.shape)
+        bad = ~np.isin(plans, (0,) + tuple(self.schedule.student_loans))
+        if bad.any():
+            raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< at position {} is not '
+                             'valid.'.format(plans.flat[np.argmax(bad)], int(np.argmax(bad))))
+        if period not in PAY_PERIODS:
+            raise ValueError('Error - The pay period >>{}<< is not valid.  Use one of {}.'.
+                             format(period, ', '.join(sorted(PAY_PERIODS))))
+        periods = PAY_PERIODS[period]
+        monthly = period == 'monthly'
+
+        salaries = np.empty(net_pays.shape)
+        for plan in np.unique(plans).tolist():
+            on_plan = plans == plan
+            net_pay_schedule = get_net_pay_schedule(self.schedule, plan)
+            target = net_pays[on_plan]
+            salary = np.ceil(net_pay_schedule.gross_array(target * periods) * 100 - 1e-6) / 100
+
+            for __ in range(_GROSS_UP_CORRECTIONS):
+                shortfall = target - self._net_pay_batch(salary, plan, monthly, periods)
+                short = shortfall > 0
+                if not short.any():
+                    break
+                salary[short] = [_gross_up_step(s, d * periods, net_pay_schedule) for s, d in
+                                 zip(salary[short].tolist(), shortfall[short].tolist())]
+            salaries[on_plan] = salary
+        return salaries
+
+    def _net_pay_batch(self, salaries, plan, monthly, periods):
+        if self.pence_schedule:
+            schedule = self.pence_schedule
+            pence = _as_pence_array(salaries)
+            net_pay = (_round_half_down(pence, periods) - schedule.paye_array(pence, periods) -
+                       schedule.student_loan_array(pence, plan, periods) - schedule.employee_ni_array(pence, periods))
+            return net_pay / 100
+
+        net_pay = (salaries / periods - self.calculate_paye_batch(salaries, monthly) -
+                   self.calculate_student_loans_batch(salaries, plan, monthly) -
+                   self.calculate_employee_ni_batch(salaries, monthly))
+        return _round_2dp(net_pay)
+
+    @_cached
+    def calculate_period_payslip(self, pay, plan=0, frequency='weekly'):
+        """
+        Calculates PAYE, employee NI, employer NI and Student Loan repayments for one period's pay, directly against
+        the thresholds for the pay frequency rather than by dividing up an annual amount.  Week 53 pay is worked out
+        the same way.
+        :param pay : The gross pay for the period.
+        :param plan : The Student Loan repayment plan, 0, 1 or 2.
+        :param frequency : One of PAY_FREQUENCIES, e.g. 'weekly', 'fortnightly', 'four_weekly' or 'monthly'.
+        :return: A Payslip with period set to the frequency and salary to the pay over a whole year, or False if the
+        inputs are not valid or the instance uses the pence engine, whose rates can't hold the per period thresholds.
+        """
+
+        try:
+            reason = self.number_error(pay)
+            if reason:
+                raise ValueError('Error - The input value >>{}<< is not valid.  '
+                                 '{}.  Try again.'.format(pay, reason))
+            self._check_float_engine('Period payslips')
+            schedule = get_period_schedule(self.schedule.tax_year, frequency)
+            if plan != 0 and plan not in schedule.student_loans:
+                raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< is not valid.'.
+                                 format(plan))
+
+            # Round the Student Loan repayment down to the nearest whole number.
+            sl_repayment = float(int(schedule.student_loans[plan](pay))) if plan else 0.0
+            return self._float_payslip(pay * PAY_FREQUENCIES[frequency], plan, frequency, pay,
+                                       _round_pennies(schedule.paye(pay)), _round_pennies(schedule.employee_ni(pay)),
+                                       _round_pennies(schedule.employer_ni(pay)), sl_repayment)
+
+        except Exception as e:
+            print("Error : " + str(e))
+            return False
+
+    def _check_float_engine(self, what):
+        # The per period thresholds, e.g. a 52nd of the personal allowance, are not whole pence.
+        if self.pence_schedule:
+            raise ValueError('Error - {} are only worked out in floating point.  Use a Taxation instance with the '
+                             'float engine.'.format(what))
+
+    def calculate_hourly_payslip(self, hourly_rate, plan=0, frequency='weekly'):
+        """
+        Calculates a period payslip, as calculate_period_payslip, for pay of hourly_rate for hours_per_week hours a
+        week.
+        :return: A Payslip, or False if the inputs are not valid.
+        """
+        try:
+            reason = self.number_error(hourly_rate)
+            if reason:
+                raise ValueError('Error - The input value >>{}<< is not valid.  '
+                                 '{}.  Try again.'.format(hourly_rate, reason))
+            if frequency not in PAY_FREQUENCIES:
+                raise ValueError('Error - The pay frequency >>{}<< is not valid.  Use one of {}.'.
+                                 format(frequency, ', '.join(sorted(PAY_FREQUENCIES))))
+            weeks = _WEEKS_PER_PERIOD.get(frequency, 52 / PAY_FREQUENCIES[frequency])
+            pay = _round_pennies(hourly_rate * self.hours_per_week * weeks)
+
+        except Exception as e:
+            print("Error : " + str(e))
+            return False
+
+        return self.calculate_period_payslip(pay, plan, frequency)
+
+    def calculate_period_batch(self, pays, plans=0, frequency='weekly'):
+        """
+        Calculates period payslips for a whole payroll of one pay frequency in one pass.  Results match
+        calculate_period_payslip element for element.
+        :param pays : A numpy array, or anything numpy can turn into one, of gross pay for the period.
+        :param plans : An array of repayment plans (0, 1 or 2) the same length as pays, or a single plan for all.
+        :param frequency : One of PAY_FREQUENCIES.
+        :return: A PeriodBatch of arrays.
+        """
+        self._check_float_engine('Period payslips')
+        pay = _as_salary_array(pays)
+        schedule = get_period_schedule(self.schedule.tax_year, frequency)
+        plans = np.broadcast_to(np.asarray(plans), pay.shape)
+        bad = ~np.isin(plans, (0,) + tuple(schedule.student_loans))
+        if bad.any():
+            raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< at position {} is not '
+                             'valid.'.format(plans.flat[np.argmax(bad)], int(np.argmax(bad))))
+
+        sl_repayment = np.zeros(pay.shape)
+        for plan, sl_schedule in schedule.student_loans.items():
+            on_plan = plans == plan
+            if on_plan.any():
+                # Round each result down to the nearest whole number.
+                sl_repayment[on_plan] = np.trunc(sl_schedule.evaluate_array(pay[on_plan]))
+
+        paye = _round_2dp(schedule.paye.evaluate_array(pay))
+        employee_ni = _round_2dp(schedule.employee_ni.evaluate_array(pay))
+        employer_ni = _round_2dp(schedule.employer_ni.evaluate_array(pay))
+        return PeriodBatch(schedule.tax_year, frequency, pay, paye, employee_ni, employer_ni, sl_repayment,
+                           _round_2dp(pay - paye - sl_repayment - employee_ni), _round_2dp(pay + employer_ni))
+
     def print_tax_ticket(self, salary, plan):
-        paye = self.calculate_paye(salary, True)
-        eeni = self.calculate_employee_ni(salary)
-        erni = self.calculate_employer_ni(salary)
-        sl = self.calculate_student_loans(salary, plan)
-        net_pay_monthly = (salary / 12) - paye - sl - eeni
-
-        print("Tax Receipt for tax year {}".format(self.tax_table['tax-year']))
-        print("----------------------------------------------")
-        print("Gross Annual Pay                 : £{:10,.2f}".format(salary))
-        print("Gross Monthly Pay                : £{:10,.2f}".format(salary / 12))
-        print("PAYE                   (monthly) : £{:10,.2f}".format(paye))
-        print("Student Loans PLAN {}   (monthly) : £{:10,.2f}".format(plan, sl))
-        print("Employee NI            (monthly) : £{:10,.2f}".format(eeni))
-        print("Employer NI            (monthly) : £{:10,.2f}".format(erni))
-        print("----------------------------------------------")
-        print("Net Monthly Pay        (monthly) : £{:10,.2f}".format(net_pay_monthly))
-        print("----------------------------------------------")
-        print("Total Tax              (monthly) : £{:10,.2f}".format(paye + eeni + erni + sl))
-        print("\n")
+        payslip = self.calculate_payslip(salary, plan)
+        if not payslip:
+            return
+
+        print(format_tax_ticket(payslip), end='')
         return
 
 
+def _tax_ticket_layout(name):
+    """Return the tax ticket layout for a pay frequency called name, e.g. 'Monthly', as a format string."""
+    label = '({})'.format(name.lower()).ljust(9)
+    dashes = '-' * (37 + len(label)) + '\n'
+
+    def line(text, field, labelled=True):
+        # The amounts line up after the names, padded to 23 characters, and the period's label.
+        return (text.ljust(23) + label if labelled else text.ljust(23 + len(label))) + ' : £{' + field + ':10,.2f}\n'
+
+    return ('Tax Receipt for tax year {0}\n' + dashes +
+            line('Gross Annual Pay', '1', False) +
+            line('Gross {} Pay'.format(name), '2', False) +
+            line('PAYE', '3') +
+            line('Student Loans PLAN {4}   ', '5') +  # {4} is a single digit once formatted.
+            line('Employee NI', '6') +
+            line('Employer NI', '7') + dashes +
+            line('Net {} Pay'.format(name), '8') + dashes +
+            line('Total Tax', '9') + '\n\n')
+
+
+# The tax ticket layout, compiled once for each pay frequency.  The monthly one is print_tax_ticket's.
+_TAX_TICKETS = {frequency: _tax_ticket_layout(name).format for frequency, name in (
+    ('weekly', 'Weekly'), ('fortnightly', 'Fortnightly'), ('four_weekly', 'Four-Weekly'), ('monthly', 'Monthly'),
+    ('annual', 'Annual'))}
+
+
+def format_tax_ticket(payslip):
+    """Return the tax ticket print_tax_ticket prints for a Payslip, as one string."""
+    return _TAX_TICKETS[payslip.period](payslip.tax_year, payslip.salary, payslip.gross_pay, payslip.paye, payslip.plan,
+                                        payslip.student_loan, payslip.employee_ni, payslip.employer_ni,
+                                        payslip.net_pay, payslip.paye + payslip.employee_ni + payslip.employer_ni +
+                                        payslip.student_loan)
+
+
+# The year to date totals for one employee, as kept by CumulativeTaxation.  period is the number of pay periods
+# processed so far.
+YearToDate = namedtuple('YearToDate', 'tax_year plan periods_per_year period pay paye employee_ni employer_ni '
+                                      'student_loan')
+
+# The deductions for a single pay period, as returned by CumulativeTaxation.calculate_period.
+PeriodPayslip = namedtuple('PeriodPayslip', 'tax_year plan period pay paye employee_ni employer_ni student_loan '
+                                            'net_pay employer_cost')
+
+
+class CumulativeTaxation(object):
+    """
+    Works out one employee's deductions period by period on the cumulative basis, from the year to date pay and tax.
+
+    PAYE due to date is the tax on the year to date pay with the bands and allowance spread evenly over the periods so
+    far, and each period's PAYE is what is due to date less what has been paid, so it evens out when pay goes up and
+    down.  NI and Student Loan repayments are worked out on each period's pay by itself.  Each period is a constant
+    amount of work, and the year to date state can be saved with to_dict() and carried on with from_dict().
+
+        employee = CumulativeTaxation('2018-2019', plan=1)
+        for pay in monthly_pay:
+            payslip = employee.calculate_period(pay)
+        json.dump(employee.to_dict(), snapshot)
+    """
+
+    __slots__ = ('schedule', 'state')
+
+    def __init__(self, tax_year='2016-2017', plan=0, periods_per_year=12, state=None):
+        """
+        :param tax_year : must be a string of the form '2016-2017' etc.
+        :param plan : The Student Loan repayment plan, 0, 1 or 2.
+        :param periods_per_year : The number of pay periods in the tax year, e.g. 12 for monthly pay.
+        :param state : A YearToDate to carry on from.  If given, the other parameters are taken from it.
+        """
+        if state is None:
+            state = YearToDate(tax_year, plan, periods_per_year, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        self.schedule = get_schedule(state.tax_year)
+        if self.schedule is None:
+            raise ValueError('Error - The tax year >>{}<< is not valid.'.format(state.tax_year))
+        if state.plan != 0 and state.plan not in self.schedule.student_loans:
+            raise ValueError('Error - The repayment plan value can only be 0, 1 or 2. >>{}<< is not valid.'.
+                             format(state.plan))
+        if not isinstance(state.periods_per_year, int) or state.periods_per_year < 1:
+            raise ValueError('Error - The number of pay periods >>{}<< is not valid.'.format(state.periods_per_year))
+        self.state = state
+
+    def calculate_period(self, pay):
+        """
+        Works out the deductions for the next pay period and adds them to the year to date totals.
+        :param pay : The gross pay for the period.
+        :return: A PeriodPayslip.  PAYE is negative when the cumulative basis gives a refund.
+        """
+        if not isinstance(pay, (int, float)) or not pay >= 0:
+            raise ValueError('Error - The input value >>{}<< is not valid.  Pay must be a number of zero or more.'.
+                             format(pay))
+        state = self.state
+        schedule = self.schedule
+        periods = state.periods_per_year
+        period = state.period + 1
+        if period > periods:
+            raise ValueError('Error - All {} pay periods of {} have been processed.'.format(periods, state.tax_year))
+
+        # PAYE on the cumulative basis.
+        pay_to_date = round(state.pay + pay, 2)
+        paye_to_date = round(schedule.paye(pay_to_date * periods / period) * period / periods, 2)
+        paye = round(paye_to_date - state.paye, 2)
+
+        # NI and Student Loans on this period's pay alone, against the annual thresholds spread over the periods.
+        employee_ni = round(schedule.employee_ni(pay * periods) / periods, 2)
+        employer_ni = round(schedule.employer_ni(pay * periods) / periods, 2)
+        if state.plan:
+            student_loan = float(int(schedule.student_loans[state.plan](pay * periods) / periods))
+        else:
+            student_loan = 0.0
+
+        self.state = YearToDate(state.tax_year, state.plan, periods, period, pay_to_date, paye_to_date,
+                                round(state.employee_ni + employee_ni, 2), round(state.employer_ni + employer_ni, 2),
+                                round(state.student_loan + student_loan, 2))
+
+        return PeriodPayslip(state.tax_year, state.plan, period, pay, paye, employee_ni, employer_ni, student_loan,
+                             round(pay - paye - employee_ni - student_loan, 2), round(pay + employer_ni, 2))
+
+    def to_dict(self):
+        """Return the year to date state as a dictionary of plain values, e.g. to save as JSON."""
+        return dict(self.state._asdict())
+
+    @classmethod
+    def from_dict(cls, state):
+        """Carry on from a state saved with to_dict()."""
+        return cls(state=YearToDate(**state))
+
+
 def main():
     my_tax = Taxation(full_time=True, student_loan_plan=0, hours_per_week=40, tax_year='2017-2018')
     if not my_tax.tax_table:
@@ -0,0 +1,80 @@
+# coding=utf-8
+import io
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import payroll
+from aggregation import Aggregator, format_pence
+from taxation import Taxation, np
+
+
+class TestAggregation(unittest.TestCase):
+
+    def test010_exact_mergeable_totals(self):
+        """Totals should be exact to the penny and the same however the payslips are split up and merged."""
+
+        my_tax = Taxation(tax_year='2018-2019')
+        random.seed(1)
+        payslips = [my_tax.calculate_payslip(round(random.uniform(0, 200000), 2), random.choice((0, 1, 2)))
+                    for __ in range(3000)]
+
+        whole = Aggregator(('tax_year', 'plan'))
+        whole.add_many(payslips)
+        shards = [Aggregator(('tax_year', 'plan')) for __ in range(3)]
+        for n, payslip in enumerate(payslips):
+            shards[n % 3].add(payslip)
+        merged = Aggregator(('tax_year', 'plan'))
+        for shard in reversed(shards):
+            merged.merge(Aggregator.from_dict(json.loads(shard.to_json())))
+        self.assertEqual(whole.groups, merged.groups)
+        self.assertEqual(3000, merged.count())
+
+        for summary in whole.rollup(('plan',)).summaries():
+            on_plan = [payslip for payslip in payslips if payslip.plan == summary.key[0]]
+            self.assertEqual(len(on_plan), summary.count)
+            self.assertEqual(sum(int(round(payslip.employer_ni * 100)) for payslip in on_plan),
+                             int(round(summary.total['employer_ni'] * 100)))
+            self.assertEqual(max(payslip.paye for payslip in on_plan), summary.maximum['paye'])
+            self.assertEqual(min(payslip.net_pay for payslip in on_plan), summary.minimum['net_pay'])
+
+        self.assertEqual(['1234.56', '-0.05', '0.00'], [format_pence(pence) for pence in (123456, -5, 0)])
+        self.assertRaises(ValueError, whole.merge, Aggregator())
+
+        if np is not None:
+            batch = my_tax.calculate_period_batch([p.gross_pay for p in payslips[:500]], 0, 'weekly')
+            arrays = Aggregator(('cost_centre',))
+            arrays.add_arrays(('CC1',), batch._asdict())
+            one_by_one = Aggregator(('cost_centre',))
+            for i in range(500):
+                one_by_one.add(my_tax.calculate_period_payslip(batch.pay[i].item(), 0, 'weekly'), ('CC1',))
+            self.assertEqual(one_by_one.groups, arrays.groups)
+
+    def test020_payroll_summary(self):
+        """A payroll run should total by its input columns the same with any number of workers."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'employees.csv')
+            with open(input_path, 'w', newline='') as f:
+                f.write('employee_id,salary,plan,tax_year,cost_centre,department\r\n')
+                for n in range(300):
+                    f.write('E{:04d},{},{},{},CC{},{}\r\n'.format(n, n * 731.17 if n % 7 else 'x', n % 3,
+                                                                 '2018-2019' if n % 2 else '', n % 4,
+                                                                 'ops' if n % 5 else 'sales'))
+
+            summaries = []
+            for workers in (1, 3):
+                aggregator = Aggregator(('cost_centre', 'department', 'tax_year'))
+                payroll.run(input_path, os.path.join(directory, 'results.csv'), workers=workers, chunk_size=29,
+                            errors=[], aggregator=aggregator)
+                summary = io.StringIO()
+                aggregator.write_csv(summary, rollup=True)
+                summaries.append(summary.getvalue())
+            self.assertEqual(summaries[0], summaries[1])
+
+        lines = summaries[0].splitlines()
+        self.assertTrue(lines[0].startswith('cost_centre,department,tax_year,count,paye_total,paye_min,paye_max,'))
+        self.assertEqual(('CC0', 'ops', '2016-2017'), tuple(lines[1].split(',')[:3]))
+        self.assertEqual(['*', '*', '*', '257'], lines[-1].split(',')[:4])
@@ -0,0 +1,67 @@
+# coding=utf-8
+import unittest
+
+from taxation import Taxation, np
+
+if np is not None:
+    from dataframes import RESULT_COLUMNS, calculate_arrow, calculate_columns, calculate_dataframe, pa, pd
+else:
+    pa = pd = None
+
+SALARIES = [23000, 52000.5, -1, None, 102500, 40000, 30000, 0]
+PLANS = [1, 0, 0, 0, 2, 3, None, 2]
+TAX_YEARS = ['2018-2019', '2016-2017', None, '', '2017-2018', '2018-2019', '1999-2000', None]
+VALID = [True, True, False, False, True, False, False, True]
+
+
+class TestDataframes(unittest.TestCase):
+
+    def check_results(self, rows):
+        """Each row should be the payslip amounts for a valid row, and all missing for an invalid one."""
+        for salary, plan, tax_year, valid, row in zip(SALARIES, PLANS, TAX_YEARS, VALID, rows):
+            if valid:
+                payslip = Taxation(tax_year=tax_year or '2016-2017').calculate_payslip(salary, plan)
+                self.assertEqual([getattr(payslip, name) for name in RESULT_COLUMNS], row)
+            else:
+                self.assertEqual([None] * len(RESULT_COLUMNS), row)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test010_calculate_columns(self):
+        """Columns should match calculate_payslip row by row, with NaN for invalid rows."""
+
+        salaries = np.array([np.nan if salary is None else salary for salary in SALARIES])
+        plans = np.array([np.nan if plan is None else plan for plan in PLANS])
+        columns, valid = calculate_columns(salaries, plans, TAX_YEARS)
+        self.assertEqual(VALID, valid.tolist())
+        self.check_results([[None if np.isnan(columns[name][i]) else columns[name][i] for name in RESULT_COLUMNS]
+                            for i in range(len(SALARIES))])
+
+        columns, valid = calculate_columns(salaries[:2], 0, '2018-2019', monthly=False)
+        self.assertEqual(Taxation(tax_year='2018-2019').calculate_paye(52000.5, False), columns['paye'][1])
+
+    @unittest.skipIf(pd is None, 'pandas is not installed')
+    def test020_calculate_dataframe(self):
+        """A DataFrame should get nullable Float64 columns, with <NA> for invalid rows."""
+
+        frame = pd.DataFrame({'salary': SALARIES, 'plan': PLANS, 'tax_year': TAX_YEARS}, index=range(10, 18))
+        results = calculate_dataframe(frame)
+        self.assertEqual(list(RESULT_COLUMNS), list(results.columns))
+        self.assertEqual(list(frame.index), list(results.index))
+        self.assertTrue(all(dtype == 'Float64' for dtype in results.dtypes))
+        self.check_results([[None if value is pd.NA else value for value in row]
+                            for row in results.itertuples(index=False)])
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test030_calculate_arrow(self):
+        """Arrow arrays should give a table of float64 columns, with nulls for invalid rows."""
+
+        results = calculate_arrow(pa.array(SALARIES), pa.array(PLANS, pa.int64()),
+                                  pa.chunked_array([TAX_YEARS[:4], TAX_YEARS[4:]]))
+        self.assertEqual(list(RESULT_COLUMNS), results.column_names)
+        self.assertEqual(VALID.count(False), results['paye'].null_count)
+        self.check_results([list(row.values()) for row in results.to_pylist()])
+
+        results = calculate_arrow(pa.array(['30000', 'abc', ' 52000.5 ', None, '1e5', '']), tax_years='2018-2019')
+        expected = calculate_columns([30000, np.nan, 52000.5, np.nan, 100000, np.nan], tax_years='2018-2019')[0]
+        self.assertEqual([None if np.isnan(value) else value for value in expected['paye'].tolist()],
+                         results['paye'].to_pylist())
@@ -0,0 +1,57 @@
+# coding=utf-8
+import contextlib
+import io
+import json
+import unittest
+
+import instrumentation
+from taxation import Taxation
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test010_counts_and_bands(self):
+        """Calls, histograms and band hits should be recorded per tax year and method while enabled."""
+
+        original = Taxation.calculate_paye
+        with instrumentation.instrumented() as metrics:
+            self.assertRaises(RuntimeError, instrumentation.enable)
+            my_tax = Taxation(tax_year='2018-2019')
+            for salary in (5000, 30000, 60000, 110000, 200000):
+                my_tax.calculate_paye(salary)
+                my_tax.calculate_employee_ni(salary, monthly=False)
+                my_tax.calculate_employer_ni(salary)
+                my_tax.calculate_student_loans(salary, plan=2)
+            with contextlib.redirect_stdout(io.StringIO()):
+                my_tax.calculate_paye(-1)
+            Taxation().calculate_payslip(30000, 1)
+        Taxation(tax_year='2018-2019').calculate_paye(30000)  # Not recorded.
+
+        self.assertIs(original, Taxation.calculate_paye)
+        self.assertFalse(instrumentation.is_enabled())
+
+        snapshot = metrics.to_dict()
+        self.assertEqual(['2016-2017', '2018-2019'], sorted(snapshot))
+        paye = snapshot['2018-2019']['calculate_paye']
+        self.assertEqual(6, paye['calls'])
+        self.assertEqual(6, paye['histogram']['+Inf'])
+        self.assertEqual({'personal allowance': 1, 'basic rate': 1, 'higher rate': 1,
+                          'higher rate, allowance taper': 1, 'additional rate': 1, 'error': 1}, paye['bands'])
+        self.assertEqual({'below primary threshold': 1, 'primary threshold to UEL': 1, 'above UEL': 3},
+                         snapshot['2018-2019']['calculate_employee_ni']['bands'])
+        self.assertEqual({'plan 2 below repayment threshold': 1, 'plan 2 above repayment threshold': 4},
+                         snapshot['2018-2019']['calculate_student_loans']['bands'])
+        self.assertEqual(1, snapshot['2016-2017']['calculate_validated_payslip']['calls'])
+        self.assertEqual(1, snapshot['2018-2019']['set_rates_and_values']['calls'])
+        self.assertEqual(snapshot, json.loads(metrics.to_json()))
+
+        prometheus = metrics.to_prometheus()
+        self.assertIn('paye_calls_total{tax_year="2018-2019",method="calculate_paye"} 6\n', prometheus)
+        self.assertIn('paye_call_seconds_bucket{tax_year="2018-2019",method="calculate_paye",le="+Inf"} 6\n',
+                      prometheus)
+        self.assertIn('paye_band_hits_total{tax_year="2018-2019",method="calculate_paye",band="additional rate"} 1\n',
+                      prometheus)
+
+
+if __name__ == '__main__':
+    unittest.main()
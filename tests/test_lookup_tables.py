@@ -0,0 +1,66 @@
+# coding=utf-8
+import os
+import tempfile
+import unittest
+
+from lookup_tables import LookupTable, build_lookup_table, open_lookup_table
+from taxation import Taxation
+
+
+class TestLookupTables(unittest.TestCase):
+
+    def test010_lookups_match_calculations(self):
+        """Every amount looked up should be exactly what the calculators give, for both engines."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            for engine in ('float', 'pence'):
+                path = os.path.join(directory, '{}.lut'.format(engine))
+                self.assertEqual(30001, build_lookup_table(path, '2018-2019', 130000, 100000, engine))
+                table = open_lookup_table(path)
+                self.assertIs(table, open_lookup_table(path))
+
+                calculated = Taxation(tax_year='2018-2019', engine=engine)
+                looked_up = Taxation(tax_year='2018-2019', engine=engine, lookup_table=table)
+                # Below, at both ends of and above the range, through the allowance taper, and with pence.
+                for salary in (99999, 100000, 100001, 100003.0, 111111, 123457, 130000, 130001, 120000.5):
+                    for monthly in (True, False):
+                        self.assertEqual(calculated.calculate_paye(salary, monthly),
+                                         looked_up.calculate_paye(salary, monthly))
+                        self.assertEqual(calculated.calculate_employee_ni(salary, monthly),
+                                         looked_up.calculate_employee_ni(salary, monthly))
+                        self.assertEqual(calculated.calculate_employer_ni(salary, monthly),
+                                         looked_up.calculate_employer_ni(salary, monthly))
+                    for plan in (0, 1, 2):
+                        self.assertEqual(calculated.calculate_student_loans(salary, plan),
+                                         looked_up.calculate_student_loans(salary, plan))
+                        for period in ('monthly', 'annual'):
+                            self.assertEqual(calculated.calculate_payslip(salary, plan, period),
+                                             looked_up.calculate_payslip(salary, plan, period))
+                self.assertEqual(calculated.calculate_paye(111111), table.get(111111, 'paye'))
+                self.assertIsNone(table.get(111111.5, 'paye'))
+                table.close()
+
+    def test020_mismatched_tables_are_refused(self):
+        """A table should only be used for the year, engine and rates it was built from."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paye.lut')
+            build_lookup_table(path, '2017-2018', 1000)
+            table = LookupTable(path)
+            self.assertRaises(ValueError, Taxation, tax_year='2018-2019', lookup_table=table)
+            self.assertRaises(ValueError, Taxation, tax_year='2017-2018', engine='pence', lookup_table=table)
+            table.close()
+
+            with open(path, 'r+b') as f:
+                f.seek(50)  # Inside the rates fingerprint.
+                f.write(b'\xff')
+            self.assertRaises(ValueError, LookupTable, path)
+
+            with open(path, 'wb') as f:
+                f.write(b'employee_id,salary\r\n')
+            self.assertRaises(ValueError, LookupTable, path)
+            self.assertRaises(ValueError, build_lookup_table, path, '1999-2000')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+# coding=utf-8
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from paye_server import PayeServer, load_test
+import taxation
+from taxation import Taxation
+
+
+async def _exchange(server, requests):
+    """Send every request line on one connection, then read one response line per request."""
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    writer.write(b''.join((r if isinstance(r, bytes) else json.dumps(r).encode()) + b'\n' for r in requests))
+    await writer.drain()
+    responses = [json.loads(await reader.readline()) for __ in requests]
+    writer.close()
+    return responses
+
+
+class TestPayeServer(unittest.TestCase):
+
+    def test010_payslips_and_errors(self):
+        """Responses should come back in order, match calculate_payslip and report invalid requests as errors."""
+
+        async def scenario():
+            server = PayeServer(port=0, max_wait_ms=20)
+            await server.start()
+            try:
+                responses = await _exchange(server, [
+                    {'id': 1, 'salary': 50000, 'plan': 1, 'tax_year': '2018-2019'},
+                    {'id': 2, 'salary': -5},
+                    {'id': 3, 'salary': 30000, 'tax_year': '1999-2000'},
+                    {'id': 4, 'salary': 30000, 'period': ['monthly']},
+                    b'not json',
+                    {'id': 6, 'salary': 102500, 'plan': 2, 'period': 'annual'}])
+                responses += await _exchange(server, [{'id': 7, 'op': 'metrics'}])
+                return responses, server.metrics()
+            finally:
+                await server.close()
+
+        responses, metrics = asyncio.run(scenario())
+        self.assertEqual([1, 2, 3, 4, None, 6, 7], [response.get('id') for response in responses])
+        self.assertEqual(Taxation(tax_year='2018-2019').calculate_payslip(50000, 1)._asdict(), responses[0]['payslip'])
+        self.assertEqual(Taxation().calculate_payslip(102500, 2, 'annual')._asdict(), responses[5]['payslip'])
+        self.assertEqual(['salary', 'tax_year', 'period', 'request'],
+                         [response['error']['field'] for response in responses[1:5]])
+        self.assertEqual(5, responses[6]['requests'])  # The line that isn't JSON never reaches the batcher.
+        self.assertEqual(4, metrics['errors'])
+
+    def test020_micro_batches(self):
+        """Concurrent requests from many connections should be calculated together, within the batch size limit."""
+
+        async def scenario():
+            server = PayeServer(port=0, max_batch_size=16, max_wait_ms=200)
+            await server.start()
+            try:
+                await asyncio.gather(*(_exchange(server, [{'salary': 20000 + n}]) for n in range(40)))
+                return server.metrics()
+            finally:
+                await server.close()
+
+        metrics = asyncio.run(scenario())
+        self.assertEqual(40, metrics['requests'])
+        self.assertEqual(3, metrics['batches'])
+
+    def test030_load_test(self):
+        """The load test should answer every request, with small queues and in-flight limits pushing back."""
+
+        metrics = asyncio.run(load_test(5000, connections=8, pipeline=50, max_batch_size=64, max_queue=100,
+                                        max_in_flight=10))
+        self.assertEqual((5000, 0), (metrics['requests'], metrics['errors']))
+        self.assertLessEqual(metrics['latency_ms']['p50'], metrics['latency_ms']['p99'])
+
+    def test040_load_test_shuts_down_cleanly(self):
+        """The command line load test should print its metrics and nothing on stderr, as CI runs it."""
+
+        run = subprocess.run([sys.executable, 'paye_server.py', '--load-test', '20000', '--connections', '20'],
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=120)
+        self.assertEqual('', run.stderr)
+        self.assertEqual(0, run.returncode)
+        self.assertEqual(20000, json.loads(run.stdout)['requests'])
+
+    def test050_close_with_requests_in_flight(self):
+        """Closing the server with requests still unanswered should drop the connections and cancel the requests."""
+
+        async def scenario():
+            server = PayeServer(port=0, max_wait_ms=50)
+            await server.start()
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b''.join(json.dumps({'id': n, 'salary': 20000 + n}).encode() + b'\n' for n in range(500)))
+            await writer.drain()
+            await asyncio.sleep(0.01)
+            await asyncio.wait_for(server.close(), 5)
+            writer.close()
+            return server.connections, server.batcher.queue.qsize()
+
+        self.assertEqual((0, 0), asyncio.run(scenario()))
+
+    def test060_made_up_tax_years(self):
+        """Tax years without rates should be reported as errors, without a calculator or cached rates kept for them."""
+
+        async def scenario():
+            server = PayeServer(port=0, max_wait_ms=20)
+            await server.start()
+            try:
+                responses = await _exchange(server, [{'salary': 30000, 'tax_year': '{}-junk'.format(n)}
+                                                     for n in range(1000)])
+                return responses, set(server.batcher.calculators)
+            finally:
+                await server.close()
+
+        cached = taxation.get_tax_table.cache_info().currsize
+        responses, tax_years = asyncio.run(scenario())
+        self.assertEqual({'tax_year'}, {response['error']['field'] for response in responses})
+        self.assertEqual(set(), tax_years)
+        self.assertEqual(cached, taxation.get_tax_table.cache_info().currsize)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+# coding=utf-8
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import payroll
+from taxation import Taxation
+
+payroll_csv = ('employee_id,salary,plan,tax_year\r\n'
+               'E001,50000,0,2018-2019\r\n'
+               'E002,23000,1,2016-2017\r\n'
+               'E003,102500,2,\r\n')
+
+
+class TestPayroll(unittest.TestCase):
+
+    def test010_calculate_rows(self):
+        """Each row should give the same figures as the Taxation methods."""
+
+        results = list(payroll.calculate_rows(payroll.read_rows(io.StringIO(payroll_csv))))
+        self.assertEqual(['E001', 'E002', 'E003'], [result.employee_id for result in results])
+        self.assertEqual('2016-2017', results[2].tax_year)  # Blank tax year uses the Taxation default.
+
+        tax = Taxation(tax_year='2018-2019')
+        self.assertEqual(tax.calculate_paye(50000), results[0].paye)
+        self.assertEqual(tax.calculate_employee_ni(50000), results[0].employee_ni)
+        self.assertEqual(tax.calculate_employer_ni(50000), results[0].employer_ni)
+        self.assertEqual(3084.68, results[0].net_pay)  # As shown in the README.
+
+    def test020_jsonl_round_trip(self):
+        """JSON-lines input should give the same results as CSV input."""
+
+        rows = list(payroll.read_rows(io.StringIO(payroll_csv)))
+        jsonl = ''.join(json.dumps(row) + '\n' for row in rows)
+        self.assertEqual(list(payroll.calculate_rows(rows)),
+                         list(payroll.calculate_rows(payroll.read_rows(io.StringIO(jsonl), 'jsonl'))))
+
+    def test030_bad_rows(self):
+        """Bad rows should raise ValueError naming the row."""
+
+        for bad_row in ('E004,-1,0,2018-2019', 'E004,twenty grand,0,', 'E004,25000,3,', 'E004,25000,0,1999-2000'):
+            rows = payroll.read_rows(io.StringIO('employee_id,salary,plan,tax_year\n' + bad_row + '\n'))
+            with self.assertRaisesRegex(ValueError, 'Row 1'):
+                list(payroll.calculate_rows(rows))
+
+    def test040_run(self):
+        """run should stream a file to a file and count the rows."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'employees.csv')
+            output_path = os.path.join(directory, 'results.jsonl')
+            with open(input_path, 'w', newline='') as f:
+                f.write(payroll_csv)
+
+            count, __ = payroll.run(input_path, output_path)
+            self.assertEqual(3, count)
+            with open(output_path) as f:
+                self.assertEqual(['E001', 'E002', 'E003'], [json.loads(line)['employee_id'] for line in f])
+
+    def test050_parallel_output_is_identical(self):
+        """A run across worker processes should write exactly the same bytes as a single process run."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'employees.csv')
+            with open(input_path, 'w', newline='') as f:
+                f.write('employee_id,salary,plan,tax_year\r\n')
+                for n in range(500):
+                    f.write('E{:04d},{},{},{}\r\n'.format(n, n * 731.17, n % 3, ('2016-2017', '2018-2019')[n % 2]))
+
+            outputs = []
+            for workers, output_name in ((1, 'single.csv'), (3, 'parallel.csv')):
+                output_path = os.path.join(directory, output_name)
+                worker_stats = {}
+                count, __ = payroll.run(input_path, output_path, workers=workers, chunk_size=37,
+                                        worker_stats=worker_stats)
+                self.assertEqual(500, count)
+                with open(output_path, 'rb') as f:
+                    outputs.append(f.read())
+
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertEqual(500, sum(stats.rows for stats in worker_stats.values()))
+
+    def test060_collect_errors(self):
+        """With an errors list, invalid rows should be reported as RowErrors and the valid rows still calculated."""
+
+        rows = list(payroll.read_rows(io.StringIO(payroll_csv + 'E004,lots,0,\r\n'
+                                                                'E005,25000,3,\r\n'
+                                                                'E006,25000,0,1999-2000\r\n'
+                                                                'E007,-5,0,\r\n'
+                                                                'E008,26000,1,\r\n')))
+        errors = []
+        results = list(payroll.calculate_rows(rows, errors=errors))
+
+        self.assertEqual(['E001', 'E002', 'E003', 'E008'], [result.employee_id for result in results])
+        self.assertEqual(list(payroll.calculate_rows(rows[:3])), results[:3])
+        self.assertEqual([(4, 'salary', 'lots'), (5, 'plan', '3'), (6, 'tax_year', '1999-2000'), (7, 'salary', '-5')],
+                         [(error.row, error.field, error.value) for error in errors])
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'employees.csv')
+            with open(input_path, 'w', newline='') as f:
+                f.write('employee_id,salary,plan,tax_year\r\n')
+                for n in range(200):
+                    f.write('E{:04d},{},{},\r\n'.format(n, n * 731.17 if n % 7 else 'x', n % 3))
+
+            outputs = []
+            for workers in (1, 3):
+                output_path = os.path.join(directory, 'results{}.csv'.format(workers))
+                errors = []
+                count, __ = payroll.run(input_path, output_path, workers=workers, chunk_size=23, errors=errors)
+                with open(output_path, 'rb') as f:
+                    outputs.append((count, errors, f.read()))
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertEqual(list(range(1, 201, 7)), [error.row for error in outputs[0][1]])
+            self.assertEqual(200 - len(outputs[0][1]), outputs[0][0])
+
+    def test070_resume_from_checkpoint(self):
+        """A stopped run should carry on from its last checkpoint and give the same files as one which wasn't."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'employees.csv')
+            with open(input_path, 'w', newline='') as f:
+                f.write('employee_id,salary,plan,tax_year\r\n')
+                for n in range(500):
+                    f.write('"E,{:04d}",{},{},\r\n'.format(n, n * 431.17 if n % 11 else 'x', n % 3))
+            checkpoint_path = os.path.join(directory, 'checkpoint.json')
+            save_checkpoint = payroll.save_checkpoint
+
+            def stop_at_third_checkpoint(path, state):
+                saved.append(state['rows'])
+                if len(saved) == 3:
+                    raise KeyboardInterrupt
+                save_checkpoint(path, state)
+
+            for workers in (1, 2):
+                outputs = []
+                for stop in (False, True):
+                    output_path = os.path.join(directory, 'results{}.csv'.format(stop))
+                    errors_path = os.path.join(directory, 'errors{}.csv'.format(stop))
+                    saved = []
+                    if stop:
+                        payroll.save_checkpoint = stop_at_third_checkpoint
+                        try:
+                            with open(errors_path, 'w', newline='') as f:
+                                with self.assertRaises(KeyboardInterrupt):
+                                    payroll.run(input_path, output_path, workers=workers, chunk_size=40,
+                                                errors=payroll.ErrorWriter(f), checkpoint_path=checkpoint_path,
+                                                checkpoint_every=100)
+                        finally:
+                            payroll.save_checkpoint = save_checkpoint
+                        with open(checkpoint_path) as f:
+                            self.assertEqual(saved[1], json.load(f)['rows'])
+                        self.assertGreater(saved[1], 100)
+                    with open(errors_path, 'a' if stop else 'w', newline='') as f:
+                        count, __ = payroll.run(input_path, output_path, workers=workers, chunk_size=40,
+                                                errors=payroll.ErrorWriter(f, header=not stop),
+                                                checkpoint_path=checkpoint_path, checkpoint_every=100)
+                    self.assertFalse(os.path.exists(checkpoint_path))
+                    with open(output_path, 'rb') as f, open(errors_path, 'rb') as g:
+                        outputs.append((count, f.read(), g.read()))
+                self.assertEqual(outputs[0], outputs[1])
+                self.assertEqual(454, outputs[0][0])
+
+            with open(checkpoint_path, 'w') as f:
+                json.dump({'settings': {}}, f)
+            self.assertRaises(ValueError, payroll.run, input_path, os.path.join(directory, 'results.csv'),
+                              checkpoint_path=checkpoint_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# coding=utf-8
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from payslips import payroll_payslips, render_payslip_files, render_payslips
+from taxation import PAY_FREQUENCIES, Taxation
+
+
+class TestPayslips(unittest.TestCase):
+
+    def test010_render_formats(self):
+        """The text layout should be exactly print_tax_ticket's, and CSV and JSON-lines should hold every field."""
+
+        my_tax = Taxation(tax_year='2018-2019')
+        salaries = [0, 23000, 52000.5, 102500, 250000, -1]
+        plans = [0, 1, 2, 1, 0, 0]
+        payslips = my_tax.calculate_payslips(salaries, plans)
+
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            for salary, plan in zip(salaries[:-1], plans):
+                my_tax.print_tax_ticket(salary, plan)
+        rendered = io.StringIO()
+        stats = render_payslips(payslips, rendered)
+        self.assertEqual(printed.getvalue(), rendered.getvalue())
+        self.assertEqual(5, stats.payslips)
+
+        rendered = io.StringIO()
+        render_payslips(zip('abcdef', payslips), rendered, 'csv')
+        lines = rendered.getvalue().split('\r\n')
+        self.assertEqual('employee_id,tax_year,salary,plan,period,gross_pay,paye,employee_ni,employer_ni,'
+                         'student_loan,net_pay,employer_cost', lines[0])
+        self.assertEqual('b,2018-2019,23000.00,1,monthly,1916.67,185.83,145.76,167.62,35.00,1550.08,2084.29', lines[2])
+        self.assertEqual(7, len(lines))
+
+        rendered = io.StringIO()
+        render_payslips(my_tax.calculate_payslips(salaries, plans, 'annual'), rendered, 'jsonl')
+        records = [json.loads(line) for line in rendered.getvalue().splitlines()]
+        self.assertEqual(my_tax.calculate_payslip(52000.5, 2, 'annual')._asdict(), records[2])
+        self.assertRaises(ValueError, render_payslips, payslips, rendered, 'pdf')
+
+    def test012_render_period_payslips(self):
+        """Payslips for every pay frequency should render as text, lined up as the monthly layout is."""
+
+        my_tax = Taxation(tax_year='2018-2019')
+        rendered = io.StringIO()
+        render_payslips([my_tax.calculate_period_payslip(612.50, 1, 'weekly')], rendered)
+        lines = rendered.getvalue().splitlines()
+        self.assertEqual('Gross Weekly Pay                 : £    612.50', lines[3])
+        self.assertEqual('Student Loans PLAN 1   (weekly)  : £     23.00', lines[5])
+        self.assertEqual('Net Weekly Pay         (weekly)  : £    458.52', lines[9])
+
+        for frequency in PAY_FREQUENCIES:
+            rendered = io.StringIO()
+            render_payslips([my_tax.calculate_period_payslip(1500, 2, frequency)], rendered)
+            lines = rendered.getvalue().splitlines()
+            self.assertEqual({len(lines[1])}, {len(line) for line in lines[1:12]}, frequency)
+
+    def test020_sharded_files(self):
+        """Payroll rows should be rendered shard_size payslips to a file, with a CSV header in each."""
+
+        rows = [{'employee_id': str(n), 'salary': str(20000 + n * 1000), 'plan': '', 'tax_year': '2018-2019'}
+                for n in range(7)]
+        rows.insert(3, {'employee_id': 'bad', 'salary': 'lots'})
+        errors = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'payslips-{shard}.csv')
+            stats = render_payslip_files(payroll_payslips(rows, errors=errors), path, 'csv', shard_size=3)
+            self.assertEqual((7, 3), stats[:2])
+            self.assertEqual(['payslips-0.csv', 'payslips-1.csv', 'payslips-2.csv'], sorted(os.listdir(directory)))
+            with open(path.format(shard=2)) as f:
+                self.assertEqual(['employee_id', '6'], [line.split(',')[0] for line in f.read().splitlines()])
+
+            stats = render_payslip_files(payroll_payslips(rows[:3]), path, 'text', shard_size=3)
+            self.assertEqual((3, 1), stats[:2])
+        self.assertEqual(['salary'], [error.field for error in errors])
+        self.assertRaises(ValueError, list, payroll_payslips(rows))
@@ -0,0 +1,49 @@
+# coding=utf-8
+import unittest
+
+from taxation import Taxation, np
+
+if np is not None:
+    from sweeps import rate_changes, sweep
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestSweeps(unittest.TestCase):
+
+    def test010_sweep_matches_calculators(self):
+        """Each point of a sweep should hold the same amounts as the single salary calculators."""
+
+        results = sweep(0, 200000, 777.77, ['2016-2017', '2018-2019'], plan=1)
+        self.assertEqual(['2016-2017', '2018-2019'], list(results))
+        for tax_year, result in results.items():
+            my_tax = Taxation(tax_year=tax_year)
+            self.assertEqual(258, len(result.salaries))
+            for i in (0, 13, 129, 140, 257):
+                salary = result.salaries[i]
+                tax = (my_tax.calculate_paye(salary, False) + my_tax.calculate_employee_ni(salary, False) +
+                       my_tax.calculate_student_loans(salary, 1, False))
+                self.assertAlmostEqual(tax, result.tax[i], places=6)
+                self.assertAlmostEqual(salary - tax, result.net_pay[i], places=6)
+                if salary:
+                    self.assertAlmostEqual(tax / salary, result.effective_rate[i], places=9)
+        self.assertEqual(0.0, results['2016-2017'].effective_rate[0])
+
+    def test020_rate_changes(self):
+        """Rate changes should come from the bands exactly, whatever the step, and bound the 60% trap."""
+
+        result = sweep(90000, 130000, 1000, ['2016-2017', '2018-2019'])
+        trap = [(change.salary, round(change.rate_above, 4)) for change in result['2016-2017'].rate_changes]
+        self.assertEqual([(100000, 0.62), (122000, 0.42)], trap)
+        self.assertEqual([100000, 123700], [change.salary for change in result['2018-2019'].rate_changes])
+        self.assertEqual({0.42, 0.62}, set(np.round(result['2018-2019'].marginal_rate, 4).tolist()))
+
+        changes = rate_changes(Taxation(tax_year='2018-2019'))
+        self.assertEqual([8424, 11850, 46350, 46351, 100000, 123700, 150000], [change.salary for change in changes])
+        self.assertEqual(0.0, changes[0].rate_below)
+        for before, after in zip(changes, changes[1:]):
+            self.assertEqual(before.rate_above, after.rate_below)
+        self.assertRaises(ValueError, sweep, 100, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,17 @@
 # coding=utf-8
+import contextlib
 import inspect
+import io
+import json
+import os
+import random
+import sys
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
-from taxation import Taxation
+import taxation
+from taxation import CumulativeTaxation, ResultCache, Taxation, calculate_across_years, np, reload_rates
 
 # tax_object_default does not specify a date, so that the function tests the default behaviour for backwards compatibility.
 tax_object_default = Taxation(full_time=True, student_loan_plan=0, hours_per_week=40)
@@ -11,6 +20,27 @@ tax_object_default = Taxation(full_time=True, student_loan_plan=0, hours_per_wee
 tax_object_2017_2018 = Taxation(full_time=True, student_loan_plan=0, hours_per_week=40, tax_year='2017-2018')
 
 
+def step_by_step_paye(tax_table, salary):
+    """Annual PAYE worked out band by band from the top, the way Taxation originally worked it out."""
+    personal_allowance = tax_table['default_personal_allowance']
+    basic_band = tax_table['higher_rate_threshold'] - tax_table['basic_rate_threshold']
+    if salary <= personal_allowance:
+        return 0.0
+    if salary > tax_table['personal_allowance_reduction_point']:
+        reduction = int((salary - tax_table['personal_allowance_reduction_point']) / 2)
+        personal_allowance = max(personal_allowance - reduction, 0)
+    paye = 0
+    if salary > tax_table['additional_rate_threshold']:
+        paye += (salary - tax_table['additional_rate_threshold']) * tax_table['additional_tax_rate']
+        salary = tax_table['additional_rate_threshold']
+    if salary > tax_table['higher_rate_threshold']:
+        paye += (salary - personal_allowance - basic_band) * tax_table['higher_tax_rate']
+        paye += basic_band * tax_table['basic_tax_rate']
+    elif salary > tax_table['basic_rate_threshold']:
+        paye += (salary - personal_allowance) * tax_table['basic_tax_rate']
+    return paye
+
+
 # https://listentotaxman.com/
 # http://tools.hmrc.gov.uk/hmrctaxcalculator/screen/Personal+Tax+Calculator/en-GB/summary?user=guest
 
@@ -167,6 +197,415 @@ class TestCases(unittest.TestCase):
         self.assertEquals(my_tax.tax_table['tax-year'], '2017-2018')
         del my_tax
 
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test090_batch_matches_scalar(self):
+        """The *_batch methods should give exactly the scalar result for every salary."""
+
+        salaries = [gross_salary for gross_salary, __ in self.known_values_monthly] + \
+                   [0, 8060, 8112, 43000, 43000.01, 100001, 100002.50, 121999, 122000, 150000, 150000.01, 23456.78]
+        plans = [n % 3 for n in range(len(salaries))]
+
+        for monthly in (True, False):
+            self.assertEqual(tax_object_default.calculate_paye_batch(salaries, monthly).tolist(),
+                             [tax_object_default.calculate_paye(s, monthly) for s in salaries])
+            self.assertEqual(tax_object_default.calculate_employee_ni_batch(salaries, monthly).tolist(),
+                             [tax_object_default.calculate_employee_ni(s, monthly) for s in salaries])
+            self.assertEqual(tax_object_default.calculate_employer_ni_batch(salaries, monthly).tolist(),
+                             [tax_object_default.calculate_employer_ni(s, monthly) for s in salaries])
+            self.assertEqual(tax_object_default.calculate_student_loans_batch(salaries, plans, monthly).tolist(),
+                             [tax_object_default.calculate_student_loans(s, p, monthly) for s, p in
+                              zip(salaries, plans)])
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test091_batch_scalar_input(self):
+        """A single salary should give a scalar back from the *_batch methods, rounded as the scalar methods round."""
+
+        my_tax = Taxation(tax_year='2018-2019')
+        paye = my_tax.calculate_paye_batch(11850.125, False)  # 0.025 annual PAYE, within a hair of a half penny.
+        self.assertEqual(0, np.ndim(paye))
+        self.assertEqual(my_tax.calculate_paye(11850.125, False), paye)
+        for salary in (11850.125, 8424.5, 30000):
+            for monthly in (True, False):
+                self.assertEqual(my_tax.calculate_paye(salary, monthly), my_tax.calculate_paye_batch(salary, monthly))
+                self.assertEqual(my_tax.calculate_employee_ni(salary, monthly),
+                                 my_tax.calculate_employee_ni_batch(salary, monthly))
+                self.assertEqual(my_tax.calculate_student_loans(salary, 1, monthly),
+                                 my_tax.calculate_student_loans_batch(salary, 1, monthly))
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test092_batch_bad_inputs(self):
+        """The *_batch methods should reject bad salaries and plans."""
+
+        self.assertRaises(ValueError, tax_object_default.calculate_paye_batch, [25000, -1])
+        self.assertRaises(ValueError, tax_object_default.calculate_employee_ni_batch, [float('nan')])
+        self.assertRaises(ValueError, tax_object_default.calculate_student_loans_batch, [25000, 30000], [1, 4])
+
+    def test100_compiled_schedule(self):
+        """The compiled schedule should find the right band and taper the personal allowance above £100,000."""
+
+        paye = tax_object_default.schedule.paye
+        self.assertEqual('personal allowance', paye.labels[paye.band(11000)])
+        self.assertEqual('basic rate', paye.labels[paye.band(11000.01)])
+        self.assertEqual('higher rate', paye.labels[paye.band(43000.01)])
+        self.assertEqual('additional rate', paye.labels[paye.band(150000.01)])
+        self.assertEqual(6400, paye(43000))
+        self.assertEqual(35200, round(paye(110000), 2))  # £5,000 of allowance lost, taxed at 40%
+        self.assertEqual(1, int(tax_object_default.schedule.student_loans[1](17507)))
+
+        self.assertIs(tax_object_default.schedule, Taxation().schedule)  # Compiled once per tax year.
+
+    # Tax year, salary, monthly, PAYE, as the original step by step calculation gives it, in the allowance taper and
+    # above it, where adding up the bands in any other order rounds some salaries a penny differently.
+    step_by_step_paye = (
+        ('2016-2017', 110417.85, True, 2954.2),
+        ('2016-2017', 110262.05, True, 2946.43),
+        ('2016-2017', 139785.55, True, 4126.19),
+        ('2017-2018', 150018, True, 4442.33),
+        ('2017-2018', 119768.15, True, 3380.06),
+        ('2017-2018', 109874.15, True, 2885.35),
+        ('2017-2018', 152703.3, False, 54516.29),
+        ('2017-2018', 195694.5, False, 73862.32),
+        ('2018-2019', 117078.25, True, 3217.22),
+        ('2018-2019', 110848.25, True, 2905.72),
+        ('2018-2019', 152154.9, False, 54069.51),
+        ('2018-2019', 172968.3, False, 63435.54),
+    )
+
+    def test102_paye_rounds_as_step_by_step(self):
+        """PAYE should round exactly as the original step by step calculation, one salary at a time or in a batch."""
+
+        for tax_year, salary, monthly, paye in self.step_by_step_paye:
+            my_tax = Taxation(tax_year=tax_year)
+            self.assertEqual(paye, my_tax.calculate_paye(salary, monthly), (tax_year, salary))
+            if np is not None:
+                self.assertEqual(paye, my_tax.calculate_paye_batch([salary], monthly)[0], (tax_year, salary))
+
+        random.seed(102)
+        for tax_year in taxation.available_tax_years():
+            my_tax = Taxation(tax_year=tax_year)
+            for salary in [round(random.uniform(99000, 160000), 2) for __ in range(2000)]:
+                paye = step_by_step_paye(my_tax.tax_table, salary)
+                self.assertEqual(round(paye / 12, 2), my_tax.calculate_paye(salary), (tax_year, salary))
+                self.assertEqual(round(paye, 2), my_tax.calculate_paye(salary, False), (tax_year, salary))
+
+    def test110_shared_rate_tables(self):
+        """Instances for the same tax year should share one read only rate table and carry no instance dictionary."""
+
+        my_tax = Taxation(full_time=True, student_loan_plan=0, hours_per_week=40, tax_year='2017-2018')
+        self.assertIs(my_tax.tax_table, tax_object_2017_2018.tax_table)
+        self.assertFalse(hasattr(my_tax, '__dict__'))
+        with self.assertRaises(TypeError):
+            my_tax.tax_table['basic_tax_rate'] = 0.1
+
+    def test120_calculate_payslip(self):
+        """calculate_payslip should give the same amounts as the separate calculate_* methods."""
+
+        for gross_salary, __ in self.known_values_monthly:
+            for plan in (0, 1, 2):
+                for period, monthly in (('monthly', True), ('annual', False)):
+                    payslip = tax_object_2017_2018.calculate_payslip(gross_salary, plan, period)
+                    self.assertEqual(tax_object_2017_2018.calculate_paye(gross_salary, monthly), payslip.paye)
+                    self.assertEqual(tax_object_2017_2018.calculate_employee_ni(gross_salary, monthly),
+                                     payslip.employee_ni)
+                    self.assertEqual(tax_object_2017_2018.calculate_employer_ni(gross_salary, monthly),
+                                     payslip.employer_ni)
+                    self.assertEqual(tax_object_2017_2018.calculate_student_loans(gross_salary, plan, monthly),
+                                     payslip.student_loan)
+
+        payslip = Taxation(tax_year='2018-2019').calculate_payslip(50000, 0)
+        self.assertEqual((4166.67, 3084.68, 4644.79), (payslip.gross_pay, payslip.net_pay, payslip.employer_cost))
+
+        self.assertFalse(tax_object_default.calculate_payslip(-25000, 0))
+        self.assertFalse(tax_object_default.calculate_payslip(25000, 4))
+        self.assertFalse(tax_object_default.calculate_payslip(25000, 0, 'daily'))
+
+    def test122_calculate_payslips(self):
+        """calculate_payslips should report invalid inputs as RowErrors and calculate the rest as usual."""
+
+        salaries = [25000, -1, 'abc', float('nan'), 50000, 30000]
+        plans = [1, 0, 0, 0, 4, 2]
+        errors = []
+        payslips = tax_object_2017_2018.calculate_payslips(salaries, plans, errors=errors)
+
+        self.assertEqual([(1, 'salary', 'is less than zero'), (2, 'salary', 'is not a number'),
+                          (3, 'salary', 'is not a finite number'), (4, 'plan', 'is not 0, 1 or 2')],
+                         [(error.row, error.field, error.reason) for error in errors])
+        self.assertEqual([True, False, False, False, False, True], [payslip is not None for payslip in payslips])
+        self.assertEqual(tax_object_2017_2018.calculate_payslip(25000, 1), payslips[0])
+        self.assertEqual(tax_object_2017_2018.calculate_payslip(30000, 2), payslips[5])
+        self.assertEqual(0, tax_object_2017_2018.validate_payslip_inputs([1000, 2000], 1)[0][0][0])
+        self.assertRaises(ValueError, tax_object_2017_2018.calculate_payslips, [25000], 0, 'daily')
+
+    def test130_result_cache(self):
+        """A shared result cache should return the calculated results, count hits and evict the oldest results."""
+
+        cache = ResultCache(maxsize=2)
+        first = Taxation(tax_year='2018-2019', result_cache=cache)
+        second = Taxation(tax_year='2018-2019', result_cache=cache)
+
+        self.assertEqual(first.calculate_paye(50000), second.calculate_paye(50000))
+        self.assertEqual(Taxation(tax_year='2018-2019').calculate_paye(50000), second.calculate_paye(50000))
+        self.assertEqual((2, 1, 0, 1, 2), cache.stats())
+
+        first.calculate_employee_ni(50000)
+        first.calculate_employer_ni(50000)
+        self.assertEqual((2, 3, 1, 2, 2), cache.stats())
+
+        self.assertFalse(first.calculate_paye(-1))  # Errors are not cached.
+        self.assertEqual(2, cache.stats().size)
+
+        # Results cached for one compilation of the rates are never used after the rates are reloaded.
+        reload_rates()
+        third = Taxation(tax_year='2018-2019', result_cache=cache)
+        self.assertIsNot(third.schedule, first.schedule)
+        third.calculate_employer_ni(50000)
+        self.assertEqual(5, cache.stats().misses)
+
+        self.assertIsNone(Taxation(tax_year='2018-2019').result_cache)
+
+    def test140_calculate_gross_salary(self):
+        """calculate_gross_salary should give a salary whose net pay reaches the target, but only just."""
+
+        my_tax = Taxation(tax_year='2018-2019')
+        for net_pay in (0, 500, 1250.50, 2000, 3084.68, 4500, 5800, 6250, 7000, 9999.99, 15000):
+            for plan in (0, 1, 2):
+                salary = my_tax.calculate_gross_salary(net_pay, plan)
+                self.assertGreaterEqual(my_tax.calculate_payslip(salary, plan).net_pay, net_pay)
+                if net_pay:
+                    self.assertLess(my_tax.calculate_payslip(salary - 10, plan).net_pay, net_pay)
+
+        self.assertEqual(50000, my_tax.calculate_gross_salary(37016.08, 0, 'annual'))
+        self.assertFalse(my_tax.calculate_gross_salary(-100))
+        self.assertFalse(my_tax.calculate_gross_salary(100, 3))
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test142_calculate_gross_salary_batch(self):
+        """calculate_gross_salary_batch should match calculate_gross_salary."""
+
+        net_pays = [0, 500, 1250.50, 2000, 3084.68, 4500, 5800, 6250, 7000, 9999.99, 15000]
+        plans = [n % 3 for n in range(len(net_pays))]
+        for period in ('monthly', 'annual'):
+            self.assertEqual(tax_object_2017_2018.calculate_gross_salary_batch(net_pays, plans, period).tolist(),
+                             [tax_object_2017_2018.calculate_gross_salary(n, p, period) for n, p in
+                              zip(net_pays, plans)])
+
+    def test150_cumulative_paye(self):
+        """Cumulative PAYE should add up to the annual PAYE and carry on exactly from a saved state."""
+
+        employee = CumulativeTaxation('2018-2019', plan=1)
+        for __ in range(12):
+            employee.calculate_period(4000)
+        self.assertEqual(Taxation(tax_year='2018-2019').calculate_paye(48000, False), employee.state.paye)
+        self.assertEqual(48000, employee.state.pay)
+
+        monthly_pay = (3000, 3000, 8000, 3000, 0, 3000, 3000, 9000, 3000, 3000, 3000, 3000)
+        employee = CumulativeTaxation('2018-2019', plan=2)
+        straight_through = [employee.calculate_period(pay) for pay in monthly_pay]
+        self.assertLess(straight_through[4].paye, 0)  # A month without pay gives a refund.
+
+        employee = CumulativeTaxation('2018-2019', plan=2)
+        resumed = [employee.calculate_period(pay) for pay in monthly_pay[:6]]
+        snapshot = json.loads(json.dumps(employee.to_dict()))
+        employee = CumulativeTaxation.from_dict(snapshot)
+        resumed += [employee.calculate_period(pay) for pay in monthly_pay[6:]]
+        self.assertEqual(straight_through, resumed)
+
+        self.assertRaises(ValueError, employee.calculate_period, 3000)  # All 12 months have been processed.
+        self.assertRaises(ValueError, CumulativeTaxation('2018-2019').calculate_period, -1)
+        self.assertRaises(ValueError, CumulativeTaxation, 'wrong date')
+
+    def test160_pence_engine(self):
+        """The integer pence engine should round down PAYE, round NI half pennies down and stay within a penny."""
+
+        my_tax = Taxation(tax_year='2016-2017', engine='pence')
+        for gross_salary, result in self.known_values_monthly:
+            self.assertIn(round(result - my_tax.calculate_paye(gross_salary, True), 2), (0, 0.01))
+        for gross_salary, result, result_plan_2, __ in self.known_values_annual:
+            self.assertEqual(result, my_tax.calculate_paye(gross_salary, False))
+            self.assertEqual(result_plan_2, my_tax.calculate_student_loans(gross_salary, 2, False))
+
+        self.assertEqual(2577.93, my_tax.calculate_paye(102892.05))  # 2,577.9375 rounded down.
+        self.assertEqual(8.44, my_tax.calculate_employee_ni(8130.35, False))  # 8.442 rounded to the nearest penny.
+        self.assertEqual(0.06, my_tax.calculate_employee_ni(8060.50, False))  # 0.06 exactly.
+        self.assertEqual(0.69, my_tax.calculate_employer_ni(8117, False))  # 0.69 exactly.
+        self.assertEqual(0.34, my_tax.calculate_employer_ni(8114.50, False))  # 0.345 exactly, rounded down.
+        self.assertEqual(0.35, my_tax.calculate_employer_ni(8114.51, False))  # 0.34538 rounded up.
+        self.assertEqual(0.41, my_tax.calculate_student_loans(17551, 1))  # £5 a year, £0.4166 a month rounded down.
+        self.assertEqual(0.42, Taxation(tax_year='2016-2017').calculate_student_loans(17551, 1))  # To the nearest.
+        self.assertRaises(ValueError, Taxation, tax_year='2016-2017', engine='decimal')
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test162_pence_engine_batches(self):
+        """With the pence engine, the *_batch methods should give exactly the pence engine's scalar results."""
+
+        rng = random.Random(162)
+        salaries = [round(rng.uniform(0, 300000), 2) for __ in range(2000)] + [0, 8060.50, 8114.50, 102892.05, 150018]
+        plans = [rng.choice((0, 1, 2)) for __ in salaries]
+        for tax_year in ('2016-2017', '2017-2018', '2018-2019'):
+            my_tax = Taxation(tax_year=tax_year, engine='pence')
+            for monthly in (True, False):
+                self.assertEqual(my_tax.calculate_paye_batch(salaries, monthly).tolist(),
+                                 [my_tax.calculate_paye(s, monthly) for s in salaries])
+                self.assertEqual(my_tax.calculate_employee_ni_batch(salaries, monthly).tolist(),
+                                 [my_tax.calculate_employee_ni(s, monthly) for s in salaries])
+                self.assertEqual(my_tax.calculate_employer_ni_batch(salaries, monthly).tolist(),
+                                 [my_tax.calculate_employer_ni(s, monthly) for s in salaries])
+                self.assertEqual(my_tax.calculate_student_loans_batch(salaries, plans, monthly).tolist(),
+                                 [my_tax.calculate_student_loans(s, p, monthly) for s, p in zip(salaries, plans)])
+
+            net_pays = [round(rng.uniform(0, 12000), 2) for __ in range(300)]
+            for period in ('monthly', 'annual'):
+                self.assertEqual(my_tax.calculate_gross_salary_batch(net_pays, 0, period).tolist(),
+                                 [my_tax.calculate_gross_salary(n, 0, period) for n in net_pays])
+
+        my_tax = Taxation(tax_year='2018-2019', engine='pence')
+        self.assertEqual([my_tax.calculate_paye(3e13, False)], my_tax.calculate_paye_batch([3e13], False).tolist())
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(my_tax.calculate_period_payslip(500, 0, 'weekly'))
+        self.assertRaises(ValueError, my_tax.calculate_period_batch, [500], 0, 'weekly')
+
+    def test170_shared_between_threads(self):
+        """One instance shared by many threads should give exactly the results it gives in one thread."""
+
+        rng = random.Random(170)
+        inputs = [(round(rng.uniform(0, 200000), 2), rng.choice((0, 1, 2))) for __ in range(2000)]
+        inputs += [(-25000, 0), ('abc', 1), (25000, 4)] * 50  # Errors must not leak into other threads' results.
+        rng.shuffle(inputs)
+
+        def calculate_all(tax, chunk):
+            return [(tax.calculate_paye(salary), tax.calculate_employee_ni(salary, False),
+                     tax.calculate_employer_ni(salary), tax.calculate_student_loans(salary, plan),
+                     tax.calculate_payslip(salary, plan)) for salary, plan in chunk]
+
+        chunks = [inputs[i:i + 25] for i in range(0, len(inputs), 25)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Switch threads as often as possible.
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for kwargs in ({}, {'engine': 'pence'}, {'result_cache': ResultCache(500)}):
+                    tax = Taxation(tax_year='2018-2019', **kwargs)
+                    expected = [calculate_all(Taxation(tax_year='2018-2019', **kwargs), chunk) for chunk in chunks]
+                    with ThreadPoolExecutor(max_workers=16) as executor:
+                        for __ in range(3):
+                            self.assertEqual(expected, list(executor.map(calculate_all, [tax] * len(chunks), chunks)))
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertFalse(hasattr(tax, '__dict__'))
+
+    def test180_rate_files(self):
+        """Tax years should be read from rate files when first asked for, and read again only when they change."""
+
+        my_tax = Taxation(tax_year='2019-2020')  # Shipped in tax_years.
+        self.assertEqual((12500, 625.0, 32.0), (my_tax.tax_table['default_personal_allowance'],
+                                                my_tax.calculate_paye(50000), my_tax.calculate_student_loans(30000, 2)))
+
+        rates = dict(my_tax.tax_table, **{'tax-year': '2030-2031'})
+        default_directory = taxation.rate_data_directory
+        with tempfile.TemporaryDirectory() as directory:
+            try:
+                taxation.set_rate_data_directory(directory)
+                path = os.path.join(directory, '2030-2031.json')
+                with open(path, 'w') as f:
+                    json.dump(rates, f)
+                with open(os.path.join(directory, '2031-2032.toml'), 'w') as f:
+                    f.write('"tax-year" = "2031-2032"\n')
+                    f.write(''.join('{} = {}\n'.format(k, v) for k, v in rates.items()
+                                    if k not in ('tax-year', 'source')))
+
+                self.assertEqual(('2016-2017', '2017-2018', '2018-2019', '2030-2031', '2031-2032'),
+                                 taxation.available_tax_years())
+                self.assertFalse(os.path.exists(os.path.join(directory, '__pycache__')))  # Nothing read yet.
+                self.assertEqual(625.0, Taxation(tax_year='2030-2031').calculate_paye(50000))
+                self.assertEqual(625.0, Taxation(tax_year='2031-2032').calculate_paye(50000))
+                self.assertTrue(os.path.exists(os.path.join(directory, '__pycache__', '2030-2031.json.marshal')))
+                self.assertFalse(Taxation(tax_year='2032-2033').tax_table)
+
+                reload_rates()  # Read back from the compiled form.
+                self.assertEqual(625.0, Taxation(tax_year='2030-2031').calculate_paye(50000))
+
+                rates['basic_tax_rate'] = 0.25
+                with open(path, 'w') as f:
+                    json.dump(rates, f)
+                os.utime(path, ns=(0, 0))
+                reload_rates()
+                self.assertEqual(781.25, Taxation(tax_year='2030-2031').calculate_paye(50000))
+
+                del rates['basic_tax_rate']
+                with open(path, 'w') as f:
+                    json.dump(rates, f)
+                reload_rates()
+                self.assertRaises(ValueError, Taxation, tax_year='2030-2031')
+            finally:
+                taxation.set_rate_data_directory(default_directory)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test190_calculate_across_years(self):
+        """A salary x year matrix should hold exactly what each year's own calculators give."""
+
+        salaries = [0, 8424, 11850.01, 25000, 46351, 100001, 110417.85, 119768.15, 122000, 123699.99, 150000.5, 150018,
+                    152154.9, 250000]
+        plans = [n % 3 for n in range(len(salaries))]
+        for monthly in (True, False):
+            matrix = calculate_across_years(salaries, ['2018-2019', '2016-2017', '2017-2018'], plans, monthly)
+            self.assertEqual((len(salaries), 3), matrix.paye.shape)
+            for j, tax_year in enumerate(matrix.tax_years):
+                my_tax = Taxation(tax_year=tax_year)
+                for i, (salary, plan) in enumerate(zip(salaries, plans)):
+                    self.assertEqual(my_tax.calculate_paye(salary, monthly), matrix.paye[i, j])
+                    self.assertEqual(my_tax.calculate_employee_ni(salary, monthly), matrix.employee_ni[i, j])
+                    self.assertEqual(my_tax.calculate_employer_ni(salary, monthly), matrix.employer_ni[i, j])
+                    self.assertEqual(my_tax.calculate_student_loans(salary, plan, monthly), matrix.student_loan[i, j])
+
+        self.assertEqual(taxation.available_tax_years(), calculate_across_years(50000).tax_years)
+        self.assertRaises(ValueError, calculate_across_years, 50000, ['1999-2000'])
+        self.assertRaises(ValueError, calculate_across_years, [50000, 60000], None, [0, 3])
+
+    def test200_pay_frequencies(self):
+        """Period pay should be worked out against HMRC's published per period thresholds."""
+
+        schedule = taxation.get_period_schedule('2018-2019', 'weekly')
+        self.assertIs(schedule, taxation.get_period_schedule('2018-2019', 'weekly'))
+        self.assertEqual((0.0, 162, 892), schedule.employee_ni.breakpoints)
+        self.assertEqual((0.0, 648, 3568),
+                         taxation.get_period_schedule('2018-2019', 'four_weekly').employer_ni.breakpoints)
+        self.assertEqual((0.0, 702, 3863), taxation.get_period_schedule('2018-2019', 'monthly').employee_ni.breakpoints)
+        self.assertEqual(352.5, schedule.student_loans[1].breakpoints[1])
+        self.assertEqual(480.76, schedule.student_loans[2].breakpoints[1])
+        self.assertRaises(ValueError, taxation.get_period_schedule, '2018-2019', 'daily')
+
+        my_tax = Taxation(tax_year='2018-2019', hours_per_week=37.5)
+        payslip = my_tax.calculate_period_payslip(500, 1)
+        self.assertEqual(('weekly', 26000, 500), (payslip.period, payslip.salary, payslip.gross_pay))
+        self.assertEqual((54.42, 40.56, 46.64, 13.0, 392.02), payslip[5:10])
+        # Student Loan repayments are rounded down to the pound each period, not a twelfth of the annual amount.
+        self.assertEqual(82.0, my_tax.calculate_period_payslip(3000, 2, 'monthly').student_loan)
+        self.assertEqual(82.5, my_tax.calculate_payslip(36000, 2).student_loan)
+        self.assertEqual(my_tax.calculate_payslip(36000, 2, 'annual'),
+                         my_tax.calculate_period_payslip(36000, 2, 'annual'))
+        self.assertEqual(my_tax.calculate_period_payslip(750, 0, 'fortnightly'),
+                         my_tax.calculate_hourly_payslip(10, 0, 'fortnightly'))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(my_tax.calculate_period_payslip(-1))
+            self.assertFalse(my_tax.calculate_period_payslip(500, 0, 'daily'))
+            self.assertFalse(my_tax.calculate_period_payslip(500, 3))
+            self.assertFalse(my_tax.calculate_hourly_payslip('ten'))
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test210_period_batch(self):
+        """A batch of period pay should match calculate_period_payslip element for element."""
+
+        my_tax = Taxation(tax_year='2019-2020')
+        pays = [0, 100, 166, 166.01, 364.13, 364.14, 494.71, 962, 1000, 2500.55, 5000]
+        plans = [n % 3 for n in range(len(pays))]
+        for frequency in taxation.PAY_FREQUENCIES:
+            batch = my_tax.calculate_period_batch(pays, plans, frequency)
+            for i, (pay, plan) in enumerate(zip(pays, plans)):
+                payslip = my_tax.calculate_period_payslip(pay, plan, frequency)
+                self.assertEqual(payslip[4:], (batch.pay[i], batch.paye[i], batch.employee_ni[i], batch.employer_ni[i],
+                                               batch.student_loan[i], batch.net_pay[i], batch.employer_cost[i]))
+        self.assertRaises(ValueError, my_tax.calculate_period_batch, pays, 3)
+
 
 if __name__ == '__main__':
     unittest.main()